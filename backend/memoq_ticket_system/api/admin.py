@@ -1,10 +1,11 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from mptt.admin import DraggableMPTTAdmin # For TicketType
+from memoq_ticket_system.outbox import schedule_replay
 
 from memoq_ticket_system.models import (
     User, Company, Ticket, TicketReply, CompanyConfig, Attachment,
-    CustomerTypeTag, NotificationConfig, NotificationLog,
+    CustomerTypeTag, NotificationConfig, NotificationLog, NotificationOutbox,
     TicketStatusHistory, TicketType, TicketLabel, TicketTransferHistory,
     CompanySSOProvider, NotificationTemplate, TicketSatisfactionRating # New models
 )
@@ -37,6 +38,19 @@ class UserAdmin(BaseUserAdmin):
     restore_selected.short_description = "恢复选中的用户"
 
 
+class NotificationLogAdmin(admin.ModelAdmin):
+    list_display = ("id", "notification_type", "recipient_info", "status", "retry_attempts", "last_attempt_at", "next_attempt_at")
+    list_filter = ("status", "notification_type", "last_attempt_at")
+    search_fields = ("recipient_info", "content_summary", "ticket__id")
+    actions = ["replay_selected"]
+
+    def replay_selected(self, request, queryset):
+        # Requeued at NOTIFICATION_REPLAY_RATE_PER_MINUTE per channel, not sent in this request
+        count = schedule_replay(queryset)
+        self.message_user(request, f"已将 {count} 条失败的通知重新加入发送队列")
+    replay_selected.short_description = "重新发送选中的失败通知（按限速排队）"
+
+
 class CompanySSOProviderInline(admin.TabularInline): # Or admin.StackedInline
     model = CompanySSOProvider
     extra = 1 # Number of empty forms to display
@@ -83,7 +97,8 @@ admin.site.register(Attachment, admin.ModelAdmin) # Basic
 admin.site.register(CompanyConfig, admin.ModelAdmin) # Basic
 admin.site.register(CustomerTypeTag, admin.ModelAdmin) # Basic
 admin.site.register(NotificationConfig, admin.ModelAdmin) # Basic
-admin.site.register(NotificationLog, admin.ModelAdmin) # Basic
+admin.site.register(NotificationLog, NotificationLogAdmin)
+admin.site.register(NotificationOutbox, admin.ModelAdmin) # Basic
 admin.site.register(TicketStatusHistory, admin.ModelAdmin) # Basic
 admin.site.register(TicketTransferHistory, admin.ModelAdmin) # Basic
 admin.site.register(TicketType, DraggableMPTTAdmin) # Using MPTT admin
@@ -8,6 +8,7 @@ import os
 
 from ..models import Attachment, Ticket, Reply
 from .serializers import AttachmentSerializer
+from ..downloads import download_counts
 from ..file_storage import TencentCOSStorage, SecureFileStorage  # 导入两种存储方式
 
 # 根据配置选择存储后端
@@ -122,8 +123,7 @@ class AttachmentViewSet(viewsets.ModelViewSet):
                 attachment.file_path
             )  # file_path is cos_key
             if file_url:
-                attachment.download_count += 1
-                attachment.save()
+                download_counts.add(attachment.pk)
                 return Response({"download_url": file_url}, status=status.HTTP_200_OK)
             else:
                 raise Http404("File not found or URL generation failed.")
@@ -138,8 +138,7 @@ class AttachmentViewSet(viewsets.ModelViewSet):
                     as_attachment=True,
                     filename=attachment.original_name,
                 )
-                attachment.download_count += 1
-                attachment.save()
+                download_counts.add(attachment.pk)
                 return response
             except FileNotFoundError:
                 raise Http404("File not found on local storage.")
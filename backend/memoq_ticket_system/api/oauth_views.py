@@ -9,6 +9,7 @@ from rest_framework_simplejwt.tokens import RefreshToken
 import requests
 import json
 
+from .. import http_client
 from ..models import User
 
 # Placeholder for actual App IDs, Secrets, and Redirect URIs
@@ -80,7 +81,7 @@ class OAuthCallbackView(APIView):
                 #     'corpid': config['APP_ID'],
                 #     'corpsecret': config['APP_SECRET'],
                 # }
-                # token_res = requests.get(config['TOKEN_URL'], params=token_params)
+                # token_res = http_client.get(config['TOKEN_URL'], params=token_params)
                 # token_res.raise_for_status()
                 # app_access_token = token_res.json().get('access_token')
                 # if not app_access_token:
@@ -121,7 +122,7 @@ class OAuthCallbackView(APIView):
                     "code": code,
                     "grant_type": "authorization_code",
                 }
-                token_res = requests.get(config["TOKEN_URL"], params=token_params)
+                token_res = http_client.get(config["TOKEN_URL"], params=token_params)
                 token_res.raise_for_status()
                 token_data = token_res.json()
                 access_token = token_data.get("access_token")
@@ -140,7 +141,7 @@ class OAuthCallbackView(APIView):
                     "openid": openid,
                     "lang": "zh_CN",
                 }
-                user_info_res = requests.get(
+                user_info_res = http_client.get(
                     config["USER_INFO_URL"], params=user_info_params
                 )
                 user_info_res.raise_for_status()
@@ -158,7 +159,7 @@ class OAuthCallbackView(APIView):
                     "app_id": config["APP_ID"],
                     "app_secret": config["APP_SECRET"],
                 }
-                app_token_res = requests.post(
+                app_token_res = http_client.post(
                     config["APP_ACCESS_TOKEN_URL"], json=app_token_payload
                 )
                 app_token_res.raise_for_status()
@@ -177,7 +178,7 @@ class OAuthCallbackView(APIView):
                     "Authorization": f"Bearer {app_access_token}",
                     "Content-Type": "application/json",
                 }
-                user_token_res = requests.post(
+                user_token_res = http_client.post(
                     config["TOKEN_URL"],
                     headers=user_token_headers,
                     json=user_token_payload,
@@ -194,7 +195,7 @@ class OAuthCallbackView(APIView):
 
                 # 3. Get user info
                 user_info_headers = {"Authorization": f"Bearer {access_token}"}
-                user_info_res = requests.get(
+                user_info_res = http_client.get(
                     config["USER_INFO_URL"], headers=user_info_headers
                 )
                 user_info_res.raise_for_status()
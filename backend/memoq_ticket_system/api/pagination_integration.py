@@ -1,5 +1,14 @@
+import base64
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class CustomPageNumberPagination(PageNumberPagination):
@@ -86,4 +95,137 @@ class CompanyListPagination(CustomPageNumberPagination):
     """
     公司列表分页类
     """
-    page_size = 20  # 默认每页显示20条
\ No newline at end of file
+    page_size = 20  # 默认每页显示20条
+
+class KeysetCursorPagination(CustomPageNumberPagination):
+    """
+    基于 (时间字段, id) 的游标分页（keyset pagination）
+
+    请求中带有 cursor 参数时（首页传空值 ?cursor=）使用 WHERE (时间, id) < (v, id) 翻页，
+    不执行 OFFSET，也不执行 COUNT；否则回退到页码分页，保持原有响应格式。
+    传入 with_count=1 时返回缓存的总记录数。
+    """
+    cursor_query_param = 'cursor'
+    count_query_param = 'with_count'
+    keyset_field = None  # 排序时间字段，由子类指定，按降序排列
+    count_cache_timeout = 60  # 总记录数缓存时间（秒）
+    invalid_cursor_message = '无效的游标'
+
+    def get_keyset_ordering(self):
+        return ('-' + self.keyset_field, '-id')
+
+    def use_keyset(self, queryset, request):
+        """只有请求带 cursor 参数且查询集仍按默认时间字段排序时才使用游标分页"""
+        if self.cursor_query_param not in request.query_params:
+            return False
+        ordering = tuple(queryset.query.order_by)
+        return ordering in (('-' + self.keyset_field,), self.get_keyset_ordering())
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset_mode = self.use_keyset(queryset, request)
+        if not self.keyset_mode:
+            return super().paginate_queryset(queryset, request, view=view)
+
+        self.request = request
+        self.base_queryset = queryset
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        cursor = self.decode_cursor(request)
+        queryset = queryset.order_by(*self.get_keyset_ordering())
+        self.reverse = False
+        if cursor is not None:
+            value, pk, self.reverse = cursor
+            if self.reverse:
+                queryset = queryset.filter(
+                    Q(**{self.keyset_field + '__gt': value}) | Q(**{self.keyset_field: value, 'id__gt': pk})
+                ).order_by(self.keyset_field, 'id')
+            else:
+                queryset = queryset.filter(
+                    Q(**{self.keyset_field + '__lt': value}) | Q(**{self.keyset_field: value, 'id__lt': pk})
+                )
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        self.page_results = results
+        return results
+
+    def get_paginated_response(self, data):
+        if not self.keyset_mode:
+            return super().get_paginated_response(data)
+        response_data = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'page_size': self.page_size,
+            'results': data,
+        }
+        if self.request.query_params.get(self.count_query_param) in ('1', 'true', 'True'):
+            count = self.get_cached_count(self.base_queryset)
+            response_data['count'] = count
+            response_data['total_pages'] = -(-count // self.page_size)
+        return Response(response_data)
+
+    def get_next_link(self):
+        if not self.keyset_mode:
+            return super().get_next_link()
+        if not self.has_next or not self.page_results:
+            return None
+        return self.build_cursor_link(self.page_results[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.keyset_mode:
+            return super().get_previous_link()
+        if not self.has_previous or not self.page_results:
+            return None
+        return self.build_cursor_link(self.page_results[0], reverse=True)
+
+    def build_cursor_link(self, obj, reverse):
+        value = getattr(obj, self.keyset_field)
+        payload = {'v': value.isoformat(), 'id': obj.pk, 'r': int(reverse)}
+        token = base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+            value = parse_datetime(payload['v'])
+            pk = int(payload['id'])
+            reverse = bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if value is None:
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk, reverse
+
+    def get_cached_count(self, queryset):
+        """总记录数按查询语句缓存，避免每次翻页都执行 COUNT"""
+        sql_hash = hashlib.md5(str(queryset.query).encode()).hexdigest()
+        cache_key = f'pagination_count:{queryset.model._meta.label_lower}:{sql_hash}'
+        return cache.get_or_set(cache_key, queryset.count, self.count_cache_timeout)
+
+
+class TicketCursorPagination(KeysetCursorPagination):
+    """
+    工单列表游标分页类，按 (last_activity_at, id) 降序
+    """
+    page_size = 20  # 默认每页显示20条
+    keyset_field = 'last_activity_at'
+
+
+class NotificationLogCursorPagination(KeysetCursorPagination):
+    """
+    通知记录游标分页类，按 (created_at, id) 降序
+    """
+    page_size = 20  # 默认每页显示20条
+    keyset_field = 'created_at'
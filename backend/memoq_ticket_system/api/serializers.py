@@ -7,8 +7,10 @@ from memoq_ticket_system.models import (
     Company, CompanyConfig, Ticket, TicketReply, TicketStatusHistory,
     NotificationConfig, NotificationLog, Attachment, CustomerTypeTag,
     TicketType, TicketLabel, TicketTransferHistory,
-    CompanySSOProvider, NotificationTemplate, TicketSatisfactionRating # New models
+    CompanySSOProvider, NotificationTemplate, TicketSatisfactionRating, # New models
+    AttachmentUploadSession
 )
+from memoq_ticket_system.uploads import blob_reference, start_session, validate_upload
 
 User = get_user_model()
 
@@ -147,8 +149,8 @@ class AttachmentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Attachment
         fields = ["id", "file_name", "file", "file_url", "file_size", "file_type",
-                  "ticket", "reply", "uploaded_by", "uploaded_by_username", "created_at"]
-        read_only_fields = ["file_size", "file_type", "created_at", "file_url", "uploaded_by_username"]
+                  "ticket", "reply", "uploaded_by", "uploaded_by_username", "download_count", "created_at"]
+        read_only_fields = ["file_size", "file_type", "download_count", "created_at", "file_url", "uploaded_by_username"]
         extra_kwargs = {"file": {"write_only": True}}
 
     def create(self, validated_data):
@@ -158,9 +160,35 @@ class AttachmentSerializer(serializers.ModelSerializer):
             validated_data["file_type"] = file_obj.content_type
             if not validated_data.get("file_name"):
                 validated_data["file_name"] = file_obj.name
+            # Same content as an existing attachment: share its stored object
+            with blob_reference(file_obj) as blob:
+                validated_data["blob"] = blob
+                validated_data["file"] = blob.path
+                return super().create(validated_data)
         return super().create(validated_data)
 
 
+class AttachmentUploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AttachmentUploadSession
+        fields = ["id", "file_name", "file_type", "file_size", "chunk_size", "received", "status",
+                  "ticket", "reply", "attachment", "created_at", "updated_at"]
+        read_only_fields = ["chunk_size", "received", "status", "attachment", "created_at", "updated_at"]
+        extra_kwargs = {"file_type": {"required": False}}
+
+    def validate(self, attrs):
+        error = validate_upload(attrs["file_name"], attrs["file_size"])
+        if error:
+            raise serializers.ValidationError(error)
+        reply = attrs.get("reply")
+        if reply and attrs.get("ticket") and reply.ticket_id != attrs["ticket"].id:
+            raise serializers.ValidationError("回复不属于该工单。")
+        return attrs
+
+    def create(self, validated_data):
+        return start_session(**validated_data)
+
+
 class TicketReplySerializer(serializers.ModelSerializer):
     attachments_data = AttachmentSerializer(source="attachments", many=True, read_only=True)
     user_info = UserSerializer(source="user", read_only=True)
@@ -234,7 +262,26 @@ class TicketSatisfactionRatingSerializer(serializers.ModelSerializer):
             "rated_by": {"required": False} # Should be set to request.user if customer
         }
 
-class TicketSerializer(serializers.ModelSerializer):
+class TicketSLAStatusMixin:
+    """
+    Shared SLA helpers for the ticket detail and list serializers.
+    """
+    def _get_time_remaining(self, deadline):
+        if deadline:
+            now = timezone.now()
+            if deadline > now:
+                return (deadline - now).total_seconds()
+            return - (now - deadline).total_seconds() # Negative for overdue
+        return None
+
+    def get_sla_ir_time_remaining(self, obj):
+        return self._get_time_remaining(obj.sla_ir_deadline)
+
+    def get_sla_resolution_time_remaining(self, obj):
+        return self._get_time_remaining(obj.sla_resolution_deadline)
+
+
+class TicketSerializer(TicketSLAStatusMixin, serializers.ModelSerializer):
     company_details = CompanySerializer(source="company", read_only=True)
     created_by_details = UserSerializer(source="created_by", read_only=True)
     submitted_by_details = UserSerializer(source="submitted_by", read_only=True)
@@ -263,8 +310,6 @@ class TicketSerializer(serializers.ModelSerializer):
     # Time remaining for SLA (calculated in to_representation)
     sla_ir_time_remaining = serializers.SerializerMethodField()
     sla_resolution_time_remaining = serializers.SerializerMethodField()
-    is_ir_sla_missed = serializers.SerializerMethodField()
-    is_resolution_sla_missed = serializers.SerializerMethodField()
 
 
     class Meta:
@@ -293,7 +338,7 @@ class TicketSerializer(serializers.ModelSerializer):
             "sla_ir_deadline", "sla_resolution_deadline", # Raw deadlines
             "sla_ir_deadline_display", "sla_resolution_deadline_display", # Formatted
             "sla_ir_time_remaining", "sla_resolution_time_remaining",
-            "is_ir_sla_missed", "is_resolution_sla_missed"
+            "is_ir_sla_missed", "is_resolution_sla_missed", "is_idle", "idle_deadline" # Maintained by Ticket.save / sweep_sla_state
 
         ]
         read_only_fields = [
@@ -308,7 +353,7 @@ class TicketSerializer(serializers.ModelSerializer):
             "sla_ir_deadline", "sla_resolution_deadline", # These are set by model logic
             "sla_ir_deadline_display", "sla_resolution_deadline_display",
             "sla_ir_time_remaining", "sla_resolution_time_remaining",
-            "is_ir_sla_missed", "is_resolution_sla_missed"
+            "is_ir_sla_missed", "is_resolution_sla_missed", "is_idle", "idle_deadline"
         ]
         extra_kwargs = {
             "company": {"write_only": True, "required": True},
@@ -321,35 +366,6 @@ class TicketSerializer(serializers.ModelSerializer):
             "ticket_url_slug": {"required": False, "allow_blank": True},
         }
 
-    def _get_time_remaining(self, deadline):
-        if deadline:
-            now = timezone.now()
-            if deadline > now:
-                return (deadline - now).total_seconds()
-            return - (now - deadline).total_seconds() # Negative for overdue
-        return None
-
-    def get_sla_ir_time_remaining(self, obj):
-        return self._get_time_remaining(obj.sla_ir_deadline)
-
-    def get_sla_resolution_time_remaining(self, obj):
-        return self._get_time_remaining(obj.sla_resolution_deadline)
-
-    def get_is_ir_sla_missed(self, obj):
-        if obj.sla_ir_deadline and obj.first_replied_at: # Replied
-            return obj.first_replied_at > obj.sla_ir_deadline
-        elif obj.sla_ir_deadline and not obj.first_replied_at: # Not replied yet
-            return timezone.now() > obj.sla_ir_deadline
-        return False # No deadline or not applicable
-
-    def get_is_resolution_sla_missed(self, obj):
-        if obj.sla_resolution_deadline and obj.resolved_at: # Resolved
-            return obj.resolved_at > obj.sla_resolution_deadline
-        elif obj.sla_resolution_deadline and not obj.resolved_at: # Not resolved yet
-            return timezone.now() > obj.sla_resolution_deadline
-        return False # No deadline or not applicable
-
-
     def validate(self, data):
         ticket_type = data.get('ticket_type')
         if ticket_type and not ticket_type.is_leaf_node():
@@ -357,6 +373,64 @@ class TicketSerializer(serializers.ModelSerializer):
         # ... (slug generation logic if needed, or handle in model.save)
         return data
 
+
+class TicketListLabelSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TicketLabel
+        fields = ["id", "name", "color"]
+
+
+class TicketListSerializer(TicketSLAStatusMixin, serializers.ModelSerializer):
+    """
+    Flat projection used by the ticket list endpoint. Replies, histories,
+    attachments and followers are only returned by the detail endpoint.
+    """
+    company_name = serializers.CharField(source="company.name", read_only=True)
+    created_by_username = serializers.CharField(source="created_by.username", read_only=True, allow_null=True)
+    submitted_by_username = serializers.CharField(source="submitted_by.username", read_only=True, allow_null=True)
+    assigned_to_username = serializers.CharField(source="assigned_to.username", read_only=True, allow_null=True)
+    ticket_type_name = serializers.CharField(source="ticket_type.name", read_only=True, allow_null=True)
+    labels_data = TicketListLabelSerializer(source="labels", many=True, read_only=True)
+
+    status_display = serializers.CharField(source="get_status_display", read_only=True)
+    urgency_display = serializers.CharField(source="get_urgency_display", read_only=True)
+
+    sla_ir_time_remaining = serializers.SerializerMethodField()
+    sla_resolution_time_remaining = serializers.SerializerMethodField()
+
+    # Columns loaded by TicketViewSet for list requests (keep in sync with `fields` below)
+    LIST_ONLY_FIELDS = (
+        "id", "title", "status", "priority", "urgency", "ticket_url_slug",
+        "created_at", "updated_at", "last_activity_at",
+        "first_replied_at", "resolved_at", "closed_at", "paused_at",
+        "sla_ir_deadline", "sla_resolution_deadline",
+        "is_ir_sla_missed", "is_resolution_sla_missed", "is_idle",
+        "company", "company__name",
+        "created_by", "created_by__username",
+        "submitted_by", "submitted_by__username",
+        "assigned_to", "assigned_to__username",
+        "ticket_type", "ticket_type__name",
+    )
+
+    class Meta:
+        model = Ticket
+        fields = [
+            "id", "title",
+            "company", "company_name",
+            "created_by_username", "submitted_by_username",
+            "assigned_to", "assigned_to_username",
+            "status", "status_display",
+            "priority", "urgency", "urgency_display",
+            "ticket_type", "ticket_type_name", "labels_data",
+            "ticket_url_slug",
+            "created_at", "updated_at", "last_activity_at",
+            "first_replied_at", "resolved_at", "closed_at", "paused_at",
+            "sla_ir_deadline", "sla_resolution_deadline",
+            "sla_ir_time_remaining", "sla_resolution_time_remaining",
+            "is_ir_sla_missed", "is_resolution_sla_missed", "is_idle",
+        ]
+        read_only_fields = fields
+
 class NotificationTemplateSerializer(serializers.ModelSerializer):
     company_name = serializers.CharField(source="company.name", read_only=True, allow_null=True)
     event_type_display = serializers.CharField(source="get_event_type_display", read_only=True)
@@ -382,23 +456,10 @@ class AdminTicketDashboardSerializer(serializers.ModelSerializer):
     ticket_type_name = serializers.CharField(source="ticket_type.name", read_only=True, allow_null=True)
     labels_list = serializers.SerializerMethodField()
 
-    is_ir_sla_missed = serializers.SerializerMethodField()
-    is_resolution_sla_missed = serializers.SerializerMethodField()
-
 
     def get_labels_list(self, obj):
         return [{"id": label.id, "name": label.name, "color": label.color} for label in obj.labels.all()]
 
-    def get_is_ir_sla_missed(self, obj):
-        if obj.sla_ir_deadline and obj.first_replied_at: return obj.first_replied_at > obj.sla_ir_deadline
-        elif obj.sla_ir_deadline: return timezone.now() > obj.sla_ir_deadline
-        return False
-
-    def get_is_resolution_sla_missed(self, obj):
-        if obj.sla_resolution_deadline and obj.resolved_at: return obj.resolved_at > obj.sla_resolution_deadline
-        elif obj.sla_resolution_deadline: return timezone.now() > obj.sla_resolution_deadline
-        return False
-
     class Meta:
         model = Ticket
         fields = [
@@ -407,7 +468,7 @@ class AdminTicketDashboardSerializer(serializers.ModelSerializer):
             "sla_response_minutes", "ticket_type_name", "labels_list",
             "ticket_url_slug", "first_replied_at", "resolved_at",
             "sla_ir_deadline", "sla_resolution_deadline",
-            "is_ir_sla_missed", "is_resolution_sla_missed"
+            "is_ir_sla_missed", "is_resolution_sla_missed", "is_idle"
         ]
 
 class NotificationConfigSerializer(serializers.ModelSerializer):
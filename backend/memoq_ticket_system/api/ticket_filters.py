@@ -0,0 +1,90 @@
+import operator
+from functools import reduce
+
+from django.db import models
+from django.db.models.constants import LOOKUP_SEP
+from rest_framework import filters
+from rest_framework.settings import api_settings
+
+from ..search import get_search_backend, query_terms
+
+
+class TicketSearchFilter(filters.SearchFilter):
+    """
+    SearchFilter that never needs DISTINCT.
+
+    Search fields that cross a to-many relation (e.g. labels__name) are matched
+    through a `pk__in` semi-join subquery instead of being joined into the main
+    query, so the ticket rows never fan out and the role-scoped queryset keeps
+    its index ordering. Fields on the ticket or its to-one relations are
+    filtered exactly as SearchFilter does.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search_fields = self.get_search_fields(view, request)
+        search_terms = self.get_search_terms(request)
+
+        if not search_fields or not search_terms:
+            return queryset
+
+        direct_lookups, to_many_lookups = [], []
+        for search_field in search_fields:
+            lookup = self.construct_search(str(search_field))
+            if self.must_call_distinct(queryset, [search_field]):
+                to_many_lookups.append(lookup)
+            else:
+                direct_lookups.append(lookup)
+
+        conditions = []
+        for search_term in search_terms:
+            queries = [models.Q(**{lookup: search_term}) for lookup in direct_lookups]
+            queries += [
+                models.Q(pk__in=self.related_pk_subquery(queryset.model, lookup, search_term))
+                for lookup in to_many_lookups
+            ]
+            conditions.append(reduce(operator.or_, queries))
+        return queryset.filter(reduce(operator.and_, conditions))
+
+    @staticmethod
+    def related_pk_subquery(model, lookup, search_term):
+        """
+        Ids of `model` rows matching a to-many lookup, queried from the relation
+        side (the m2m through table or the reverse-FK table) so the subquery does
+        not have to join back to the ticket table.
+        """
+        relation_name, rest = lookup.split(LOOKUP_SEP, 1)
+        field = model._meta.get_field(relation_name)
+        if field.many_to_many and not field.auto_created:  # forward m2m, e.g. labels
+            through = field.remote_field.through
+            return through._default_manager.filter(
+                **{f"{field.m2m_reverse_field_name()}{LOOKUP_SEP}{rest}": search_term}
+            ).values(field.m2m_field_name())
+        if field.one_to_many:  # reverse foreign key, e.g. replies
+            return field.related_model._default_manager.filter(
+                **{rest: search_term}
+            ).values(field.field.attname)
+        return model._default_manager.filter(**{lookup: search_term}).values('pk')
+
+
+class TicketFullTextSearchFilter(TicketSearchFilter):
+    """
+    `?search=` backed by the ticket full-text index (memoq_ticket_system.search):
+    FTS5 on SQLite, tsvector + GIN on PostgreSQL. Results are ranked by relevance
+    unless the client asks for an explicit `ordering`.
+
+    On databases without a search index it degrades to TicketSearchFilter.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        backend = get_search_backend()
+        if backend is None:
+            return super().filter_queryset(request, queryset, view)
+
+        terms = query_terms(" ".join(self.get_search_terms(request)))
+        if not terms:
+            return queryset
+
+        queryset = queryset.filter(pk__in=backend.matching_ids(terms))
+        if request.query_params.get(api_settings.ORDERING_PARAM):
+            return queryset
+        return queryset.annotate(search_rank=backend.rank(terms)).order_by('-search_rank', '-last_activity_at', '-id')
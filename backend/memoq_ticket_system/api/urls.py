@@ -16,6 +16,7 @@ router.register(r"ticket-labels", views.TicketLabelViewSet, basename="ticketlabe
 # router.register(r"ticket-transfer-histories", views.TicketTransferHistoryViewSet, basename="tickettransferhistory") # Create if needed
 router.register(r"ticket-satisfaction-ratings", views.TicketSatisfactionRatingViewSet, basename="ticketsatisfactionrating")
 router.register(r"attachments", views.AttachmentViewSet, basename="attachment")
+router.register(r"attachment-uploads", views.AttachmentUploadSessionViewSet, basename="attachmentuploadsession")
 router.register(r"notification-configs", views.NotificationConfigViewSet, basename="notificationconfig")
 router.register(r"notification-templates", views.NotificationTemplateViewSet, basename="notificationtemplate")
 router.register(r"notification-logs", views.NotificationLogViewSet, basename="notificationlog")
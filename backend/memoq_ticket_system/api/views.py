@@ -1,14 +1,17 @@
+import math
+import os
 from django.utils import timezone
 from datetime import timedelta
 from django.http import HttpResponse, JsonResponse, HttpResponseRedirect
 from django.contrib.auth import get_user_model
-from django.db.models import Q, F, ExpressionWrapper, fields, Prefetch, Case, When, Value, BooleanField
+from django.db import transaction
+from django.db.models import Q, F, ExpressionWrapper, fields, Prefetch, Case, When, Value, BooleanField, Count, Sum
 from django.db.models.functions import Now
 from django.shortcuts import get_object_or_404
 from django.conf import settings
 from urllib.parse import urlencode # For building query strings
 
-from rest_framework import viewsets, permissions, status, filters, generics
+from rest_framework import viewsets, mixins, permissions, status, filters, generics
 from rest_framework.decorators import action, api_view, permission_classes as drf_permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
@@ -22,12 +25,12 @@ from memoq_ticket_system.models import (
     NotificationConfig, NotificationLog, Attachment, CustomerTypeTag,
     # WebhookTemplate, # REMOVED THIS LINE - WebhookTemplate was superseded
     TicketType, TicketLabel, TicketTransferHistory,
-    CompanySSOProvider, NotificationTemplate, TicketSatisfactionRating
+    CompanySSOProvider, NotificationTemplate, TicketSatisfactionRating, AttachmentUploadSession
 )
 from .serializers import (
     CompanySerializer, CompanyConfigSerializer, UserSerializer,
-    TicketSerializer, TicketReplySerializer, TicketStatusHistorySerializer,
-    NotificationConfigSerializer, NotificationLogSerializer, AttachmentSerializer,
+    TicketSerializer, TicketListSerializer, TicketReplySerializer, TicketStatusHistorySerializer,
+    NotificationConfigSerializer, NotificationLogSerializer, AttachmentSerializer, AttachmentUploadSessionSerializer,
     TicketAssignmentSerializer, SupportStaffTicketStatsSerializer,
     CustomerTypeTagSerializer, TicketTypeSerializer, TicketLabelSerializer, TicketTransferHistorySerializer,
     CompanySSOProviderSerializer, NotificationTemplateSerializer, TicketSatisfactionRatingSerializer,
@@ -43,9 +46,16 @@ from .permissions import (
     # Add CanAssignTicket and CanViewTicketOrReplyAttachment if they are custom
 )
 from .pagination_integration import (
-    StandardResultsSetPagination, SmallResultsSetPagination, MediumResultsSetPagination
+    StandardResultsSetPagination, SmallResultsSetPagination, MediumResultsSetPagination,
+    TicketCursorPagination, NotificationLogCursorPagination
 )
+from .ticket_filters import TicketFullTextSearchFilter
 from ..notifications import NotificationManager
+from ..outbox import schedule_replay
+from ..search import search_replies
+from ..downloads import download_counts, is_new_download, serve_local_file
+from ..file_storage import get_storage_backend
+from ..uploads import UploadError, discard_session, finalize_session, storage_type_of, write_chunk
 # from ..utils import render_template_string_with_context # Assuming this exists
 
 User = get_user_model()
@@ -257,32 +267,53 @@ class TicketLabelViewSet(viewsets.ModelViewSet):
 class TicketViewSet(viewsets.ModelViewSet):
     serializer_class = TicketSerializer
     permission_classes = [IsAuthenticated] 
-    pagination_class = StandardResultsSetPagination
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = TicketCursorPagination
+    filter_backends = [TicketFullTextSearchFilter, filters.OrderingFilter]
     search_fields = ['id', 'title', 'description', 'company__name', 'created_by__username', 'assigned_to__username', 'ticket_type__name', 'labels__name']
     ordering_fields = ['created_at', 'last_activity_at', 'priority', 'status', 'urgency', 'sla_ir_deadline', 'sla_resolution_deadline']
 
-    def get_queryset(self):
-        user = self.request.user
-        queryset = Ticket.objects.select_related(
+    # Actions that render flat rows (TicketListSerializer / AdminTicketDashboardSerializer)
+    # and therefore never need the reply/history graph.
+    LIST_ACTIONS = {
+        'list', 'pending_assignment_tickets', 'sla_ir_monitoring',
+        'sla_resolution_monitoring', 'idle_tickets_monitoring',
+    }
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return TicketListSerializer
+        return super().get_serializer_class()
+
+    def get_list_queryset(self):
+        """Column-restricted queryset for list/dashboard rows: FK columns only, labels prefetched."""
+        return Ticket.objects.select_related(
+            'company', 'company__config', 'created_by', 'submitted_by', 'assigned_to', 'ticket_type'
+        ).only(
+            *TicketListSerializer.LIST_ONLY_FIELDS, 'company__config__sla_response_minutes'
+        ).prefetch_related(
+            Prefetch('labels', queryset=TicketLabel.objects.only('id', 'name', 'color'))
+        )
+
+    def get_detail_queryset(self):
+        """Full object graph used by retrieve and the write actions."""
+        return Ticket.objects.select_related(
             'company', 'company__config', 'created_by', 'submitted_by', 'assigned_to', 'ticket_type', 'satisfaction_rating'
         ).prefetch_related(
             'labels', 'followers', 'attachments',
             Prefetch('replies', queryset=TicketReply.objects.select_related('user').prefetch_related('attachments').order_by('created_at')),
             Prefetch('status_history', queryset=TicketStatusHistory.objects.select_related('changed_by').order_by('created_at')),
             Prefetch('transfer_history', queryset=TicketTransferHistory.objects.select_related('transferred_by', 'transferred_from', 'transferred_to').order_by('created_at'))
-        ).distinct()
-
-        if user.role == User.ROLE_SYSTEM_ADMIN or user.role == User.ROLE_TECHNICAL_SUPPORT_ADMIN:
-            pass
-        elif user.role == User.ROLE_SUPPORT:
-            queryset = queryset.filter(Q(assigned_to=user) | Q(status='pending_assignment')) 
-        elif user.role == User.ROLE_CUSTOMER:
-            if not user.company: return Ticket.objects.none()
-            queryset = queryset.filter(Q(company=user.company)).distinct()
+        )
+
+    def get_queryset(self):
+        if self.action in self.LIST_ACTIONS:
+            queryset = self.get_list_queryset()
         else:
-            return Ticket.objects.none()
-        
+            queryset = self.get_detail_queryset()
+        # Role filters never join a to-many relation and the search filters match
+        # through semi-joins, so the ticket rows never need DISTINCT.
+        queryset = queryset.visible_to(self.request.user)
+
         status_param = self.request.query_params.get('status')
         if status_param: queryset = queryset.filter(status=status_param)
         company_id_param = self.request.query_params.get('company_id')
@@ -443,9 +474,44 @@ class TicketViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    # Dashboard querysets, shared by the actions below and the explain_ticket_queries command.
+    # Open-ticket filters use Ticket.INACTIVE_STATUSES verbatim so the partial indexes apply.
+    def get_pending_assignment_queryset(self):
+        return self.get_queryset().filter(status__in=['new_issue', 'pending_assignment']).order_by('created_at')
+
+    def get_sla_ir_querysets(self, warning_hours=1):
+        now = timezone.now()
+        base_queryset = self.get_queryset().exclude(status__in=Ticket.INACTIVE_STATUSES)
+        approaching_ir = base_queryset.filter(
+            first_replied_at__isnull=True, sla_ir_deadline__isnull=False,
+            sla_ir_deadline__gt=now, sla_ir_deadline__lte=now + timedelta(hours=warning_hours)
+        ).order_by('sla_ir_deadline')
+        # Breach state is materialized on Ticket (see sweep_sla_state)
+        missed_ir = base_queryset.filter(is_ir_sla_missed=True).order_by('sla_ir_deadline')
+        return approaching_ir, missed_ir
+
+    def get_sla_resolution_querysets(self, warning_hours=24):
+        now = timezone.now()
+        base_queryset = self.get_queryset().exclude(status__in=Ticket.INACTIVE_STATUSES)
+        approaching_resolution = base_queryset.filter(
+            resolved_at__isnull=True, sla_resolution_deadline__isnull=False,
+            sla_resolution_deadline__gt=now, sla_resolution_deadline__lte=now + timedelta(hours=warning_hours)
+        ).order_by('sla_resolution_deadline')
+        missed_resolution = base_queryset.filter(is_resolution_sla_missed=True).order_by('sla_resolution_deadline')
+        return approaching_resolution, missed_resolution
+
+    def get_idle_queryset(self, idle_days=None):
+        if idle_days is None:
+            # Default: each company's own idle timeout, materialized as Ticket.is_idle
+            return self.get_queryset().filter(is_idle=True).order_by('last_activity_at')
+        idle_since_date = timezone.now() - timedelta(days=idle_days)
+        return self.get_queryset().filter(
+            last_activity_at__lt=idle_since_date,
+        ).exclude(status__in=Ticket.INACTIVE_STATUSES).order_by('last_activity_at')
+
     @action(detail=False, methods=['get'], permission_classes=[IsTechnicalSupportAdminOrSystemAdmin])
     def pending_assignment_tickets(self, request):
-        tickets = self.get_queryset().filter(status__in=['new_issue', 'pending_assignment']).order_by('created_at')
+        tickets = self.get_pending_assignment_queryset()
         page = self.paginate_queryset(tickets)
         serializer_context = {'request': request}
         if page is not None:
@@ -456,20 +522,7 @@ class TicketViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'], permission_classes=[IsTechnicalSupportAdminOrSystemAdmin])
     def sla_ir_monitoring(self, request):
-        now = timezone.now()
-        warning_hours_before = int(request.query_params.get('warning_hours', 1))
-        warning_threshold = now + timedelta(hours=warning_hours_before)
-        base_queryset = self.get_queryset().exclude(status__in=['closed', 'resolved', 'paused'])
-
-        approaching_ir = base_queryset.filter(
-            first_replied_at__isnull=True, sla_ir_deadline__isnull=False,
-            sla_ir_deadline__gt=now, sla_ir_deadline__lte=warning_threshold
-        ).order_by('sla_ir_deadline')
-
-        missed_ir = base_queryset.filter(
-            Q(first_replied_at__isnull=True, sla_ir_deadline__isnull=False, sla_ir_deadline__lt=now) |
-            Q(first_replied_at__isnull=False, sla_ir_deadline__isnull=False, first_replied_at__gt=F('sla_ir_deadline'))
-        ).order_by('sla_ir_deadline')
+        approaching_ir, missed_ir = self.get_sla_ir_querysets(int(request.query_params.get('warning_hours', 1)))
 
         serializer_context = {'request': request}
         # For simplicity, not paginating dashboard widgets here, but could be added
@@ -480,20 +533,9 @@ class TicketViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'], permission_classes=[IsTechnicalSupportAdminOrSystemAdmin])
     def sla_resolution_monitoring(self, request):
-        now = timezone.now()
-        warning_hours_before = int(request.query_params.get('warning_hours', 24))
-        warning_threshold = now + timedelta(hours=warning_hours_before)
-        base_queryset = self.get_queryset().exclude(status__in=['closed', 'resolved', 'paused'])
-
-        approaching_resolution = base_queryset.filter(
-            resolved_at__isnull=True, sla_resolution_deadline__isnull=False,
-            sla_resolution_deadline__gt=now, sla_resolution_deadline__lte=warning_threshold
-        ).order_by('sla_resolution_deadline')
-
-        missed_resolution = base_queryset.filter(
-            Q(resolved_at__isnull=True, sla_resolution_deadline__isnull=False, sla_resolution_deadline__lt=now) |
-            Q(resolved_at__isnull=False, sla_resolution_deadline__isnull=False, resolved_at__gt=F('sla_resolution_deadline'))
-        ).order_by('sla_resolution_deadline')
+        approaching_resolution, missed_resolution = self.get_sla_resolution_querysets(
+            int(request.query_params.get('warning_hours', 24))
+        )
         
         serializer_context = {'request': request}
         return Response({
@@ -503,18 +545,34 @@ class TicketViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'], permission_classes=[IsTechnicalSupportAdminOrSystemAdmin])
     def idle_tickets_monitoring(self, request):
-        idle_days_threshold = int(request.query_params.get('idle_days', 3)) 
-        idle_since_date = timezone.now() - timedelta(days=idle_days_threshold)
-        
-        idle_tickets = self.get_queryset().filter(
-            last_activity_at__lt=idle_since_date,
-        ).exclude(status__in=['closed', 'resolved', 'paused']).order_by('last_activity_at') 
+        idle_days_param = request.query_params.get('idle_days')
+        idle_tickets = self.get_idle_queryset(int(idle_days_param) if idle_days_param is not None else None)
 
         serializer_context = {'request': request}
         return Response({
             "idle_tickets": AdminTicketDashboardSerializer(idle_tickets, many=True, context=serializer_context).data,
         })
 
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Ranked ticket IDs whose replies contain all terms of ?q=, with a snippet of the best reply."""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': '请提供搜索关键字。'})
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+        except ValueError:
+            raise ValidationError({'limit': '必须是整数。'})
+
+        user = request.user
+        total, results = search_replies(
+            query,
+            Ticket.objects.visible_to(user),
+            include_internal=user.role != User.ROLE_CUSTOMER, # Customers never match internal notes
+            limit=limit,
+        )
+        return Response({"count": total, "results": results})
+
 
 class TicketReplyViewSet(viewsets.ModelViewSet):
     queryset = TicketReply.objects.select_related('user', 'ticket').prefetch_related('attachments').all().order_by('created_at')
@@ -561,7 +619,7 @@ class TicketReplyViewSet(viewsets.ModelViewSet):
         # Notification for new reply is handled by signals.py
 
 class AttachmentViewSet(viewsets.ModelViewSet):
-    queryset = Attachment.objects.select_related('uploaded_by', 'ticket', 'reply').all()
+    queryset = Attachment.objects.select_related('uploaded_by', 'ticket', 'reply__ticket', 'blob').all()
     serializer_class = AttachmentSerializer
     parser_classes = (MultiPartParser, FormParser)
     permission_classes = [IsAuthenticated] 
@@ -578,6 +636,82 @@ class AttachmentViewSet(viewsets.ModelViewSet):
     #     return super().get_permissions()
     # ... (perform_create and download actions - ensure storage_backend is used)
 
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """
+        Local files are sent by the front web server when ATTACHMENT_DOWNLOAD_OFFLOAD is set
+        (X-Accel-Redirect / X-Sendfile), otherwise by Django with Range support; COS files get a presigned URL.
+        """
+        attachment = self.get_object()
+        user = request.user
+        ticket = attachment.ticket or (attachment.reply.ticket if attachment.reply else None)
+        if not (user.is_staff or user.role in [User.ROLE_SYSTEM_ADMIN, User.ROLE_TECHNICAL_SUPPORT_ADMIN, User.ROLE_SUPPORT]
+                or attachment.uploaded_by_id == user.id or (ticket and ticket.company and user.company == ticket.company)):
+            raise PermissionDenied("您没有权限下载此附件。")
+
+        if storage_type_of(attachment) == 'cos':
+            response = Response({"download_url": get_storage_backend('cos').get_file_url(attachment.file.name)})
+        else:
+            if not attachment.file or not os.path.exists(attachment.file.path):
+                raise NotFound("附件文件不存在。")
+            response = serve_local_file(request, attachment.file.name, attachment.file_name, attachment.file_type)
+        # Counted only once the file is actually being served (not for a missing file or an unsatisfiable range)
+        if is_new_download(request) and response.status_code < 400:
+            download_counts.add(attachment.pk)
+        return response
+
+    def perform_destroy(self, instance):
+        # The post_delete handler releases the blob; its stored object goes only with the last reference
+        with transaction.atomic():
+            instance.delete()
+
+class AttachmentUploadSessionViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                                     mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Resumable upload of large attachments (see uploads.py):
+    POST to open a session, PUT {id}/chunk/?offset=N with the raw chunk as the body,
+    GET {id}/ for the offset to resume from, POST {id}/finalize/ to create the attachment.
+    """
+    queryset = AttachmentUploadSession.objects.all()
+    serializer_class = AttachmentUploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return super().get_queryset().filter(uploaded_by=self.request.user)
+
+    def perform_create(self, serializer):
+        user = self.request.user
+        reply = serializer.validated_data.get('reply')
+        ticket = serializer.validated_data.get('ticket') or (reply.ticket if reply else None)
+        if ticket and not (user.is_staff or user.role in [User.ROLE_SYSTEM_ADMIN, User.ROLE_TECHNICAL_SUPPORT_ADMIN, User.ROLE_SUPPORT]
+                           or user == ticket.created_by or (ticket.company and user.company == ticket.company)):
+            raise PermissionDenied("您没有权限为此工单上传附件。")
+        serializer.save(uploaded_by=user, ticket=ticket)
+
+    @action(detail=True, methods=['put'])
+    def chunk(self, request, pk=None):
+        session = self.get_object()
+        try:
+            offset = int(request.query_params.get('offset', ''))
+        except ValueError:
+            raise ValidationError({'offset': '必须是整数。'})
+        try:
+            session = write_chunk(session, offset, request.body)
+        except UploadError as e:
+            return Response({"detail": str(e), "received": session.received}, status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(session).data)
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        try:
+            attachment = finalize_session(self.get_object())
+        except UploadError as e:
+            raise ValidationError(str(e))
+        return Response(AttachmentSerializer(attachment, context=self.get_serializer_context()).data, status=status.HTTP_201_CREATED)
+
+    def perform_destroy(self, instance):
+        discard_session(instance)
+
 class NotificationConfigViewSet(viewsets.ModelViewSet):
     queryset = NotificationConfig.objects.all()
     serializer_class = NotificationConfigSerializer
@@ -614,10 +748,49 @@ class NotificationLogViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = NotificationLog.objects.select_related('user', 'company', 'ticket').all().order_by('-created_at')
     serializer_class = NotificationLogSerializer
     permission_classes = [IsAuthenticated, IsTechnicalSupportAdminOrSystemAdmin]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = NotificationLogCursorPagination
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['ticket__id', 'user__username', 'company__name', 'notification_type', 'status', 'recipient_info']
     ordering_fields = ['created_at', 'sent_at', 'status', 'notification_type']
+    MAX_LOOKBACK_HOURS = 24 * 366 # Far larger values overflow timedelta / the datetime range
+
+    def _lookback_hours(self, value, parse, message):
+        """?hours= parsed with `parse`; finite, above 0 and at most MAX_LOOKBACK_HOURS."""
+        try:
+            hours = parse(value)
+        except (TypeError, ValueError, OverflowError):
+            raise ValidationError({'hours': message})
+        if not math.isfinite(hours) or not 0 < hours <= self.MAX_LOOKBACK_HOURS:
+            raise ValidationError({'hours': f'必须大于 0 且不超过 {self.MAX_LOOKBACK_HOURS}。'})
+        return hours
+
+    @action(detail=False, methods=['post'])
+    def replay_failures(self, request):
+        """
+        Requeue the failed / retry_failed sends of the last ?hours= (default 1), e.g. after
+        an SMTP outage. The worker re-sends them at NOTIFICATION_REPLAY_RATE_PER_MINUTE per channel.
+        """
+        hours = self._lookback_hours(request.data.get('hours', 1), float, '必须是数字。')
+        queryset = NotificationLog.objects.filter(last_attempt_at__gte=timezone.now() - timedelta(hours=hours))
+        channel = request.data.get('channel')
+        if channel:
+            queryset = queryset.filter(notification_type=channel)
+        return Response({"hours": hours, "requeued": schedule_replay(queryset)})
+
+    @action(detail=False, methods=['get'])
+    def dedupe_stats(self, request):
+        """Duplicate sends collapsed by the dedupe layer, per channel, over the last ?hours= (default 24)."""
+        hours = self._lookback_hours(request.query_params.get('hours', 24), int, '必须是整数。')
+        rows = list(NotificationLog.objects.filter(
+            created_at__gte=timezone.now() - timedelta(hours=hours), suppressed_count__gt=0
+        ).values('notification_type').annotate(suppressed=Sum('suppressed_count'), notifications=Count('id')).order_by())
+        by_channel = {row['notification_type']: row['suppressed'] for row in rows}
+        return Response({
+            "hours": hours,
+            "suppressed_total": sum(by_channel.values()),
+            "suppressed_by_channel": by_channel,
+            "notifications_with_duplicates": sum(row['notifications'] for row in rows),
+        })
 
 class TicketSatisfactionRatingViewSet(viewsets.ModelViewSet):
     queryset = TicketSatisfactionRating.objects.select_related('ticket', 'rated_by').all()
@@ -0,0 +1,92 @@
+"""
+Concurrent delivery of notification sends.
+
+One asyncio event loop, running in a background thread, takes lists of sends
+from any worker thread and runs them concurrently: each channel has its own
+concurrency cap (NOTIFICATION_CHANNEL_CONCURRENCY, an asyncio.Semaphore per
+channel shared by every caller in the process) and each send a deadline
+(NOTIFICATION_SEND_DEADLINE_SECONDS). The senders themselves are the blocking
+pooled clients (http_client, smtp_pool), run in the loop's executor, so a
+50-recipient fan-out costs about 50 / cap round trips instead of 50.
+
+A send that misses its deadline is reported as failed and retried later; the
+executor thread still finishes it in the background (its socket timeouts bound
+it), so deadlines should stay above HTTP_CONNECT_TIMEOUT + HTTP_READ_TIMEOUT.
+"""
+import asyncio
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# One unit of work: `func(*args)` on `channel`; `weight` scales the deadline (messages in an SMTP batch).
+Send = namedtuple("Send", "channel func args weight", defaults=(1,))
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class AsyncDispatcher:
+    def __init__(self, channel_limits=None, default_limit=4, deadline=15.0):
+        self.channel_limits = dict(channel_limits or {})
+        self.default_limit = default_limit
+        self.deadline = deadline
+        self.loop = None
+        self.executor = None
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.loop is not None:
+                return
+            max_workers = sum(self.channel_limits.values()) + self.default_limit
+            self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dispatch")
+            loop = asyncio.new_event_loop()
+            loop.set_default_executor(self.executor)
+            threading.Thread(target=loop.run_forever, name="notification-dispatcher", daemon=True).start()
+            self.loop = loop
+
+    def dispatch(self, sends):
+        """
+        Run `sends` concurrently and wait for all of them. Returns (result, error)
+        per send, in order; error is the exception raised, or DeadlineExceeded.
+        """
+        if not sends:
+            return []
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self.run(sends), self.loop).result()
+
+    async def run(self, sends):
+        return await asyncio.gather(*(self.run_send(send) for send in sends))
+
+    def semaphore(self, channel):
+        # Only touched from the loop thread, so no locking is needed
+        if channel not in self.semaphores:
+            self.semaphores[channel] = asyncio.Semaphore(self.channel_limits.get(channel, self.default_limit))
+        return self.semaphores[channel]
+
+    async def run_send(self, send):
+        deadline = self.deadline * max(send.weight, 1)
+        async with self.semaphore(send.channel):
+            try:
+                result = await asyncio.wait_for(
+                    asyncio.get_running_loop().run_in_executor(None, send.func, *send.args), deadline
+                )
+            except asyncio.TimeoutError:
+                logger.error(f"{send.channel} send exceeded its {deadline:g}s deadline")
+                return False, DeadlineExceeded(f"Send exceeded the {deadline:g}s deadline")
+            except Exception as e:
+                return False, e
+            return result, None
+
+
+dispatcher = AsyncDispatcher(
+    channel_limits=getattr(settings, "NOTIFICATION_CHANNEL_CONCURRENCY", {}),
+    deadline=getattr(settings, "NOTIFICATION_SEND_DEADLINE_SECONDS", 15.0),
+)
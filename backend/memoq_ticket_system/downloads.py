@@ -0,0 +1,164 @@
+"""
+Responses for attachment downloads from local storage.
+
+With ATTACHMENT_DOWNLOAD_OFFLOAD set, the view only checks permissions and
+returns an internal-redirect header: "nginx" sends X-Accel-Redirect to
+ATTACHMENT_DOWNLOAD_ACCEL_PREFIX + the MEDIA_ROOT-relative path (an `internal`
+location aliased to MEDIA_ROOT), "apache" sends X-Sendfile with the absolute
+path (mod_xsendfile). The web server then sends the bytes, Range requests
+included, and the worker is free as soon as the headers are written. Without
+offload Django sends the file itself and answers single-range requests with
+206, so an interrupted download can resume.
+
+Download counts are buffered per process in download_counts and added to
+Attachment.download_count with one UPDATE per flush, so a popular attachment
+costs one row write per ATTACHMENT_DOWNLOAD_COUNT_FLUSH_SECONDS, not one per download.
+"""
+import atexit
+import logging
+import mimetypes
+import os
+import re
+import threading
+import time
+from collections import Counter
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db.models import Case, F, IntegerField, Value, When
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+
+from .models import Attachment
+
+logger = logging.getLogger(__name__)
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+BLOCK_SIZE = 64 * 1024
+
+
+class DownloadCounter:
+    """
+    Download counts waiting to be written, per attachment id. flush() adds them to
+    download_count in a single UPDATE (F() + CASE), so concurrent processes never lose
+    increments; it runs once max_delay seconds have passed or max_size attachments are
+    pending, and at process exit. A max_delay of 0 writes every download straight through.
+    """
+
+    def __init__(self, max_delay=30, max_size=500):
+        self.max_delay = max_delay
+        self.max_size = max_size
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+
+    def add(self, attachment_id):
+        with self.lock:
+            self.counts[attachment_id] += 1
+            due = len(self.counts) >= self.max_size or time.monotonic() - self.last_flush >= self.max_delay
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write the pending counts; returns the number of attachments updated."""
+        with self.lock:
+            counts, self.counts = self.counts, Counter()
+            self.last_flush = time.monotonic()
+        if not counts:
+            return 0
+        increment = Case(
+            *(When(pk=pk, then=Value(count)) for pk, count in counts.items()),
+            default=Value(0), output_field=IntegerField(),
+        )
+        try:
+            return Attachment.objects.filter(pk__in=counts).update(download_count=F('download_count') + increment)
+        except Exception as e:
+            logger.error(f"Flushing download counts of {len(counts)} attachments failed: {e}")
+            with self.lock:
+                self.counts.update(counts)  # Retried with the next flush
+            return 0
+
+    def flush_at_exit(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Flushing download counts at exit failed: {e}")
+
+
+download_counts = DownloadCounter(max_delay=getattr(settings, "ATTACHMENT_DOWNLOAD_COUNT_FLUSH_SECONDS", 30))
+atexit.register(download_counts.flush_at_exit)
+
+
+def is_new_download(request):
+    """False for a Range request resuming a download part-way, which should not be counted again."""
+    byte_range = request.headers.get("Range", "")
+    return not byte_range.startswith("bytes=") or byte_range.startswith("bytes=0-")
+
+
+def content_disposition(file_name):
+    try:
+        file_name.encode("ascii")
+        return 'attachment; filename="{}"'.format(file_name.replace("\\", "\\\\").replace('"', r"\""))
+    except UnicodeEncodeError:
+        return "attachment; filename*=utf-8''{}".format(quote(file_name))
+
+
+def parse_range(header, size):
+    """
+    (start, end) of a single "bytes=" range, end inclusive; None to send the whole
+    file (no header, or a form we do not serve, such as several ranges);
+    False when the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header or "")
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:  # Suffix range: the last N bytes
+        length = int(last)
+        return (max(size - length, 0), size - 1) if length and size else False
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    return (start, end) if start <= end else False
+
+
+def read_range(path, start, length):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+def serve_local_file(request, relative_path, file_name, content_type=None):
+    """Response sending MEDIA_ROOT/`relative_path` as a download named `file_name`."""
+    path = os.path.join(settings.MEDIA_ROOT, relative_path)
+    content_type = content_type or mimetypes.guess_type(file_name)[0] or "application/octet-stream"
+    offload = getattr(settings, "ATTACHMENT_DOWNLOAD_OFFLOAD", "")
+    if offload in ("nginx", "apache"):
+        response = HttpResponse(content_type=content_type)
+        if offload == "nginx":
+            prefix = getattr(settings, "ATTACHMENT_DOWNLOAD_ACCEL_PREFIX", "/protected-media/")
+            response["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + quote(relative_path.replace(os.sep, "/"))
+        else:
+            response["X-Sendfile"] = os.path.abspath(path)
+        response["Content-Disposition"] = content_disposition(file_name)
+        return response
+
+    size = os.path.getsize(path)
+    byte_range = parse_range(request.headers.get("Range"), size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+    if byte_range is None:
+        response = FileResponse(open(path, "rb"), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(read_range(path, start, end - start + 1), status=206, content_type=content_type)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(end - start + 1)
+    response["Accept-Ranges"] = "bytes"
+    response["Content-Disposition"] = content_disposition(file_name)
+    return response
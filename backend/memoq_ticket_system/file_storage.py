@@ -1,6 +1,10 @@
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
+from django.core.files.move import file_move_safe
 from django.utils import timezone
+import hashlib
 import os
+import threading
 import uuid
 import mimetypes
 import logging
@@ -8,6 +12,48 @@ from qcloud_cos import CosConfig, CosS3Client
 
 logger = logging.getLogger(__name__)
 
+_storage_backends = {}
+_storage_backends_lock = threading.Lock()
+
+
+def get_storage_backend(storage_type=None):
+    """
+    返回（并缓存）存储后端实例
+
+    Args:
+        storage_type: 'cos' 或 'local'，默认取 DEFAULT_FILE_STORAGE_BACKEND
+
+    Returns:
+        TencentCOSStorage 或 SecureFileStorage
+    """
+    storage_type = storage_type or getattr(settings, "DEFAULT_FILE_STORAGE_BACKEND", "local")
+    if storage_type not in _storage_backends:
+        with _storage_backends_lock:
+            if storage_type not in _storage_backends:
+                _storage_backends[storage_type] = TencentCOSStorage() if storage_type == "cos" else SecureFileStorage()
+    return _storage_backends[storage_type]
+
+
+def content_hash(file):
+    """
+    文件内容的 SHA-256。请求中上传的文件已由 uploads.py 中的上传处理器在接收时算好（file.sha256），
+    其他文件按块读取计算后回到文件开头
+    """
+    digest = getattr(file, "sha256", None)
+    if digest is None:
+        hasher = hashlib.sha256()
+        for chunk in file.chunks():
+            hasher.update(chunk)
+        digest = file.sha256 = hasher.hexdigest()
+        file.seek(0)
+    return digest
+
+
+def blob_key(digest, file_name):
+    """按内容寻址的存储路径：相同内容的文件始终落在同一个对象上"""
+    file_ext = os.path.splitext(file_name)[1].lower()
+    return f"attachments/blobs/{digest[:2]}/{digest}{file_ext}"
+
 
 class TencentCOSStorage:
     """
@@ -33,11 +79,19 @@ class TencentCOSStorage:
             Region=self.region, SecretId=self.secret_id, SecretKey=self.secret_key
         )
         self.client = CosS3Client(config)
+        # 超过阈值的文件按分片流式上传，单个上传占用的内存约为 分片大小 × (并发数 + 1)
+        self.multipart_threshold = getattr(settings, "TENCENT_COS_MULTIPART_THRESHOLD", 8 * 1024 * 1024)
+        self.part_size = getattr(settings, "TENCENT_COS_PART_SIZE", 8 * 1024 * 1024)
+        self.part_concurrency = getattr(settings, "TENCENT_COS_PART_CONCURRENCY", 4)
 
     def save_attachment(self, file, ticket_id=None, reply_id=None):
         """
         保存附件文件到腾讯云COS
 
+        对象 Key 由文件内容的 SHA-256 决定，相同内容重复上传会写到同一个对象上。
+        小文件（不超过 TENCENT_COS_MULTIPART_THRESHOLD）一次 PUT 上传；大文件通过 file.chunks()
+        按 TENCENT_COS_PART_SIZE 分片、以 TENCENT_COS_PART_CONCURRENCY 个并发分片上传，不会整体读入内存
+
         Args:
             file: 上传的文件对象 (in-memory uploaded file or similar)
             ticket_id: 关联的工单ID (可选)
@@ -47,47 +101,89 @@ class TencentCOSStorage:
             dict: 包含文件信息的字典
         """
         original_name = file.name
-        file_ext = os.path.splitext(original_name)[1].lower()
-        unique_filename = f"{uuid.uuid4().hex}{file_ext}"
+        digest = content_hash(file)
+        cos_key = blob_key(digest, original_name)
 
-        today = timezone.now().strftime("%Y/%m/%d")
-        cos_key = f"attachments/{today}/{unique_filename}"
+        content_type, _ = mimetypes.guess_type(original_name)
+        if not content_type:
+            content_type = "application/octet-stream"
 
         try:
-            # 对于UploadedFile对象，需要读取其内容
-            file_content = file.read()
-            response = self.client.put_object(
-                Bucket=self.bucket,
-                Body=file_content,
-                Key=cos_key,
-                StorageClass="STANDARD",
-                ContentType=mimetypes.guess_type(original_name)[0]
-                or "application/octet-stream",
-            )
-            logger.info(
-                f"文件已上传至腾讯云COS: {cos_key}, ETag: {response.get('ETag')}"
-            )
+            if file.size is not None and file.size <= self.multipart_threshold:
+                file_content = file.read()
+                response = self.client.put_object(
+                    Bucket=self.bucket,
+                    Body=file_content,
+                    Key=cos_key,
+                    StorageClass="STANDARD",
+                    ContentType=content_type,
+                )
+                file_size = len(file_content)  # 获取文件大小
+                logger.info(
+                    f"文件已上传至腾讯云COS: {cos_key}, ETag: {response.get('ETag')}"
+                )
+            else:
+                file_size = self.multipart_upload(file, cos_key, content_type)
         except Exception as e:
             logger.error(f"上传文件至腾讯云COS失败: {cos_key}, 错误: {str(e)}")
             raise
 
-        file_size = len(file_content)  # 获取文件大小
-        content_type, _ = mimetypes.guess_type(original_name)
-        if not content_type:
-            content_type = "application/octet-stream"
-
         return {
             "original_name": original_name,
-            "file_name": unique_filename,  # COS中的文件名部分
+            "file_name": os.path.basename(cos_key),  # COS中的文件名部分
             "file_path": cos_key,  # COS中的完整路径 (Key)
             "file_size": file_size,
             "content_type": content_type,
+            "sha256": digest,
             "ticket_id": ticket_id,
             "reply_id": reply_id,
             "upload_date": timezone.now(),
             "storage_type": "cos",  # 标记存储类型
         }
 
+    def multipart_upload(self, file, cos_key, content_type):
+        """
+        分片上传文件到COS，返回上传的字节数。
+        同时缓存（读取中或上传中）的分片不超过 part_concurrency 个；任一分片失败时
+        停止读取并取消整个分片上传，COS 上不会留下未完成的分片
+        """
+        upload_id = self.client.create_multipart_upload(
+            Bucket=self.bucket, Key=cos_key, StorageClass="STANDARD", ContentType=content_type
+        )["UploadId"]
+        slots = threading.BoundedSemaphore(self.part_concurrency)
+        futures = []
+        file_size = 0
+        try:
+            with ThreadPoolExecutor(max_workers=self.part_concurrency, thread_name_prefix="cos-part") as executor:
+                for part_number, part in enumerate(iter_parts(file, self.part_size), start=1):
+                    slots.acquire()
+                    if any(f.done() and f.exception() for f in futures):
+                        slots.release()
+                        break
+                    future = executor.submit(self.upload_part, cos_key, upload_id, part_number, part)
+                    future.add_done_callback(lambda _: slots.release())
+                    futures.append(future)
+                    file_size += len(part)
+                    del part  # 只由上传线程持有分片
+                parts = [f.result() for f in futures]
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=cos_key, UploadId=upload_id, MultipartUpload={"Part": parts}
+            )
+        except Exception:
+            try:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=cos_key, UploadId=upload_id)
+            except Exception as e:
+                logger.error(f"取消COS分片上传失败: {cos_key}, 错误: {str(e)}")
+            raise
+        logger.info(f"文件已分片上传至腾讯云COS: {cos_key}, 分片数: {len(parts)}, 大小: {file_size}")
+        return file_size
+
+    def upload_part(self, cos_key, upload_id, part_number, body):
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=cos_key, Body=body, PartNumber=part_number, UploadId=upload_id
+        )
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
     def get_file_url(self, cos_key, expires=3600):
         """
         获取腾讯云COS文件的预签名URL
@@ -172,6 +268,24 @@ class TencentCOSStorage:
         return True, ""
 
 
+def iter_parts(file, part_size):
+    """
+    按 part_size 字节切分 file.chunks() 的输出（最后一片可以更小）。
+    COS 要求除最后一片外每个分片至少 1MB，而上传文件的 chunks() 大小不一定等于 part_size
+    """
+    buffer = bytearray()
+    for chunk in file.chunks(chunk_size=part_size):
+        if not buffer and len(chunk) == part_size:
+            yield chunk  # 常见情况：磁盘上的临时文件按 part_size 读出，无需复制
+            continue
+        buffer += chunk
+        while len(buffer) >= part_size:
+            yield bytes(buffer[:part_size])
+            del buffer[:part_size]
+    if buffer:
+        yield bytes(buffer)
+
+
 # 保留 SecureFileStorage 以便在需要时回退或用于其他本地文件操作
 class SecureFileStorage:
     """
@@ -189,28 +303,34 @@ class SecureFileStorage:
         os.makedirs(self.attachments_dir, exist_ok=True)
 
     def save_attachment(self, file, ticket_id=None, reply_id=None):
+        # 按内容寻址：相同内容的文件已存在时不再写入；磁盘上的临时文件直接移动到位
         original_name = file.name
-        file_ext = os.path.splitext(original_name)[1].lower()
-        unique_filename = f"{uuid.uuid4().hex}{file_ext}"
-        today = timezone.now().strftime("%Y/%m/%d")
-        relative_path = os.path.join("attachments", today)
-        full_upload_path = os.path.join(settings.MEDIA_ROOT, relative_path)
-        os.makedirs(full_upload_path, exist_ok=True)
-        file_path = os.path.join(relative_path, unique_filename)
+        digest = content_hash(file)
+        file_path = blob_key(digest, original_name)
         full_file_path = os.path.join(settings.MEDIA_ROOT, file_path)
-        with open(full_file_path, "wb+") as destination:
-            for chunk in file.chunks():
-                destination.write(chunk)
+        os.makedirs(os.path.dirname(full_file_path), exist_ok=True)
+        if not os.path.exists(full_file_path):
+            if hasattr(file, "temporary_file_path"):
+                file_move_safe(file.temporary_file_path(), full_file_path, allow_overwrite=True)
+            else:
+                temp_path = f"{full_file_path}.{uuid.uuid4().hex}.tmp"
+                with open(temp_path, "wb+") as destination:
+                    for chunk in file.chunks():
+                        destination.write(chunk)
+                os.replace(temp_path, full_file_path)
+            if settings.FILE_UPLOAD_PERMISSIONS is not None:
+                os.chmod(full_file_path, settings.FILE_UPLOAD_PERMISSIONS)
         file_size = os.path.getsize(full_file_path)
         content_type, _ = mimetypes.guess_type(original_name)
         if not content_type:
             content_type = "application/octet-stream"
         return {
             "original_name": original_name,
-            "file_name": unique_filename,
+            "file_name": os.path.basename(file_path),
             "file_path": file_path,
             "file_size": file_size,
             "content_type": content_type,
+            "sha256": digest,
             "ticket_id": ticket_id,
             "reply_id": reply_id,
             "upload_date": timezone.now(),
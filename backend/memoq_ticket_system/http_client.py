@@ -0,0 +1,76 @@
+"""
+Shared outbound HTTP client (webhooks, OAuth token exchanges).
+
+One process-wide requests.Session whose adapter keeps a keep-alive
+connection pool per host, so repeated calls to the same Feishu / WeCom /
+WeChat endpoint skip DNS, TCP and TLS setup. Connect and read timeouts are
+set separately (HTTP_CONNECT_TIMEOUT / HTTP_READ_TIMEOUT). Only failures to
+connect are retried (HTTP_MAX_RETRIES), for any method, since the request never
+reached the server; urllib3 already discards pooled connections the server has
+closed before reusing them. A read error or timeout is retried for GET only: a
+POST (webhook card, one-time OAuth code exchange) may have been processed and
+is left to the caller's own retry logic rather than sent twice.
+"""
+import threading
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class PooledSession(requests.Session):
+    """requests.Session that applies the default (connect, read) timeout to every call."""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.default_timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.default_timeout)
+        return super().request(method, url, **kwargs)
+
+
+def build_session():
+    retry = Retry(
+        total=getattr(settings, "HTTP_MAX_RETRIES", 2),
+        connect=getattr(settings, "HTTP_MAX_RETRIES", 2),
+        read=1,  # GET only, see allowed_methods
+        other=0,
+        status=0,
+        allowed_methods=frozenset({"GET"}),  # Methods whose read errors are retried; POST is not idempotent
+        backoff_factor=0.2,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=getattr(settings, "HTTP_POOL_HOSTS", 32),  # Hosts with a cached pool
+        pool_maxsize=getattr(settings, "HTTP_POOL_MAXSIZE", 16),  # Keep-alive connections per host
+        max_retries=retry,
+    )
+    session = PooledSession(timeout=(
+        getattr(settings, "HTTP_CONNECT_TIMEOUT", 3.05),
+        getattr(settings, "HTTP_READ_TIMEOUT", 10),
+    ))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = build_session()
+    return _session
+
+
+def get(url, **kwargs):
+    return get_session().get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    return get_session().post(url, **kwargs)
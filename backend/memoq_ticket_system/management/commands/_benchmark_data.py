@@ -0,0 +1,92 @@
+"""
+基准测试数据生成工具（供 benchmark/explain 类管理命令共用）
+
+生成的数据全部挂在公司代码以 BENCH 开头的公司下，用户名以 bench_ 开头，
+便于在开发数据库中识别和清理。
+"""
+import random
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from memoq_ticket_system.models import (
+    Company, CompanyConfig, Ticket, TicketLabel, TicketType, User,
+)
+
+BENCH_COMPANY_COUNT = 10
+BENCH_LABELS = ["bench-bug", "bench-license", "bench-server", "bench-tm", "bench-tb"]
+BENCH_DESCRIPTION = "memoQ 服务器在导入翻译记忆库时报错，附件中是完整日志。" * 40  # ~2KB, 模拟宽行
+
+
+def get_benchmark_actors():
+    """返回 (公司, 系统管理员, 技术支持, 客户)，不存在时创建"""
+    companies = []
+    for i in range(BENCH_COMPANY_COUNT):
+        company, _ = Company.objects.get_or_create(code=f"BENCH{i}", defaults={"name": f"基准测试公司{i}"})
+        CompanyConfig.objects.get_or_create(company=company)
+        companies.append(company)
+    admin, _ = User.objects.get_or_create(
+        username="bench_admin", defaults={"role": User.ROLE_SYSTEM_ADMIN, "email": "bench_admin@example.com"}
+    )
+    support, _ = User.objects.get_or_create(
+        username="bench_support", defaults={"role": User.ROLE_SUPPORT, "email": "bench_support@example.com"}
+    )
+    customer, _ = User.objects.get_or_create(
+        username="bench_customer",
+        defaults={"role": User.ROLE_CUSTOMER, "company": companies[0], "email": "bench_customer@example.com"},
+    )
+    return companies, admin, support, customer
+
+
+def seed_benchmark_tickets(count, batch_size=5000, stdout=None):
+    """批量生成 count 条工单（bulk_create，不触发 save() 和信号）"""
+    companies, admin, support, customer = get_benchmark_actors()
+    labels = [TicketLabel.objects.get_or_create(name=name)[0] for name in BENCH_LABELS]
+    ticket_type, _ = TicketType.objects.get_or_create(name="基准测试类型", parent=None)
+    statuses = [choice[0] for choice in Ticket.STATUS_CHOICES]
+    assignees = [support, admin, None]
+    now = timezone.now()
+    rng = random.Random(42)
+    label_through = Ticket.labels.through
+
+    created = 0
+    while created < count:
+        size = min(batch_size, count - created)
+        tickets = []
+        for i in range(size):
+            n = created + i
+            created_at = now - timedelta(minutes=rng.randint(0, 365 * 24 * 60))
+            last_activity_at = created_at + timedelta(minutes=rng.randint(0, 14 * 24 * 60))
+            replied = rng.random() < 0.7
+            tickets.append(Ticket(
+                title=f"基准测试工单 {n} 翻译记忆库导入失败",
+                description=BENCH_DESCRIPTION,
+                company=companies[n % len(companies)],
+                created_by=customer,
+                submitted_by=customer,
+                assigned_to=rng.choice(assignees),
+                status=rng.choice(statuses),
+                urgency=rng.randint(1, 4),
+                ticket_type=ticket_type,
+                last_activity_at=last_activity_at,
+                first_replied_at=created_at + timedelta(minutes=rng.randint(1, 600)) if replied else None,
+                sla_ir_deadline=created_at + timedelta(minutes=240),
+                sla_resolution_deadline=created_at + timedelta(minutes=2880),
+            ))
+        with transaction.atomic():
+            tickets = Ticket.objects.bulk_create(tickets, batch_size=1000)
+            if tickets and tickets[0].pk is None:  # 数据库不返回主键时重新读取
+                tickets = list(Ticket.objects.filter(title__startswith="基准测试工单").order_by("-id")[:size])
+            label_through.objects.bulk_create(
+                [
+                    label_through(ticket_id=ticket.pk, ticketlabel_id=label.pk)
+                    for ticket in tickets
+                    for label in rng.sample(labels, rng.randint(0, 2))
+                ],
+                batch_size=1000,
+            )
+        created += size
+        if stdout:
+            stdout.write(f"已生成 {created}/{count} 条工单")
+    return created
@@ -0,0 +1,45 @@
+"""
+为已有的工单回复分批建立回复检索倒排索引（ReplySearchTerm）
+
+    python manage.py backfill_reply_search_index
+    python manage.py backfill_reply_search_index --batch-size 200 --sleep 0.2 --start-id 50000
+
+按主键游标分批读取回复（普通 SELECT，不加锁），每批只在索引表上做一次
+删除 + 批量插入的短事务，因此不会阻塞对回复表的正常读写。回填期间新写入
+的回复由 TicketReply.save 自行建立索引；重复执行是幂等的。
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from memoq_ticket_system.models import TicketReply
+from memoq_ticket_system.search import index_replies
+
+
+class Command(BaseCommand):
+    help = "分批回填工单回复的检索倒排索引"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="每批处理的回复数量")
+        parser.add_argument("--start-id", type=int, default=0, help="从该回复ID之后开始（用于中断后续跑）")
+        parser.add_argument("--sleep", type=float, default=0.0, help="每批之间暂停的秒数，用于降低对线上库的压力")
+
+    def handle(self, *args, **options):
+        last_id, replies_done, terms_done = options["start_id"], 0, 0
+        while True:
+            batch = list(
+                TicketReply.objects.filter(pk__gt=last_id).order_by("pk")
+                .only("id", "ticket_id", "content", "is_internal")[: options["batch_size"]]
+            )
+            if not batch:
+                break
+            with transaction.atomic():
+                terms_done += index_replies(batch)
+            replies_done += len(batch)
+            last_id = batch[-1].pk
+            self.stdout.write(f"已索引 {replies_done} 条回复 / {terms_done} 个词项（至 ID {last_id}）")
+            if options["sleep"]:
+                time.sleep(options["sleep"])
+
+        self.stdout.write(self.style.SUCCESS(f"回复索引回填完成，共 {replies_done} 条回复"))
@@ -0,0 +1,81 @@
+"""
+对比 TicketViewSet 列表查询在去掉 DISTINCT 前后的执行计划与耗时
+
+    python manage.py benchmark_ticket_queryset --seed 100000
+    python manage.py benchmark_ticket_queryset --search bench-bug --repeat 10
+"""
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from rest_framework import filters
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from memoq_ticket_system.api.ticket_filters import TicketSearchFilter
+from memoq_ticket_system.api.views import TicketViewSet
+from memoq_ticket_system.models import User
+
+from ._benchmark_data import get_benchmark_actors, seed_benchmark_tickets
+
+
+def legacy_role_queryset(queryset, user):
+    """去掉 DISTINCT 之前 TicketViewSet.get_queryset 的角色过滤写法"""
+    queryset = queryset.distinct()
+    if user.role == User.ROLE_SUPPORT:
+        queryset = queryset.filter(Q(assigned_to=user) | Q(status='pending_assignment'))
+    elif user.role == User.ROLE_CUSTOMER:
+        queryset = queryset.filter(company=user.company).distinct()
+    return queryset
+
+
+class Command(BaseCommand):
+    help = "对比工单列表查询去掉 DISTINCT 前后的执行计划和耗时"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=0, help="先批量生成指定数量的基准测试工单")
+        parser.add_argument("--repeat", type=int, default=5, help="每个场景的重复次数（取中位数）")
+        parser.add_argument("--page-size", type=int, default=20, help="每页条数")
+        parser.add_argument("--search", default="bench-bug", help="搜索场景使用的关键字（命中 labels__name）")
+        parser.add_argument("--no-explain", action="store_true", help="只输出耗时，不输出执行计划")
+
+    def handle(self, *args, **options):
+        if options["seed"]:
+            seed_benchmark_tickets(options["seed"], stdout=self.stdout)
+
+        _, admin, support, customer = get_benchmark_actors()
+        view = TicketViewSet()
+        view.action = "list"
+        search_request = Request(APIRequestFactory().get("/api/tickets/", {"search": options["search"]}))
+
+        for user in (admin, support, customer):
+            base = view.get_list_queryset()
+            before = legacy_role_queryset(base, user).order_by("-last_activity_at")
+            after = base.visible_to(user).order_by("-last_activity_at")
+            self.run_case(f"{user.role} 列表", before, after, options)
+
+            before_search = filters.SearchFilter().filter_queryset(search_request, before, view)
+            after_search = TicketSearchFilter().filter_queryset(search_request, after, view)
+            self.run_case(f"{user.role} 搜索 '{options['search']}'", before_search, after_search, options)
+
+    def run_case(self, title, before, after, options):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"== {title} =="))
+        for label, queryset in (("修改前", before), ("修改后", after)):
+            page_ms, count_ms, count = self.measure(queryset, options["page_size"], options["repeat"])
+            self.stdout.write(f"[{label}] 首页 {page_ms:.1f} ms | COUNT {count_ms:.1f} ms | 共 {count} 条")
+            if not options["no_explain"]:
+                self.stdout.write(queryset[:options["page_size"]].explain())
+
+    @staticmethod
+    def measure(queryset, page_size, repeat):
+        page_timings, count_timings = [], []
+        count = 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(queryset.all()[:page_size])
+            page_timings.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            count = queryset.all().count()
+            count_timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(page_timings), statistics.median(count_timings), count
@@ -0,0 +1,95 @@
+"""
+对 TicketViewSet 各列表/看板端点的查询执行 EXPLAIN，出现工单表全表扫描时报错
+
+    python manage.py explain_ticket_queries --seed 100000
+    python manage.py explain_ticket_queries --verbose-plan
+
+判定规则：SQLite 下出现不带 USING 的 "SCAN memoq_ticket_system_ticket"，
+PostgreSQL 下出现 "Seq Scan on memoq_ticket_system_ticket"，即视为全表扫描。
+数据量过小时数据库本来就会选择全表扫描，请先用 --seed 生成足够的数据。
+"""
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from memoq_ticket_system.api.views import TicketViewSet
+from memoq_ticket_system.models import Ticket
+
+from ._benchmark_data import get_benchmark_actors, seed_benchmark_tickets
+
+TICKET_TABLE = Ticket._meta.db_table
+
+FULL_SCAN_PATTERNS = {
+    "sqlite": re.compile(rf"\bSCAN {TICKET_TABLE}\b(?! USING)"),
+    "postgresql": re.compile(rf"Seq Scan on {TICKET_TABLE}\b"),
+}
+
+
+class Command(BaseCommand):
+    help = "对工单列表和看板端点的查询执行 EXPLAIN，检查是否存在工单表全表扫描"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=0, help="先批量生成指定数量的基准测试工单")
+        parser.add_argument("--page-size", type=int, default=20, help="每页条数（与列表分页一致）")
+        parser.add_argument("--verbose-plan", action="store_true", help="输出每条查询的完整执行计划")
+
+    def handle(self, *args, **options):
+        pattern = FULL_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(f"不支持的数据库：{connection.vendor}")
+        if options["seed"]:
+            seed_benchmark_tickets(options["seed"], stdout=self.stdout)
+
+        companies, admin, support, customer = get_benchmark_actors()
+        failures = []
+        for title, queryset in self.endpoint_querysets(companies[0], admin, support, customer):
+            plan = queryset[:options["page_size"]].explain()
+            if pattern.search(plan):
+                failures.append(title)
+                self.stdout.write(self.style.ERROR(f"[全表扫描] {title}"))
+                self.stdout.write(plan)
+            else:
+                self.stdout.write(self.style.SUCCESS(f"[OK] {title}"))
+                if options["verbose_plan"]:
+                    self.stdout.write(plan)
+
+        if failures:
+            raise CommandError(f"{len(failures)} 条查询出现工单表全表扫描：" + "，".join(failures))
+
+    def endpoint_querysets(self, company, admin, support, customer):
+        """按角色和查询参数生成与 TicketViewSet 各端点一致的查询集"""
+        for user in (admin, support, customer):
+            list_params = [{}, {"status": "in_progress"}, {"company_id": company.pk}]
+            if user is not customer:
+                list_params.append({"assigned_to_id": support.pk})
+            for params in list_params:
+                view = self.make_view(user, "list", params)
+                yield f"{user.role} 列表 {params or ''}", view.get_queryset().order_by("-last_activity_at", "-id")
+
+        for user in (admin, support):
+            view = self.make_view(user, "pending_assignment_tickets")
+            yield f"{user.role} 待分配队列", view.get_pending_assignment_queryset()
+
+            view = self.make_view(user, "sla_ir_monitoring")
+            approaching, missed = view.get_sla_ir_querysets()
+            yield f"{user.role} 首次响应即将超时", approaching
+            yield f"{user.role} 首次响应已超时", missed
+
+            view = self.make_view(user, "sla_resolution_monitoring")
+            approaching, missed = view.get_sla_resolution_querysets()
+            yield f"{user.role} 解决即将超时", approaching
+            yield f"{user.role} 解决已超时", missed
+
+            view = self.make_view(user, "idle_tickets_monitoring")
+            yield f"{user.role} 闲置工单", view.get_idle_queryset()
+            yield f"{user.role} 闲置工单 idle_days=7", view.get_idle_queryset(7)
+
+    @staticmethod
+    def make_view(user, action, params=None):
+        request = Request(APIRequestFactory().get("/api/tickets/", params or {}))
+        request.user = user
+        view = TicketViewSet(request=request, action=action, format_kwarg=None)
+        return view
@@ -0,0 +1,23 @@
+"""
+清理超时未完成（或已完成）的附件分块上传会话
+
+    python manage.py purge_upload_sessions                  # 清理超过 ATTACHMENT_UPLOAD_SESSION_TTL_HOURS 未活动的会话，适合 cron 每小时调用
+    python manage.py purge_upload_sessions --ttl-hours 6
+
+未完成的会话会删除本地暂存文件，或取消 COS 分片上传（释放已上传的分片）；已完成的
+会话只删除记录，附件本身不受影响。
+"""
+from django.core.management.base import BaseCommand
+
+from memoq_ticket_system.uploads import purge_upload_sessions
+
+
+class Command(BaseCommand):
+    help = "清理超时未活动的附件分块上传会话及其暂存数据"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ttl-hours", type=int, help="清理超过 N 小时未活动的会话（默认 ATTACHMENT_UPLOAD_SESSION_TTL_HOURS）")
+
+    def handle(self, *args, **options):
+        purged = purge_upload_sessions(ttl_hours=options["ttl_hours"])
+        self.stdout.write(self.style.SUCCESS(f"已清理 {purged} 个上传会话"))
@@ -0,0 +1,42 @@
+"""
+重建工单全文搜索索引（TicketSearchDocument + FTS5 / tsvector）
+
+    python manage.py rebuild_search_index
+    python manage.py rebuild_search_index --batch-size 500 --start-id 120000
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from memoq_ticket_system.models import Ticket
+from memoq_ticket_system.search import get_search_backend, index_tickets
+
+
+class Command(BaseCommand):
+    help = "按主键分批重建工单全文搜索索引"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="每批处理的工单数量")
+        parser.add_argument("--start-id", type=int, default=0, help="从该工单ID之后开始（用于中断后续跑）")
+        parser.add_argument("--no-optimize", action="store_true", help="完成后不执行索引合并/统计更新")
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        if backend is None:
+            raise CommandError("当前数据库没有全文搜索索引（仅支持 SQLite FTS5 / PostgreSQL），请先执行 migrate")
+
+        last_id, total = options["start_id"], 0
+        while True:
+            ids = list(
+                Ticket.objects.filter(pk__gt=last_id).order_by("pk").values_list("pk", flat=True)[: options["batch_size"]]
+            )
+            if not ids:
+                break
+            # 每批独立事务，避免长事务持有写锁
+            with transaction.atomic():
+                total += index_tickets(ids)
+            last_id = ids[-1]
+            self.stdout.write(f"已索引 {total} 个工单（至 ID {last_id}）")
+
+        if not options["no_optimize"]:
+            backend.optimize()
+        self.stdout.write(self.style.SUCCESS(f"搜索索引重建完成，共 {total} 个工单"))
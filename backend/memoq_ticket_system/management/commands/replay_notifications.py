@@ -0,0 +1,63 @@
+"""
+重新发送发送失败（failed）或重试失败（retry_failed）的通知记录
+
+    python manage.py replay_notifications                       # 最近 24 小时内失败的通知
+    python manage.py replay_notifications --since-hours 1 --status retry_failed
+    python manage.py replay_notifications --channel email --limit 500 --dry-run
+    python manage.py replay_notifications --since-hours 1 --schedule   # 只重新排队，由 run_notification_worker 按限速发送
+
+模板通知按发件箱中保存的上下文重新渲染，预渲染的通知按原内容重新发送。每批记录
+通过并发发送器（dispatcher.py）发送，受各渠道并发上限和单次发送截止时间约束；
+记录按租约认领，不会与正在运行的 run_notification_worker 重复发送。
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from memoq_ticket_system.models import NotificationLog
+from memoq_ticket_system.outbox import NotificationWorker, schedule_replay
+
+
+class Command(BaseCommand):
+    help = "重新发送发送失败或重试失败的通知记录"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--status", nargs="+", choices=["failed", "retry_failed"], default=["failed", "retry_failed"],
+            help="要重发的记录状态",
+        )
+        parser.add_argument("--since-hours", type=float, default=24, help="只重发最近 N 小时内最后一次发送失败的记录")
+        parser.add_argument("--channel", help="只重发指定渠道（email、feishu、enterprise_wechat 等）")
+        parser.add_argument("--ticket", type=int, help="只重发指定工单的通知")
+        parser.add_argument("--batch-size", type=int, default=50, help="每批重发的记录数")
+        parser.add_argument("--limit", type=int, help="最多重发的记录数")
+        parser.add_argument("--dry-run", action="store_true", help="只统计将要重发的记录，不发送")
+        parser.add_argument(
+            "--schedule", action="store_true",
+            help="不在本进程发送，按 NOTIFICATION_REPLAY_RATE_PER_MINUTE 限速重新排队（SMTP 故障恢复后大批量重发时使用）",
+        )
+
+    def handle(self, *args, **options):
+        queryset = NotificationLog.objects.filter(
+            status__in=options["status"],
+            last_attempt_at__gte=timezone.now() - timedelta(hours=options["since_hours"]),
+        )
+        if options["channel"]:
+            queryset = queryset.filter(notification_type=options["channel"])
+        if options["ticket"]:
+            queryset = queryset.filter(ticket_id=options["ticket"])
+
+        if options["dry_run"]:
+            self.stdout.write(f"将重发 {queryset.count()} 条通知记录")
+            return
+
+        if options["schedule"]:
+            if options["limit"]:
+                queryset = queryset.filter(pk__in=list(queryset.order_by("id").values_list("id", flat=True)[:options["limit"]]))
+            self.stdout.write(self.style.SUCCESS(f"已将 {schedule_replay(queryset)} 条通知记录重新加入发送队列"))
+            return
+
+        worker = NotificationWorker(batch_size=options["batch_size"], log=self.stdout.write)
+        replayed, sent = worker.replay(queryset, limit=options["limit"])
+        self.stdout.write(self.style.SUCCESS(f"已重发 {replayed} 条通知记录，其中 {sent} 条发送成功"))
@@ -0,0 +1,41 @@
+"""
+常驻进程：投递通知发件箱（NotificationOutbox）中的邮件和 Webhook 通知
+
+    python manage.py run_notification_worker
+    python manage.py run_notification_worker --concurrency 8 --batch-size 100
+    python manage.py run_notification_worker --once      # 投递完当前到期的通知后退出
+
+信号处理和 SLA 调度只在业务事务中写入发件箱记录，渲染模板、SMTP 和 Webhook
+请求都在这里的线程池中执行。可以同时运行多个进程：记录按租约认领，进程崩溃后
+租约到期的记录会被其他进程重新处理。发送失败的 NotificationLog 按指数退避重试，
+超过 NOTIFICATION_MAX_RETRIES 次后标记为“重试失败”。
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from memoq_ticket_system.outbox import NotificationWorker
+
+
+class Command(BaseCommand):
+    help = "投递通知发件箱中的通知，并按退避策略重试发送失败的通知"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=4, help="并发发送的线程数")
+        parser.add_argument("--batch-size", type=int, default=50, help="每轮认领的记录数")
+        parser.add_argument("--poll-interval", type=float, default=2, help="没有待发送通知时的轮询间隔秒数")
+        parser.add_argument("--lease-minutes", type=int, default=5, help="认领租约时长，超时未完成的记录会被重新认领")
+        parser.add_argument("--once", action="store_true", help="投递完当前到期的通知后退出")
+
+    def handle(self, *args, **options):
+        worker = NotificationWorker(
+            concurrency=options["concurrency"],
+            batch_size=options["batch_size"],
+            poll_interval=options["poll_interval"],
+            lease=timedelta(minutes=options["lease_minutes"]),
+            log=self.stdout.write,
+        )
+        try:
+            worker.run(once=options["once"])
+        except KeyboardInterrupt:
+            self.stdout.write("通知投递进程已停止")
@@ -0,0 +1,46 @@
+"""
+常驻进程：在 SLA 截止时间 / 闲置时间到达时触发对应的通知事件
+
+    python manage.py run_sla_scheduler
+    python manage.py run_sla_scheduler --ir-warning-minutes 30 --resolution-warning-minutes 480
+    python manage.py run_sla_scheduler --once      # 只处理当前已到期的事件后退出
+
+触发的事件：ticket_sla_ir_warning / ticket_sla_ir_missed、
+ticket_sla_resolution_warning / ticket_sla_resolution_missed、ticket_idle_warning，
+均通过 NotificationManager.send_notification_by_event 发送，每个
+（工单, 事件, 截止时间）只触发一次（SLAEventDispatch 唯一约束）。
+进程内只保存未来 --horizon-minutes 内的事件，重启后从检查点按索引范围查询重建。
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from memoq_ticket_system.sla import SLAScheduler
+
+
+class Command(BaseCommand):
+    help = "按 SLA/闲置截止时间触发预警和超时通知事件"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ir-warning-minutes", type=int, default=60, help="首次响应截止前多少分钟发预警")
+        parser.add_argument("--resolution-warning-minutes", type=int, default=1440, help="解决截止前多少分钟发预警")
+        parser.add_argument("--horizon-minutes", type=int, default=60, help="内存中预加载多长时间内到期的事件")
+        parser.add_argument("--poll-interval", type=int, default=15, help="轮询工单变更（updated_at）的间隔秒数")
+        parser.add_argument("--change-overlap-seconds", type=int, default=120, help="轮询工单变更时向前重叠的秒数（覆盖提交较晚的事务）")
+        parser.add_argument("--catchup-hours", type=int, default=24, help="重启后最多补发多久之前到期的事件")
+        parser.add_argument("--once", action="store_true", help="只处理当前已到期的事件后退出")
+
+    def handle(self, *args, **options):
+        scheduler = SLAScheduler(
+            ir_warning=timedelta(minutes=options["ir_warning_minutes"]),
+            resolution_warning=timedelta(minutes=options["resolution_warning_minutes"]),
+            horizon=timedelta(minutes=options["horizon_minutes"]),
+            poll_interval=options["poll_interval"],
+            catchup=timedelta(hours=options["catchup_hours"]),
+            change_overlap=timedelta(seconds=options["change_overlap_seconds"]),
+            log=self.stdout.write,
+        )
+        try:
+            scheduler.run(once=options["once"])
+        except KeyboardInterrupt:
+            self.stdout.write("SLA 调度器已停止")
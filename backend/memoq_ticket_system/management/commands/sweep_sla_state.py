@@ -0,0 +1,53 @@
+"""
+周期性刷新工单的 SLA / 闲置状态字段（is_ir_sla_missed、is_resolution_sla_missed、is_idle）
+
+    python manage.py sweep_sla_state                 # 单次执行，适合 cron 每分钟调用
+    python manage.py sweep_sla_state --interval 60   # 常驻进程，每 60 秒执行一次
+    python manage.py sweep_sla_state --full          # 全量重算（首次部署、修改 SLA/闲置配置后）
+
+每次只处理截止时间落在「上次执行 ~ 本次执行」区间内的工单，区间起点保存在
+TaskCheckpoint 中；检查点不存在时自动做一次全量重算。
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from memoq_ticket_system.models import TaskCheckpoint
+from memoq_ticket_system.sla import rebuild_sla_state, sweep_sla_state
+
+CHECKPOINT_NAME = "sweep_sla_state"
+
+
+class Command(BaseCommand):
+    help = "按截止时间增量刷新工单的 SLA 超时和闲置标记"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="忽略检查点，全量重算所有工单的状态")
+        parser.add_argument("--interval", type=int, default=0, help="大于 0 时常驻运行，每隔指定秒数执行一次")
+
+    def handle(self, *args, **options):
+        full = options["full"]
+        while True:
+            self.sweep(full)
+            full = False
+            if options["interval"] <= 0:
+                break
+            time.sleep(options["interval"])
+
+    def sweep(self, full):
+        # 检查点行加锁，多个 sweeper 同时运行时串行执行，且失败时不会跳过区间
+        with transaction.atomic():
+            checkpoint, _ = TaskCheckpoint.objects.select_for_update().get_or_create(name=CHECKPOINT_NAME)
+            now = timezone.now()
+            started = time.monotonic()
+            if full or checkpoint.last_run_at is None:
+                rows = rebuild_sla_state(now)
+                summary = f"全量重算 {rows} 个工单"
+            else:
+                counts = sweep_sla_state(checkpoint.last_run_at, now)
+                summary = "，".join(f"{flag} +{count}" for flag, count in counts.items())
+            checkpoint.last_run_at = now
+            checkpoint.save(update_fields=["last_run_at", "updated_at"])
+        self.stdout.write(f"[{now:%Y-%m-%d %H:%M:%S}] {summary}（{(time.monotonic() - started) * 1000:.1f} ms）")
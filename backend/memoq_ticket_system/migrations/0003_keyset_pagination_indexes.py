@@ -0,0 +1,21 @@
+# Generated by Django 4.0 on 2026-10-18 10:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memoq_ticket_system', '0002_companyssoprovider_notificationtemplate_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notificationlog',
+            index=models.Index(fields=['-created_at', '-id'], name='memoq_ticke_created_fe9e39_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['-last_activity_at', '-id'], name='memoq_ticke_last_ac_12be6c_idx'),
+        ),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 4.0 on 2026-10-18 10:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from memoq_ticket_system.search import build_document
+
+DOCUMENT_TABLE = "memoq_ticket_system_ticketsearchdocument"
+FTS_TABLE = "memoq_ticket_system_ticketsearch_fts"
+
+SQLITE_FORWARD = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        title, body, content='{DOCUMENT_TABLE}', content_rowid='ticket_id', tokenize='unicode61'
+    )""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.ticket_id, new.title, new.body);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.ticket_id, old.title, old.body);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.ticket_id, old.title, old.body);
+        INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.ticket_id, new.title, new.body);
+    END""",
+]
+SQLITE_BACKWARD = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+POSTGRES_FORWARD = [
+    f"""ALTER TABLE {DOCUMENT_TABLE} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', body), 'B')
+    ) STORED""",
+    f"CREATE INDEX {DOCUMENT_TABLE}_search_gin ON {DOCUMENT_TABLE} USING GIN (search_vector)",
+]
+POSTGRES_BACKWARD = [
+    f"DROP INDEX IF EXISTS {DOCUMENT_TABLE}_search_gin",
+    f"ALTER TABLE {DOCUMENT_TABLE} DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def _run_for_vendor(statements):
+    # The search index is engine specific; other databases keep the LIKE-based search filter.
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+def index_existing_tickets(apps, schema_editor):
+    # Same documents as search.index_tickets, written through the historical models; on SQLite
+    # the triggers above copy them into the FTS table. rebuild_search_index re-runs this later.
+    Ticket = apps.get_model('memoq_ticket_system', 'Ticket')
+    TicketSearchDocument = apps.get_model('memoq_ticket_system', 'TicketSearchDocument')
+    tickets = Ticket.objects.select_related(
+        'company', 'created_by', 'submitted_by', 'assigned_to', 'ticket_type'
+    ).prefetch_related('labels').order_by('pk')
+    last_id = 0
+    while True:
+        batch = list(tickets.filter(pk__gt=last_id)[:1000])
+        if not batch:
+            break
+        documents = []
+        for ticket in batch:
+            title, body = build_document(ticket)
+            documents.append(TicketSearchDocument(ticket_id=ticket.pk, title=title, body=body))
+        TicketSearchDocument.objects.bulk_create(documents)
+        last_id = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memoq_ticket_system', '0003_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketSearchDocument',
+            fields=[
+                ('ticket', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='memoq_ticket_system.ticket', verbose_name='工单')),
+                ('title', models.TextField(blank=True, default='', verbose_name='标题分词')),
+                ('body', models.TextField(blank=True, default='', verbose_name='正文分词')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': '工单搜索文档',
+                'verbose_name_plural': '工单搜索文档',
+            },
+        ),
+        migrations.RunPython(
+            _run_for_vendor({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            _run_for_vendor({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}),
+        ),
+        migrations.RunPython(index_existing_tickets, migrations.RunPython.noop),
+    ]
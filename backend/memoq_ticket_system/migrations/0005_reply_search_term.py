@@ -0,0 +1,64 @@
+# Generated by Django 4.0 on 2026-10-18 11:07
+
+from collections import Counter
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from memoq_ticket_system.search import MAX_TERM_LENGTH, tokenize
+
+
+def index_existing_replies(apps, schema_editor):
+    # Same rows as search.index_replies, written through the historical models so existing
+    # replies are searchable right after deploy; backfill_reply_search_index re-runs this later.
+    TicketReply = apps.get_model('memoq_ticket_system', 'TicketReply')
+    ReplySearchTerm = apps.get_model('memoq_ticket_system', 'ReplySearchTerm')
+    replies = TicketReply.objects.only('id', 'ticket_id', 'content', 'is_internal').order_by('pk')
+    last_id = 0
+    while True:
+        batch = list(replies.filter(pk__gt=last_id)[:500])
+        if not batch:
+            break
+        ReplySearchTerm.objects.bulk_create([
+            ReplySearchTerm(
+                term=term, reply_id=reply.pk, ticket_id=reply.ticket_id,
+                term_frequency=frequency, is_internal=reply.is_internal,
+            )
+            for reply in batch
+            for term, frequency in Counter(t for t in tokenize(reply.content) if len(t) <= MAX_TERM_LENGTH).items()
+        ], batch_size=2000)
+        last_id = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memoq_ticket_system', '0004_ticket_search_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReplySearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, verbose_name='词项')),
+                ('term_frequency', models.PositiveIntegerField(default=1, verbose_name='词频')),
+                ('is_internal', models.BooleanField(default=False, verbose_name='是否内部备注')),
+                ('reply', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='memoq_ticket_system.ticketreply', verbose_name='回复')),
+                ('ticket', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reply_search_terms', to='memoq_ticket_system.ticket', verbose_name='工单')),
+            ],
+            options={
+                'verbose_name': '回复检索词项',
+                'verbose_name_plural': '回复检索词项',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='replysearchterm',
+            index=models.Index(fields=['term', 'ticket'], name='memoq_ticke_term_03fea2_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='replysearchterm',
+            unique_together={('reply', 'term')},
+        ),
+        migrations.RunPython(index_existing_replies, migrations.RunPython.noop),
+    ]
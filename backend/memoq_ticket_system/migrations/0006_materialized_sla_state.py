@@ -0,0 +1,56 @@
+# Generated by Django 4.0 on 2026-10-18 11:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memoq_ticket_system', '0005_reply_search_term'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='任务名称')),
+                ('last_run_at', models.DateTimeField(blank=True, null=True, verbose_name='上次处理截至时间')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': '后台任务检查点',
+                'verbose_name_plural': '后台任务检查点',
+            },
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='idle_deadline',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='闲置截止时间'),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='is_idle',
+            field=models.BooleanField(db_index=True, default=False, verbose_name='是否闲置'),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='is_ir_sla_missed',
+            field=models.BooleanField(db_index=True, default=False, verbose_name='首次响应SLA是否已错过'),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='is_resolution_sla_missed',
+            field=models.BooleanField(db_index=True, default=False, verbose_name='解决SLA是否已错过'),
+        ),
+        migrations.AlterField(
+            model_name='ticket',
+            name='sla_ir_deadline',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='SLA首次响应截止时间'),
+        ),
+        migrations.AlterField(
+            model_name='ticket',
+            name='sla_resolution_deadline',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='SLA解决截止时间'),
+        ),
+    ]
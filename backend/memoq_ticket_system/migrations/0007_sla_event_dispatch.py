@@ -0,0 +1,36 @@
+# Generated by Django 4.0 on 2026-10-18 11:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memoq_ticket_system', '0006_materialized_sla_state'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ticket',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='SLAEventDispatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('ticket_created', '工单创建'), ('ticket_status_changed', '工单状态变更'), ('ticket_replied_by_support', '技术支持回复'), ('ticket_replied_by_customer', '客户回复'), ('ticket_assigned', '工单分配'), ('ticket_transferred', '工单转移'), ('ticket_paused', '工单暂停'), ('ticket_sla_ir_warning', 'SLA首次响应预警'), ('ticket_sla_ir_missed', 'SLA首次响应错过'), ('ticket_sla_resolution_warning', 'SLA解决预警'), ('ticket_sla_resolution_missed', 'SLA解决错过'), ('ticket_idle_warning', '工单闲置预警')], max_length=50, verbose_name='事件类型')),
+                ('deadline', models.DateTimeField(verbose_name='对应截止时间')),
+                ('due_at', models.DateTimeField(verbose_name='计划触发时间')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('dispatched_at', models.DateTimeField(blank=True, null=True, verbose_name='通知发出时间')),
+                ('ticket', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sla_event_dispatches', to='memoq_ticket_system.ticket', verbose_name='工单')),
+            ],
+            options={
+                'verbose_name': 'SLA事件触发记录',
+                'verbose_name_plural': 'SLA事件触发记录',
+                'unique_together': {('ticket', 'event_type', 'deadline')},
+            },
+        ),
+    ]
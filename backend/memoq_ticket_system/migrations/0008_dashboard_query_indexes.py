@@ -0,0 +1,69 @@
+# Generated by Django 4.0 on 2026-10-18 11:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memoq_ticket_system', '0007_sla_event_dispatch'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ticket',
+            name='is_idle',
+            field=models.BooleanField(default=False, verbose_name='是否闲置'),
+        ),
+        migrations.AlterField(
+            model_name='ticket',
+            name='is_ir_sla_missed',
+            field=models.BooleanField(default=False, verbose_name='首次响应SLA是否已错过'),
+        ),
+        migrations.AlterField(
+            model_name='ticket',
+            name='is_resolution_sla_missed',
+            field=models.BooleanField(default=False, verbose_name='解决SLA是否已错过'),
+        ),
+        migrations.AlterField(
+            model_name='ticket',
+            name='status',
+            field=models.CharField(choices=[('new_issue', '新问题'), ('pending_assignment', '待分配'), ('in_progress', '处理中'), ('waiting_for_customer', '等待客户回复'), ('resolved', '已解决'), ('closed', '已关闭'), ('customer_follow_up', '追问'), ('paused', '暂停')], default='new_issue', max_length=30, verbose_name='状态'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['status', '-last_activity_at', '-id'], name='memoq_ticke_status_89ea7c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['company', '-last_activity_at', '-id'], name='memoq_ticke_company_586abc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['assigned_to', '-last_activity_at', '-id'], name='memoq_ticke_assigne_232d69_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['status', 'created_at'], name='memoq_ticke_status_52108f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(condition=models.Q(('first_replied_at__isnull', True), models.Q(('status__in', ('closed', 'resolved', 'paused')), _negated=True)), fields=['sla_ir_deadline'], name='ticket_open_ir_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(condition=models.Q(('is_ir_sla_missed', True), models.Q(('status__in', ('closed', 'resolved', 'paused')), _negated=True)), fields=['sla_ir_deadline'], name='ticket_open_ir_missed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(condition=models.Q(('resolved_at__isnull', True), models.Q(('status__in', ('closed', 'resolved', 'paused')), _negated=True)), fields=['sla_resolution_deadline'], name='ticket_open_res_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(condition=models.Q(('is_resolution_sla_missed', True), models.Q(('status__in', ('closed', 'resolved', 'paused')), _negated=True)), fields=['sla_resolution_deadline'], name='ticket_open_res_missed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(condition=models.Q(('is_idle', True)), fields=['last_activity_at'], name='ticket_idle_idx'),
+        ),
+    ]
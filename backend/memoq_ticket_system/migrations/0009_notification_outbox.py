@@ -0,0 +1,65 @@
+# Generated by Django 4.0 on 2026-10-18 11:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memoq_ticket_system', '0008_dashboard_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationlog',
+            name='last_attempt_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='最近一次发送时间'),
+        ),
+        migrations.AddField(
+            model_name='notificationlog',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='下次重试时间'),
+        ),
+        migrations.AddField(
+            model_name='notificationlog',
+            name='template',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='logs', to='memoq_ticket_system.notificationtemplate', verbose_name='通知模板'),
+        ),
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(blank=True, max_length=50, verbose_name='事件类型')),
+                ('context', models.JSONField(blank=True, default=dict, verbose_name='模板上下文')),
+                ('channel', models.CharField(blank=True, max_length=30, verbose_name='通知渠道')),
+                ('recipient_info', models.CharField(blank=True, max_length=255, verbose_name='接收者信息')),
+                ('subject', models.TextField(blank=True, verbose_name='主题')),
+                ('body', models.TextField(blank=True, verbose_name='内容')),
+                ('status', models.CharField(choices=[('pending', '待处理'), ('processing', '处理中'), ('done', '已处理'), ('failed', '处理失败')], default='pending', max_length=20, verbose_name='状态')),
+                ('attempts', models.IntegerField(default=0, verbose_name='处理次数')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='下次处理时间')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='处理租约到期时间')),
+                ('last_error', models.TextField(blank=True, verbose_name='最近一次错误')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='处理完成时间')),
+                ('company', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notification_outbox', to='memoq_ticket_system.company', verbose_name='公司')),
+                ('target_user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notification_outbox', to='memoq_ticket_system.user', verbose_name='目标用户')),
+                ('ticket', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notification_outbox', to='memoq_ticket_system.ticket', verbose_name='工单')),
+            ],
+            options={
+                'verbose_name': '通知发件箱',
+                'verbose_name_plural': '通知发件箱',
+            },
+        ),
+        migrations.AddField(
+            model_name='notificationlog',
+            name='outbox',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='logs', to='memoq_ticket_system.notificationoutbox', verbose_name='发件箱记录'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationoutbox',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='memoq_ticke_status_bafd7e_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.0 on 2026-10-18 11:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memoq_ticket_system', '0009_notification_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookRateLimit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True, verbose_name='Webhook 标识')),
+                ('tokens', models.FloatField(verbose_name='剩余令牌数')),
+                ('updated', models.FloatField(verbose_name='令牌更新时间')),
+            ],
+            options={
+                'verbose_name': 'Webhook 限流桶',
+                'verbose_name_plural': 'Webhook 限流桶',
+            },
+        ),
+        migrations.AlterField(
+            model_name='notificationlog',
+            name='status',
+            field=models.CharField(choices=[('pending', '待发送'), ('sent', '已发送'), ('failed', '发送失败'), ('retry_failed', '重试失败'), ('throttled', '限流排队')], default='pending', max_length=20, verbose_name='状态'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.0 on 2026-10-18 11:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memoq_ticket_system', '0010_webhook_rate_limit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationconfig',
+            name='digest_enabled',
+            field=models.BooleanField(default=False, verbose_name='启用邮件汇总'),
+        ),
+        migrations.AddField(
+            model_name='notificationconfig',
+            name='digest_interval_minutes',
+            field=models.PositiveIntegerField(default=30, verbose_name='汇总间隔(分钟)'),
+        ),
+        migrations.AlterField(
+            model_name='notificationlog',
+            name='status',
+            field=models.CharField(choices=[('pending', '待发送'), ('sent', '已发送'), ('failed', '发送失败'), ('retry_failed', '重试失败'), ('throttled', '限流排队'), ('digest', '等待汇总')], default='pending', max_length=20, verbose_name='状态'),
+        ),
+        migrations.AlterField(
+            model_name='notificationtemplate',
+            name='event_type',
+            field=models.CharField(choices=[('ticket_created', '工单创建'), ('ticket_status_changed', '工单状态变更'), ('ticket_replied_by_support', '技术支持回复'), ('ticket_replied_by_customer', '客户回复'), ('ticket_assigned', '工单分配'), ('ticket_transferred', '工单转移'), ('ticket_paused', '工单暂停'), ('ticket_sla_ir_warning', 'SLA首次响应预警'), ('ticket_sla_ir_missed', 'SLA首次响应错过'), ('ticket_sla_resolution_warning', 'SLA解决预警'), ('ticket_sla_resolution_missed', 'SLA解决错过'), ('ticket_idle_warning', '工单闲置预警'), ('notification_digest', '通知汇总')], max_length=50, verbose_name='事件类型'),
+        ),
+        migrations.AlterField(
+            model_name='slaeventdispatch',
+            name='event_type',
+            field=models.CharField(choices=[('ticket_created', '工单创建'), ('ticket_status_changed', '工单状态变更'), ('ticket_replied_by_support', '技术支持回复'), ('ticket_replied_by_customer', '客户回复'), ('ticket_assigned', '工单分配'), ('ticket_transferred', '工单转移'), ('ticket_paused', '工单暂停'), ('ticket_sla_ir_warning', 'SLA首次响应预警'), ('ticket_sla_ir_missed', 'SLA首次响应错过'), ('ticket_sla_resolution_warning', 'SLA解决预警'), ('ticket_sla_resolution_missed', 'SLA解决错过'), ('ticket_idle_warning', '工单闲置预警'), ('notification_digest', '通知汇总')], max_length=50, verbose_name='事件类型'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.0 on 2026-10-18 11:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memoq_ticket_system', '0011_notification_digest_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationlog',
+            name='dedupe_key',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='去重键'),
+        ),
+        migrations.AddField(
+            model_name='notificationlog',
+            name='suppressed_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='已合并的重复通知数'),
+        ),
+    ]
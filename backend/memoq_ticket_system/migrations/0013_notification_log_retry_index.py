@@ -0,0 +1,17 @@
+# Generated by Django 4.0 on 2026-10-18 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memoq_ticket_system', '0012_notification_dedupe'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notificationlog',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='memoq_ticke_status_2aad15_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.0 on 2026-10-18 11:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memoq_ticket_system', '0013_notification_log_retry_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttachmentUploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('file_name', models.CharField(max_length=255, verbose_name='文件名')),
+                ('file_type', models.CharField(max_length=100, verbose_name='文件类型')),
+                ('file_size', models.BigIntegerField(verbose_name='文件大小(字节)')),
+                ('chunk_size', models.IntegerField(verbose_name='分块大小(字节)')),
+                ('received', models.BigIntegerField(default=0, verbose_name='已接收字节数')),
+                ('storage_type', models.CharField(choices=[('local', '本地'), ('cos', '腾讯云COS')], max_length=10, verbose_name='暂存方式')),
+                ('staging_path', models.CharField(max_length=500, verbose_name='暂存位置')),
+                ('upload_id', models.CharField(blank=True, max_length=255, verbose_name='COS 分片上传ID')),
+                ('parts', models.JSONField(blank=True, default=list, verbose_name='COS 已上传分片')),
+                ('status', models.CharField(choices=[('uploading', '上传中'), ('completed', '已完成')], default='uploading', max_length=20, verbose_name='状态')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('attachment', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload_session', to='memoq_ticket_system.attachment', verbose_name='附件')),
+                ('reply', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='memoq_ticket_system.ticketreply', verbose_name='关联回复')),
+                ('ticket', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='memoq_ticket_system.ticket', verbose_name='关联工单')),
+                ('uploaded_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='memoq_ticket_system.user', verbose_name='上传人')),
+            ],
+            options={
+                'verbose_name': '附件上传会话',
+                'verbose_name_plural': '附件上传会话',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='attachmentuploadsession',
+            index=models.Index(fields=['updated_at'], name='memoq_ticke_updated_0c019c_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.0 on 2026-10-18 11:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memoq_ticket_system', '0014_attachment_upload_session'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttachmentBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='内容哈希')),
+                ('size', models.BigIntegerField(verbose_name='文件大小(字节)')),
+                ('storage_type', models.CharField(choices=[('local', '本地'), ('cos', '腾讯云COS')], max_length=10, verbose_name='存储方式')),
+                ('path', models.CharField(max_length=500, verbose_name='存储路径')),
+                ('ref_count', models.PositiveIntegerField(default=1, verbose_name='引用数')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': '附件内容',
+                'verbose_name_plural': '附件内容',
+            },
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='attachments', to='memoq_ticket_system.attachmentblob', verbose_name='附件内容'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0 on 2026-10-18 11:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memoq_ticket_system', '0015_attachment_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachment',
+            name='download_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='下载次数'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0 on 2026-10-18 11:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memoq_ticket_system', '0016_attachment_download_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationlog',
+            name='claim_token',
+            field=models.CharField(blank=True, max_length=32, null=True, verbose_name='认领标识'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0 on 2026-10-18 11:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memoq_ticket_system', '0017_notification_log_claim_token'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='event_key',
+            field=models.CharField(blank=True, max_length=100, verbose_name='来源事件'),
+        ),
+    ]
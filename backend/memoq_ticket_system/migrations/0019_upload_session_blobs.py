@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+def create_upload_blobs(apps, schema_editor):
+    # COS resumable uploads finalized before they got a blob: their session row was the
+    # only record of where the file lives, and it is purged after the session TTL.
+    AttachmentBlob = apps.get_model('memoq_ticket_system', 'AttachmentBlob')
+    AttachmentUploadSession = apps.get_model('memoq_ticket_system', 'AttachmentUploadSession')
+    sessions = AttachmentUploadSession.objects.filter(
+        status='completed', storage_type='cos', attachment__isnull=False, attachment__blob__isnull=True
+    ).select_related('attachment')
+    for session in sessions.iterator():
+        attachment = session.attachment
+        attachment.blob = AttachmentBlob.objects.create(
+            sha256=f"upload:{session.id.hex}", size=session.file_size, storage_type='cos', path=session.staging_path
+        )
+        attachment.save(update_fields=['blob'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memoq_ticket_system', '0018_notification_outbox_event_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_upload_blobs, migrations.RunPython.noop),
+    ]
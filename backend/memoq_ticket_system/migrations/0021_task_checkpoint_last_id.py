@@ -0,0 +1,18 @@
+# Generated by Django 4.0 on 2026-10-18 12:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memoq_ticket_system', '0020_cache_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskcheckpoint',
+            name='last_id',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='上次处理截至ID'),
+        ),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.utils import timezone
 from mptt.models import MPTTModel, TreeForeignKey
@@ -207,6 +208,25 @@ class TicketLabel(models.Model):
         verbose_name = "工单标签"
         verbose_name_plural = "工单标签"
 
+class TicketQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """
+        Tickets the user may see, by role. Every branch filters on columns of the
+        ticket row itself, so the result never contains duplicate rows.
+        """
+        if user.role in (User.ROLE_SYSTEM_ADMIN, User.ROLE_TECHNICAL_SUPPORT_ADMIN):
+            return self
+        if user.role == User.ROLE_SUPPORT:
+            return self.filter(Q(assigned_to=user) | Q(status='pending_assignment'))
+        if user.role == User.ROLE_CUSTOMER and user.company_id:
+            return self.filter(company_id=user.company_id)
+        return self.none()
+
+
+# Excluded by the dashboards; never idle, no SLA events. Module level so Ticket.Meta's partial indexes can use it.
+TICKET_INACTIVE_STATUSES = ("closed", "resolved", "paused")
+
+
 class Ticket(models.Model):
     # ... (Existing CHOICES) ...
     STATUS_CHOICES = (
@@ -223,6 +243,8 @@ class Ticket(models.Model):
         ("feature_request", "新需求"), ("other", "其他"),
     )
     URGENCY_CHOICES = ((1, "紧急"), (2, "高"), (3, "中"), (4, "低"))
+    INACTIVE_STATUSES = TICKET_INACTIVE_STATUSES
+    SLA_STATE_FIELDS = ("idle_deadline", "is_ir_sla_missed", "is_resolution_sla_missed", "is_idle")
 
     title = models.CharField(max_length=255, verbose_name="标题")
     description = models.TextField(verbose_name="描述")
@@ -230,7 +252,7 @@ class Ticket(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, related_name="created_tickets", null=True, blank=True, verbose_name="创建人")
     submitted_by = models.ForeignKey(User, on_delete=models.SET_NULL, related_name="submitted_tickets", verbose_name="提交人", null=True, blank=True)
     assigned_to = models.ForeignKey(User, on_delete=models.SET_NULL, related_name="assigned_tickets", null=True, blank=True, verbose_name="负责人")
-    status = models.CharField(max_length=30, choices=STATUS_CHOICES, default="new_issue", verbose_name="状态", db_index=True)
+    status = models.CharField(max_length=30, choices=STATUS_CHOICES, default="new_issue", verbose_name="状态") # Leading column of the composite indexes in Meta
     priority = models.IntegerField(default=3, verbose_name="优先级 (系统)")
     urgency = models.IntegerField(choices=URGENCY_CHOICES, default=3, verbose_name="紧急度 (用户/支持设定)")
     category = models.CharField(max_length=100, verbose_name="类别", blank=True, null=True) # Potentially TicketType based
@@ -238,7 +260,7 @@ class Ticket(models.Model):
     contact_method = models.CharField(max_length=30, choices=CONTACT_METHOD_CHOICES, default="email", verbose_name="联系方式")
     contact_info = models.CharField(max_length=255, verbose_name="联系信息", blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True) # Polled by run_sla_scheduler for changed tickets
     last_activity_at = models.DateTimeField(default=timezone.now, verbose_name="最后活动时间", db_index=True)
     first_replied_at = models.DateTimeField(null=True, blank=True, verbose_name="首次回复时间", db_index=True) # For IR SLA
     last_customer_reply_at = models.DateTimeField(null=True, blank=True, verbose_name="客户最后回复时间")
@@ -255,17 +277,25 @@ class Ticket(models.Model):
     ticket_url_slug = models.SlugField(max_length=100, unique=True, null=True, blank=True, verbose_name="工单URL标识", db_index=True)
 
     # SLA Deadlines
-    sla_ir_deadline = models.DateTimeField(null=True, blank=True, verbose_name="SLA首次响应截止时间")
-    sla_resolution_deadline = models.DateTimeField(null=True, blank=True, verbose_name="SLA解决截止时间")
-    # is_ir_sla_missed = models.BooleanField(default=False, verbose_name="首次响应SLA是否已错过")
-    # is_resolution_sla_missed = models.BooleanField(default=False, verbose_name="解决SLA是否已错过")
-    # is_idle = models.BooleanField(default=False, verbose_name="是否闲置")
+    sla_ir_deadline = models.DateTimeField(null=True, blank=True, verbose_name="SLA首次响应截止时间", db_index=True)
+    sla_resolution_deadline = models.DateTimeField(null=True, blank=True, verbose_name="SLA解决截止时间", db_index=True)
+    # Materialized SLA / idle state: computed on save and flipped by the sweep_sla_state command
+    # once a deadline passes, so dashboards filter on indexed flags instead of re-evaluating deadlines.
+    idle_deadline = models.DateTimeField(null=True, blank=True, verbose_name="闲置截止时间", db_index=True) # last_activity_at + company idle_timeout_minutes
+    is_ir_sla_missed = models.BooleanField(default=False, verbose_name="首次响应SLA是否已错过") # Indexed via the partial indexes in Meta
+    is_resolution_sla_missed = models.BooleanField(default=False, verbose_name="解决SLA是否已错过")
+    is_idle = models.BooleanField(default=False, verbose_name="是否闲置")
+
+    objects = TicketQuerySet.as_manager()
 
     def save(self, *args, **kwargs):
         if not self.submitted_by_id and self.created_by_id:
             self.submitted_by = self.created_by
         # SLA deadline calculation logic could go here or in a signal
         is_new = self._state.adding
+        self.refresh_sla_state()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | set(self.SLA_STATE_FIELDS)
         super().save(*args, **kwargs)
         if is_new:
             self.calculate_sla_deadlines() # Calculate on creation
@@ -281,13 +311,60 @@ class Ticket(models.Model):
                 self.sla_resolution_deadline = self.created_at + timezone.timedelta(minutes=config.sla_resolution_minutes)
         # Consider business hours if applicable
 
+    def refresh_sla_state(self, now=None):
+        """
+        Recompute the materialized SLA / idle fields from the deadlines and reply
+        timestamps. Deadlines that pass later without a write are picked up by
+        sweep_sla_state.
+        """
+        now = now or timezone.now()
+        config = self.company.config if self.company_id and hasattr(self.company, 'config') else None
+        self.idle_deadline = (
+            self.last_activity_at + timezone.timedelta(minutes=config.idle_timeout_minutes)
+            if config and self.last_activity_at else None
+        )
+        self.is_ir_sla_missed = bool(self.sla_ir_deadline) and (self.first_replied_at or now) > self.sla_ir_deadline
+        self.is_resolution_sla_missed = bool(self.sla_resolution_deadline) and (self.resolved_at or now) > self.sla_resolution_deadline
+        self.is_idle = (
+            self.status not in self.INACTIVE_STATUSES
+            and self.idle_deadline is not None and now > self.idle_deadline
+        )
+
     def __str__(self): return f"{self.id} - {self.title}"
     class Meta:
         verbose_name = "工单"
         verbose_name_plural = "工单"
-        # Removed old indexes, new ones will be generated by makemigrations
-        # Or add them back carefully if they are still exactly what you need.
-        # For now, relying on db_index=True on individual fields.
+        indexes = [
+            models.Index(fields=['-last_activity_at', '-id']), # Keyset (cursor) pagination of ticket lists
+            # List filtered by role / query params, in list order (TicketViewSet.get_queryset)
+            models.Index(fields=['status', '-last_activity_at', '-id']), # ?status=, support's pending_assignment branch
+            models.Index(fields=['company', '-last_activity_at', '-id']), # customers, ?company_id=
+            models.Index(fields=['assigned_to', '-last_activity_at', '-id']), # support's own tickets, ?assigned_to_id=
+            models.Index(fields=['status', 'created_at']), # pending_assignment_tickets queue
+            # Dashboard widgets: partial indexes over open tickets only, ordered like the widget
+            models.Index(fields=['sla_ir_deadline'], name='ticket_open_ir_pending_idx',
+                         condition=Q(first_replied_at__isnull=True) & ~Q(status__in=TICKET_INACTIVE_STATUSES)),
+            models.Index(fields=['sla_ir_deadline'], name='ticket_open_ir_missed_idx',
+                         condition=Q(is_ir_sla_missed=True) & ~Q(status__in=TICKET_INACTIVE_STATUSES)),
+            models.Index(fields=['sla_resolution_deadline'], name='ticket_open_res_pending_idx',
+                         condition=Q(resolved_at__isnull=True) & ~Q(status__in=TICKET_INACTIVE_STATUSES)),
+            models.Index(fields=['sla_resolution_deadline'], name='ticket_open_res_missed_idx',
+                         condition=Q(is_resolution_sla_missed=True) & ~Q(status__in=TICKET_INACTIVE_STATUSES)),
+            models.Index(fields=['last_activity_at'], name='ticket_idle_idx', condition=Q(is_idle=True)), # is_idle implies open
+        ]
+
+class TaskCheckpoint(models.Model):
+    # High-water marks of periodic management commands (e.g. sweep_sla_state), so each
+    # run only looks at the rows that changed or crossed a deadline since the last one.
+    name = models.CharField(max_length=100, unique=True, verbose_name="任务名称")
+    last_run_at = models.DateTimeField(null=True, blank=True, verbose_name="上次处理截至时间")
+    last_id = models.BigIntegerField(null=True, blank=True, verbose_name="上次处理截至ID") # Tie-break among rows sharing last_run_at
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self): return f"{self.name} @ {self.last_run_at}"
+    class Meta:
+        verbose_name = "后台任务检查点"
+        verbose_name_plural = "后台任务检查点"
 
 class TicketReply(models.Model):
     # ... (Existing model content, ensure user uses SET_NULL and allows null) ...
@@ -301,7 +378,14 @@ class TicketReply(models.Model):
     email_sent_at = models.DateTimeField(null=True, blank=True, verbose_name="邮件发送时间")
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Keep the reply inverted index in step with the reply row itself
+            from .search import index_reply
+            index_reply(self)
+            self._touch_ticket()
+
+    def _touch_ticket(self):
         # Update ticket's last_activity_at and potentially customer/support reply times
         ticket = self.ticket
         ticket.last_activity_at = self.created_at
@@ -322,6 +406,54 @@ class TicketReply(models.Model):
         verbose_name_plural = "工单回复"
         ordering = ["created_at"]
 
+class TicketSearchDocument(models.Model):
+    # Pre-tokenized searchable text of a ticket (see memoq_ticket_system.search).
+    # The FTS5 table (SQLite) / tsvector column + GIN index (PostgreSQL) built on
+    # top of this table are created by migration 0004, outside the ORM.
+    ticket = models.OneToOneField(Ticket, on_delete=models.CASCADE, primary_key=True, related_name="search_document", verbose_name="工单")
+    title = models.TextField(blank=True, default="", verbose_name="标题分词")
+    body = models.TextField(blank=True, default="", verbose_name="正文分词")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "工单搜索文档"
+        verbose_name_plural = "工单搜索文档"
+
+class ReplySearchTerm(models.Model):
+    # Inverted index over TicketReply.content: one row per (reply, term), maintained
+    # by TicketReply.save (see memoq_ticket_system.search.index_reply).
+    term = models.CharField(max_length=64, verbose_name="词项")
+    reply = models.ForeignKey(TicketReply, on_delete=models.CASCADE, related_name="search_terms", verbose_name="回复")
+    ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE, related_name="reply_search_terms", verbose_name="工单")
+    term_frequency = models.PositiveIntegerField(default=1, verbose_name="词频")
+    is_internal = models.BooleanField(default=False, verbose_name="是否内部备注") # Copied from the reply so customer searches need no join
+
+    class Meta:
+        verbose_name = "回复检索词项"
+        verbose_name_plural = "回复检索词项"
+        unique_together = ('reply', 'term')
+        indexes = [
+            models.Index(fields=['term', 'ticket']), # term -> tickets lookups of /tickets/search/
+        ]
+
+
+class AttachmentBlob(models.Model):
+    # One stored object per distinct attachment content (see uploads.py): attachments with the same
+    # SHA-256 share it, and the object is deleted when the last of them is (ref_count 0 marks a blob
+    # whose object is being deleted; the row goes with it).
+    STORAGE_CHOICES = (("local", "本地"), ("cos", "腾讯云COS"))
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name="内容哈希")
+    size = models.BigIntegerField(verbose_name="文件大小(字节)")
+    storage_type = models.CharField(max_length=10, choices=STORAGE_CHOICES, verbose_name="存储方式")
+    path = models.CharField(max_length=500, verbose_name="存储路径") # MEDIA_ROOT-relative path or COS key
+    ref_count = models.PositiveIntegerField(default=1, verbose_name="引用数")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self): return self.sha256
+    class Meta:
+        verbose_name = "附件内容"
+        verbose_name_plural = "附件内容"
+
 
 class Attachment(models.Model):
     # ... (Existing model content, ensure uploaded_by uses SET_NULL and allows null) ...
@@ -332,6 +464,8 @@ class Attachment(models.Model):
     ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE, related_name="attachments", null=True, blank=True, verbose_name="关联工单")
     reply = models.ForeignKey(TicketReply, on_delete=models.CASCADE, related_name="attachments", null=True, blank=True, verbose_name="关联回复")
     uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, related_name="uploaded_attachments", null=True, blank=True, verbose_name="上传人")
+    blob = models.ForeignKey(AttachmentBlob, on_delete=models.PROTECT, related_name="attachments", null=True, blank=True, verbose_name="附件内容") # Null for attachments stored before deduplication
+    download_count = models.PositiveIntegerField(default=0, verbose_name="下载次数") # Written in batches by downloads.download_counts
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self): return self.file_name
@@ -340,6 +474,37 @@ class Attachment(models.Model):
         verbose_name_plural = "附件"
 
 
+class AttachmentUploadSession(models.Model):
+    # Resumable upload of one attachment (see uploads.py): the client PUTs chunk_size chunks at
+    # their offsets, staged on local disk or as COS multipart parts, and the Attachment row is
+    # only created on finalize. Idle sessions are removed by purge_upload_sessions.
+    STATUS_CHOICES = (("uploading", "上传中"), ("completed", "已完成"))
+    STORAGE_CHOICES = (("local", "本地"), ("cos", "腾讯云COS"))
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    file_name = models.CharField(max_length=255, verbose_name="文件名")
+    file_type = models.CharField(max_length=100, verbose_name="文件类型")
+    file_size = models.BigIntegerField(verbose_name="文件大小(字节)")
+    chunk_size = models.IntegerField(verbose_name="分块大小(字节)")
+    received = models.BigIntegerField(default=0, verbose_name="已接收字节数") # Offset the client resumes from
+    storage_type = models.CharField(max_length=10, choices=STORAGE_CHOICES, verbose_name="暂存方式")
+    staging_path = models.CharField(max_length=500, verbose_name="暂存位置") # Local staging file or COS key
+    upload_id = models.CharField(max_length=255, blank=True, verbose_name="COS 分片上传ID")
+    parts = models.JSONField(default=list, blank=True, verbose_name="COS 已上传分片") # ETag per chunk, in order
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="uploading", verbose_name="状态")
+    ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE, related_name="upload_sessions", null=True, blank=True, verbose_name="关联工单")
+    reply = models.ForeignKey(TicketReply, on_delete=models.CASCADE, related_name="upload_sessions", null=True, blank=True, verbose_name="关联回复")
+    uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name="upload_sessions", verbose_name="上传人")
+    attachment = models.OneToOneField(Attachment, on_delete=models.SET_NULL, related_name="upload_session", null=True, blank=True, verbose_name="附件")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self): return f"{self.file_name} ({self.received}/{self.file_size})"
+    class Meta:
+        verbose_name = "附件上传会话"
+        verbose_name_plural = "附件上传会话"
+        indexes = [models.Index(fields=["updated_at"])]
+
+
 class TicketStatusHistory(models.Model):
     # ... (Existing model content, ensure changed_by uses SET_NULL and allows null) ...
     ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE, related_name="status_history", verbose_name="工单")
@@ -394,6 +559,9 @@ class NotificationConfig(models.Model): # User-specific notification preferences
     wechat_enabled = models.BooleanField(default=False, verbose_name="启用微信通知") # User preference
     enterprise_wechat_enabled = models.BooleanField(default=False, verbose_name="启用企业微信通知") # User preference
     feishu_enabled = models.BooleanField(default=False, verbose_name="启用飞书通知") # User preference
+    # Digest mode: emails to this user are held and sent as one summary per window (run_notification_worker)
+    digest_enabled = models.BooleanField(default=False, verbose_name="启用邮件汇总")
+    digest_interval_minutes = models.PositiveIntegerField(default=30, verbose_name="汇总间隔(分钟)")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -415,6 +583,7 @@ class NotificationTemplate(models.Model):
         ("ticket_sla_resolution_warning", "SLA解决预警"),
         ("ticket_sla_resolution_missed", "SLA解决错过"),
         ("ticket_idle_warning", "工单闲置预警"),
+        ("notification_digest", "通知汇总"), # Rendered with {{ notifications }} for digest-mode users
     )
     CHANNEL_CHOICES = (
         ('email', '邮件'),
@@ -442,6 +611,79 @@ class NotificationTemplate(models.Model):
         return f"{self.name} ({self.get_event_type_display()} - {self.get_channel_display()})"
 
 
+class SLAEventDispatch(models.Model):
+    # One row per SLA / idle event fired by run_sla_scheduler. The unique key makes each
+    # (ticket, event, deadline) fire at most once across restarts and concurrent schedulers;
+    # a changed deadline is a new key and fires again.
+    ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE, related_name="sla_event_dispatches", verbose_name="工单")
+    event_type = models.CharField(max_length=50, choices=NotificationTemplate.EVENT_TYPE_CHOICES, verbose_name="事件类型")
+    deadline = models.DateTimeField(verbose_name="对应截止时间")
+    due_at = models.DateTimeField(verbose_name="计划触发时间")
+    created_at = models.DateTimeField(auto_now_add=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True, verbose_name="通知发出时间")
+
+    class Meta:
+        verbose_name = "SLA事件触发记录"
+        verbose_name_plural = "SLA事件触发记录"
+        unique_together = ('ticket', 'event_type', 'deadline')
+
+
+class NotificationOutbox(models.Model):
+    # Transactional outbox: NotificationManager writes one row per event / message inside the
+    # caller's transaction, so it commits or rolls back with the ticket or reply; the
+    # run_notification_worker command renders and delivers it off the request path.
+    STATUS_CHOICES = (
+        ("pending", "待处理"), ("processing", "处理中"), ("done", "已处理"), ("failed", "处理失败"),
+    )
+    event_type = models.CharField(max_length=50, blank=True, verbose_name="事件类型") # Template fan-out (send_notification_by_event)
+    context = models.JSONField(default=dict, blank=True, verbose_name="模板上下文") # Model instances stored as references
+    channel = models.CharField(max_length=30, blank=True, verbose_name="通知渠道") # Pre-rendered message (send_notification)
+    recipient_info = models.CharField(max_length=255, blank=True, verbose_name="接收者信息")
+    subject = models.TextField(blank=True, verbose_name="主题")
+    body = models.TextField(blank=True, verbose_name="内容")
+    event_key = models.CharField(max_length=100, blank=True, verbose_name="来源事件") # e.g. "reply:42"; messages of the same source event are deduplicated
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name="notification_outbox", null=True, blank=True, verbose_name="公司")
+    ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE, related_name="notification_outbox", null=True, blank=True, verbose_name="工单")
+    target_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="notification_outbox", null=True, blank=True, verbose_name="目标用户")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending", verbose_name="状态")
+    attempts = models.IntegerField(default=0, verbose_name="处理次数")
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="下次处理时间")
+    locked_until = models.DateTimeField(null=True, blank=True, verbose_name="处理租约到期时间") # A crashed worker's rows are reclaimed after this
+    last_error = models.TextField(blank=True, verbose_name="最近一次错误")
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name="处理完成时间")
+
+    class Meta:
+        verbose_name = "通知发件箱"
+        verbose_name_plural = "通知发件箱"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']), # Worker claim query
+        ]
+
+
+class CacheVersion(models.Model):
+    # Version stamp of a per-process lookup index (see notifications.VersionedIndex). Kept in the
+    # database so an edit in a web process reaches the notification worker even without a shared cache.
+    key = models.CharField(max_length=100, unique=True, verbose_name="缓存标识")
+    version = models.CharField(max_length=32, verbose_name="版本")
+
+    class Meta:
+        verbose_name = "缓存版本"
+        verbose_name_plural = "缓存版本"
+
+
+class WebhookRateLimit(models.Model):
+    # Token bucket of one group-bot webhook (see webhook_limiter.py). Kept in the database so
+    # every worker process draws from the same bucket; tokens are taken with a conditional UPDATE.
+    key = models.CharField(max_length=64, unique=True, verbose_name="Webhook 标识") # sha256 of the webhook URL
+    tokens = models.FloatField(verbose_name="剩余令牌数")
+    updated = models.FloatField(verbose_name="令牌更新时间") # Unix timestamp of the last refill
+
+    class Meta:
+        verbose_name = "Webhook 限流桶"
+        verbose_name_plural = "Webhook 限流桶"
+
+
 class NotificationLog(models.Model):
     # ... (Existing model content, ensure user field uses SET_NULL and allows null) ...
     NOTIFICATION_TYPE_CHOICES = (
@@ -450,6 +692,7 @@ class NotificationLog(models.Model):
     )
     STATUS_CHOICES = (
         ("pending", "待发送"), ("sent", "已发送"), ("failed", "发送失败"), ("retry_failed", "重试失败"),
+        ("throttled", "限流排队"), ("digest", "等待汇总"),
     )
     user = models.ForeignKey(User, on_delete=models.SET_NULL, related_name="notifications_triggered_log", null=True, blank=True, verbose_name="触发用户")
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name="notification_logs", null=True, blank=True, verbose_name="公司")
@@ -459,6 +702,18 @@ class NotificationLog(models.Model):
     content_summary = models.TextField(verbose_name="内容摘要/主题") # Changed from 'content'
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending", verbose_name="状态")
     retry_attempts = models.IntegerField(default=0, verbose_name="重试次数")
+    # Delivery attempts are made by run_notification_worker; a failed send is retried from the
+    # outbox entry (re-rendering its template) with exponential backoff until retry_failed.
+    outbox = models.ForeignKey(NotificationOutbox, on_delete=models.SET_NULL, related_name="logs", null=True, blank=True, verbose_name="发件箱记录")
+    template = models.ForeignKey(NotificationTemplate, on_delete=models.SET_NULL, related_name="logs", null=True, blank=True, verbose_name="通知模板")
+    last_attempt_at = models.DateTimeField(null=True, blank=True, verbose_name="最近一次发送时间")
+    next_attempt_at = models.DateTimeField(null=True, blank=True, verbose_name="下次重试时间")
+    # Set by the worker claiming a queued (throttled / digest) row; next_attempt_at then holds the lease expiry.
+    claim_token = models.CharField(max_length=32, null=True, blank=True, verbose_name="认领标识")
+    # Idempotency: sends of the same (ticket, event, recipient, channel) in one time bucket share a key;
+    # only the first is logged and sent, later ones are counted in its suppressed_count.
+    dedupe_key = models.CharField(max_length=64, unique=True, null=True, blank=True, verbose_name="去重键")
+    suppressed_count = models.PositiveIntegerField(default=0, verbose_name="已合并的重复通知数")
     created_at = models.DateTimeField(auto_now_add=True)
     sent_at = models.DateTimeField(null=True, blank=True, verbose_name="发送时间")
     response_info = models.TextField(blank=True, null=True, verbose_name="发送响应信息")
@@ -467,6 +722,10 @@ class NotificationLog(models.Model):
     class Meta:
         verbose_name = "通知记录"
         verbose_name_plural = "通知记录"
+        indexes = [
+            models.Index(fields=['-created_at', '-id']), # Keyset (cursor) pagination of notification logs
+            models.Index(fields=['status', 'next_attempt_at']), # Worker scans of due retries / throttled / digest rows
+        ]
 # Removed WebhookTemplate and EmailTemplate as they are superseded by NotificationTemplate
 # If you still need the old WebhookTemplate for other purposes, you can keep it, but
 # for user notifications, NotificationTemplate is more generic.
@@ -1,18 +1,34 @@
-import smtplib
+import hashlib
+import random
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, namedtuple
+from datetime import datetime, timedelta
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-import requests
 import json
 import logging
+from django.apps import apps
 from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.template import Context, Template as DjangoTemplate # For Django template language
 from django.utils import timezone
 
 # Assuming models are in the same app or accessible via ..models
-from memoq_ticket_system.models import NotificationTemplate, NotificationLog, CompanySSOProvider, User, Ticket, Company
+from memoq_ticket_system.models import CacheVersion, NotificationConfig, NotificationTemplate, NotificationLog, NotificationOutbox, CompanySSOProvider, User, Ticket, Company
+from memoq_ticket_system import http_client
+from memoq_ticket_system.dispatcher import Send, dispatcher
+from memoq_ticket_system.smtp_pool import smtp_config, smtp_pool
+from memoq_ticket_system.webhook_limiter import webhook_limiter
 
 logger = logging.getLogger(__name__)
 
+# Group-bot channels: rate limited per webhook URL (webhook_limiter) and coalesced into digests
+WEBHOOK_CHANNELS = ('feishu', 'enterprise_wechat')
+
 # Helper to build context for templates
 def build_notification_context(ticket=None, reply=None, user_actor=None, company=None, **kwargs):
     context = {
@@ -40,13 +56,462 @@ def build_notification_context(ticket=None, reply=None, user_actor=None, company
     return context
 
 
+# --- Outbox context (de)serialization ---
+
+def serialize_context(context_data):
+    """
+    JSON form of a notification context for NotificationOutbox.context. Model
+    instances are stored as references and re-read by the worker, so templates
+    render against the committed rows; the Django settings object is dropped and
+    re-added on restore.
+    """
+    serialized = {}
+    for key, value in context_data.items():
+        if key == 'settings':
+            continue
+        if isinstance(value, models.Model):
+            serialized[key] = {'__model__': value._meta.label_lower, 'pk': value.pk}
+        elif isinstance(value, datetime):
+            serialized[key] = {'__datetime__': value.isoformat()}
+        elif value is None or isinstance(value, (str, int, float, bool, list, dict)):
+            serialized[key] = value
+        else:
+            serialized[key] = str(value)
+    return serialized
+
+
+def restore_context(serialized):
+    """Inverse of serialize_context(); references to deleted rows become None."""
+    context_data = {'settings': settings}
+    for key, value in serialized.items():
+        if isinstance(value, dict) and '__model__' in value:
+            model = apps.get_model(value['__model__'])
+            value = model._default_manager.filter(pk=value['pk']).first()
+        elif isinstance(value, dict) and '__datetime__' in value:
+            value = datetime.fromisoformat(value['__datetime__'])
+        context_data[key] = value
+    return context_data
+
+
+# --- Compiled template cache ---
+
+class CompiledTemplateCache:
+    """
+    LRU cache of compiled (subject, body) Templates per NotificationTemplate,
+    keyed by (id, updated_at): an edited template gets a new key, so a worker
+    process never renders a stale compile even before the post_save signal
+    (which only reaches its own process) evicts the old entry.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, template_obj):
+        key = (template_obj.pk, template_obj.updated_at)
+        with self.lock:
+            compiled = self.entries.get(key)
+            if compiled is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return compiled
+            self.misses += 1
+        compiled = (DjangoTemplate(template_obj.subject_template), DjangoTemplate(template_obj.body_template))
+        with self.lock:
+            self.entries[key] = compiled
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return compiled
+
+    def render(self, template_obj, context_data):
+        """Rendered (subject, body) of a NotificationTemplate."""
+        subject_template, body_template = self.get(template_obj)
+        context = Context(context_data)
+        return subject_template.render(context), body_template.render(context)
+
+    def invalidate(self, template_id):
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == template_id]:
+                del self.entries[key]
+
+    def stats(self):
+        with self.lock:
+            return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+template_cache = CompiledTemplateCache()
+
+
+# --- Cached lookup indexes (templates, support roster) ---
+
+class VersionedIndex:
+    """
+    Base for in-process lookup structures that are built from the database once
+    and reused until their version stamp changes. invalidate() - called from
+    signals after the change commits - bumps the stamp, so every process rebuilds
+    on its next lookup. The stamp is stored in a CacheVersion row and read
+    through the cache for CACHE_VERSION_CHECK_SECONDS: with Redis a bump is seen
+    at once, with the per-process LocMemCache other processes (the notification
+    worker) see it once their cached copy expires.
+    """
+    VERSION_KEY = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+
+    def current_version(self):
+        version = cache.get(self.VERSION_KEY)
+        if version is None:
+            version = CacheVersion.objects.get_or_create(
+                key=self.VERSION_KEY, defaults={'version': uuid.uuid4().hex}
+            )[0].version
+            cache.set(self.VERSION_KEY, version, getattr(settings, 'CACHE_VERSION_CHECK_SECONDS', 10))
+        return version
+
+    def ensure_built(self):
+        """Rebuild if the shared version moved; the caller holds self.lock."""
+        version = self.current_version()
+        if version != self.version:
+            self.build()
+            self.version = version
+
+    def build(self):
+        raise NotImplementedError
+
+    def invalidate(self):
+        version = uuid.uuid4().hex
+        CacheVersion.objects.update_or_create(key=self.VERSION_KEY, defaults={'version': version})
+        cache.set(self.VERSION_KEY, version, getattr(settings, 'CACHE_VERSION_CHECK_SECONDS', 10))
+        with self.lock:
+            self.version = None
+
+
+class TemplateResolutionIndex(VersionedIndex):
+    """
+    (event_type, company_id) -> active NotificationTemplates to send, with
+    company overrides applied: a company's own templates replace the global ones
+    of the same channel, global templates cover the other channels. Built from one
+    query over the active templates; steady-state lookups run no queries.
+    """
+    VERSION_KEY = 'notification_templates:version'
+
+    def __init__(self):
+        super().__init__()
+        self.global_templates = {}  # event_type -> [template, ...]
+        self.company_templates = {}  # (event_type, company_id) -> [template, ...]
+        self.resolved = {}  # (event_type, company_id) -> (template, ...)
+
+    def build(self):
+        global_templates, company_templates = {}, {}
+        for template_obj in NotificationTemplate.objects.filter(is_active=True).order_by('id'):
+            if template_obj.company_id is None:
+                global_templates.setdefault(template_obj.event_type, []).append(template_obj)
+            else:
+                company_templates.setdefault((template_obj.event_type, template_obj.company_id), []).append(template_obj)
+        self.global_templates, self.company_templates = global_templates, company_templates
+        self.resolved = {}
+
+    def resolve(self, event_type, company_id=None):
+        """Templates to send for an event, in a tuple (empty if none are configured)."""
+        with self.lock:
+            self.ensure_built()
+            key = (event_type, company_id)
+            if key not in self.resolved:
+                own = self.company_templates.get(key, []) if company_id is not None else []
+                overridden = {template_obj.channel for template_obj in own}
+                self.resolved[key] = tuple(own) + tuple(
+                    template_obj for template_obj in self.global_templates.get(event_type, [])
+                    if template_obj.channel not in overridden
+                )
+            return self.resolved[key]
+
+
+class SupportRoster(VersionedIndex):
+    """
+    Active support staff with their NotificationConfig, loaded in one query.
+    Invalidated by the User / NotificationConfig signals.
+    """
+    VERSION_KEY = 'support_roster:version'
+    ROLES = (User.ROLE_SUPPORT, User.ROLE_TECHNICAL_SUPPORT_ADMIN)
+
+    def __init__(self):
+        super().__init__()
+        self.users = ()
+
+    def build(self):
+        self.users = tuple(
+            User.objects.filter(role__in=self.ROLES, is_active=True)
+            .select_related('notification_config').order_by('id')
+        )
+
+    def members(self, roles=None):
+        with self.lock:
+            self.ensure_built()
+            users = self.users
+        return [user for user in users if roles is None or user.role in roles]
+
+    def emails(self, roles=None, exclude_user=None):
+        """Email addresses of the staff in `roles` (all support roles by default) who accept email."""
+        return [
+            user.email for user in self.members(roles)
+            if user.email and channel_enabled(user, 'email') and (exclude_user is None or user.pk != exclude_user.pk)
+        ]
+
+
+class DigestSubscribers(VersionedIndex):
+    """
+    Email address -> digest window (minutes) of the users in digest mode
+    (NotificationConfig.digest_enabled). Invalidated by the User /
+    NotificationConfig signals.
+    """
+    VERSION_KEY = 'digest_subscribers:version'
+
+    def __init__(self):
+        super().__init__()
+        self.intervals = {}
+
+    def build(self):
+        self.intervals = {
+            email.lower(): max(minutes, 1)
+            for email, minutes in NotificationConfig.objects.filter(
+                digest_enabled=True, email_enabled=True, user__is_active=True
+            ).exclude(user__email='').values_list('user__email', 'digest_interval_minutes')
+        }
+
+    def interval(self, email):
+        """Digest window in minutes for `email`, or None to send its mail right away."""
+        with self.lock:
+            self.ensure_built()
+            return self.intervals.get((email or '').lower())
+
+
+template_index = TemplateResolutionIndex()
+support_roster = SupportRoster()
+digest_subscribers = DigestSubscribers()
+
+
+def channel_enabled(user, channel):
+    """A user's NotificationConfig preference for a channel; without a config only email is on."""
+    try:
+        config = user.notification_config
+    except NotificationConfig.DoesNotExist:
+        return channel == 'email'
+    return getattr(config, f'{channel}_enabled', False)
+
+
+# --- Recipient planning ---
+
+Dispatch = namedtuple('Dispatch', 'template channel recipient mentioned_user_ids')
+
+
+def plan_event(templates, context_data, target_company=None, target_user=None):
+    """
+    Resolve recipients for an event's templates: the target user's email (if
+    their NotificationConfig allows it) or the context's default recipient, and
+    the company's webhook per webhook channel. Runs at most one query (the
+    company's SSO providers) whatever the number of templates; the target user's
+    NotificationConfig is expected to be select_related by the caller.
+    Returns the list of Dispatch rows to send.
+    """
+    webhook_channels = {t.channel for t in templates if t.channel in WEBHOOK_CHANNELS}
+    providers = {}
+    if webhook_channels and target_company:
+        providers = {
+            provider.provider_type: provider
+            for provider in CompanySSOProvider.objects.filter(
+                company=target_company, provider_type__in=webhook_channels, is_enabled=True
+            )
+        }
+
+    plan = []
+    for template_obj in templates:
+        channel = template_obj.channel
+        if channel == 'email':
+            if target_user and target_user.email and channel_enabled(target_user, 'email'):
+                recipient = target_user.email
+            elif 'default_email_recipient' in context_data: # e.g. for support group email
+                recipient = context_data['default_email_recipient']
+            else:
+                logger.warning(f"Email template '{template_obj.name}' for event '{template_obj.event_type}' has no target user email or default recipient.")
+                continue
+        elif channel in webhook_channels:
+            if not target_company:
+                logger.warning(f"Webhook template '{template_obj.name}' for channel '{channel}' requires a target company.")
+                continue
+            provider = providers.get(channel)
+            if provider is None:
+                logger.warning(f"No active {channel.capitalize()} SSO/Webhook config found for company '{target_company.name}'.")
+                continue
+            if not provider.webhook_url:
+                logger.warning(f"{channel.capitalize()} webhook URL not configured for company '{target_company.name}'.")
+                continue
+            recipient = provider.webhook_url
+        else:
+            logger.warning(f"Unsupported notification channel: {channel}")
+            continue
+        plan.append(Dispatch(template_obj, channel, recipient, NotificationManager._mentioned_platform_ids(channel, context_data)))
+    return plan
+
+
+def digest_window_end(minutes, now=None):
+    """
+    End of the current `minutes`-long digest window. Windows are aligned to the
+    epoch, so every event for a recipient in the same window - whichever worker
+    handles it - is held until the same moment and goes out in one summary.
+    """
+    now = now or timezone.now()
+    period = minutes * 60
+    return datetime.fromtimestamp((now.timestamp() // period + 1) * period, tz=now.tzinfo)
+
+
+DEFAULT_DIGEST_SUBJECT = DjangoTemplate("您有 {{ count }} 条工单通知")
+DEFAULT_DIGEST_BODY = DjangoTemplate(
+    "<h2>工单通知汇总（{{ count }} 条）</h2>"
+    "{% for item in notifications %}<h3>{{ item.subject }}</h3>{{ item.body|safe }}<hr>{% endfor %}"
+)
+
+
+def dedupe_key(ticket_id, event, channel, recipient, at):
+    """
+    Idempotency key of a send: every send of the same (ticket, event, channel,
+    recipient) within one NOTIFICATION_DEDUPE_WINDOW_SECONDS bucket of event time
+    `at` shares it. `event` is the template event_type, or the source event of a
+    pre-rendered message (see _message_event). None when deduplication is
+    switched off (window 0).
+    """
+    window = getattr(settings, 'NOTIFICATION_DEDUPE_WINDOW_SECONDS', 300)
+    if not window:
+        return None
+    bucket = int(at.timestamp() // window)
+    raw = f"{ticket_id or ''}|{event}|{channel}|{(recipient or '').lower()}|{bucket}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class SuppressionCounter:
+    """Duplicate sends suppressed by this process, per channel (shown in the worker log)."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def add(self, channel, count=1):
+        with self.lock:
+            self.counts[channel] += count
+
+    def total(self):
+        with self.lock:
+            return sum(self.counts.values())
+
+
+suppressed_sends = SuppressionCounter()
+
+
+def retry_delay(attempt):
+    """
+    Jittered exponential backoff before retry number `attempt` (0-based): a random
+    delay between half and all of min(base * 2^attempt, cap), so sends that failed
+    together (an SMTP outage) do not all retry in the same second.
+    """
+    base = getattr(settings, 'NOTIFICATION_RETRY_BASE_SECONDS', 60)
+    cap = getattr(settings, 'NOTIFICATION_RETRY_MAX_SECONDS', 3600)
+    delay = min(base * 2 ** attempt, cap)
+    return timedelta(seconds=random.uniform(delay / 2, delay))
+
+
+class NotificationLogWriter:
+    """
+    Buffers the outcome of NotificationLog attempts and writes them back with
+    bulk_update: when `max_size` logs are pending, when the oldest has waited
+    `max_delay` seconds, or on flush(). Shared by the worker's threads.
+    """
+    UPDATE_FIELDS = ['status', 'retry_attempts', 'response_info', 'sent_at', 'last_attempt_at', 'next_attempt_at', 'claim_token']
+
+    def __init__(self, max_size=100, max_delay=1.0):
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.pending = []
+        self.oldest = None
+        self.lock = threading.Lock()
+
+    def add(self, log_entry):
+        with self.lock:
+            if not self.pending:
+                self.oldest = time.monotonic()
+            self.pending.append(log_entry)
+            due = len(self.pending) >= self.max_size or time.monotonic() - self.oldest >= self.max_delay
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, []
+        if pending:
+            NotificationLog.objects.bulk_update(pending, self.UPDATE_FIELDS, batch_size=self.max_size)
+        return len(pending)
+
+
+class EmailBatchProgress:
+    """
+    Outcome of each message of an SMTP batch, recorded on its NotificationLog as
+    soon as the session sends or refuses it (from the dispatcher thread running
+    the batch). When the batch misses its deadline, abandon() stops it before
+    the next message and fails only the messages it never started; the one in
+    flight is still recorded by the batch thread when it completes, so nothing
+    that was sent is retried.
+    """
+
+    def __init__(self, log_entries, writer=None):
+        self.log_entries = log_entries
+        self.writer = writer
+        self.started = 0
+        self.recorded = set()
+        self.abandoned = False
+        self.lock = threading.Lock()
+
+    def start(self, index):
+        with self.lock:
+            if self.abandoned:
+                return False
+            self.started = index + 1
+            return True
+
+    def done(self, index, sent, error=None):
+        with self.lock:
+            if index in self.recorded:
+                return
+            self.recorded.add(index)
+        NotificationManager._record_attempt(self.log_entries[index], sent, str(error) if error else None, writer=self.writer)
+
+    def abandon(self, error):
+        """Stop the batch; the messages it has not started are failed with `error` (retried later)."""
+        with self.lock:
+            self.abandoned = True
+            unstarted = range(self.started, len(self.log_entries))
+        for index in unstarted:
+            self.done(index, False, error)
+
+
 class NotificationManager:
+    """
+    Notifications are queued, not sent: send_notification_by_event() and
+    send_notification() write a NotificationOutbox row in the caller's
+    transaction and return immediately. The run_notification_worker command
+    claims those rows and calls deliver_outbox_entry(), which renders the
+    templates, bulk-inserts one pending NotificationLog per recipient and does
+    the SMTP / webhook I/O; failed sends are retried through retry_log().
+    """
+
     @staticmethod
     def send_notification_by_event(event_type, context_data, target_company=None, target_user=None):
         """
-        Sends notifications based on an event type and context.
-        It will find relevant NotificationTemplates (global or company-specific)
-        and dispatch them.
+        Queues notifications for an event type and context. The worker finds the
+        relevant NotificationTemplates (global or company-specific) and dispatches
+        them (see dispatch_event).
 
         Args:
             event_type (str): The event identifier (e.g., 'ticket_created').
@@ -55,123 +520,466 @@ class NotificationManager:
             target_user (User, optional): The specific user to notify (for email or direct messages if applicable).
                                          If None, might notify a group via webhook based on template.
         """
-        templates_to_send = NotificationTemplate.objects.filter(event_type=event_type, is_active=True)
-        
-        if target_company:
-            company_templates = templates_to_send.filter(company=target_company)
-            global_templates = templates_to_send.filter(company__isnull=True)
-            # Prioritize company-specific templates if they exist for the event and channel
-            # This logic might need refinement based on how overrides should work
-            processed_channels_for_company = set()
-            final_templates = []
-
-            for ct in company_templates:
-                final_templates.append(ct)
-                processed_channels_for_company.add(ct.channel)
-            for gt in global_templates:
-                if gt.channel not in processed_channels_for_company:
-                    final_templates.append(gt)
-            templates_to_send = final_templates
-        else: # Only global templates if no target company
-            templates_to_send = templates_to_send.filter(company__isnull=True)
-
-        if not templates_to_send.exists():
-            logger.info(f"No active notification templates found for event '{event_type}' (Company: {target_company.name if target_company else 'Global'}).")
-            return
+        ticket = context_data.get('ticket')
+        return NotificationOutbox.objects.create(
+            event_type=event_type,
+            context=serialize_context(context_data),
+            company=target_company,
+            ticket=ticket if isinstance(ticket, Ticket) else None,
+            target_user=target_user,
+        )
 
-        for template_obj in templates_to_send:
-            subject = DjangoTemplate(template_obj.subject_template).render(Context(context_data))
-            body = DjangoTemplate(template_obj.body_template).render(Context(context_data))
-            
-            recipient_contact_info = None
-            webhook_provider_config = None
-            mentioned_platform_ids = [] # For @mentions
+    @staticmethod
+    def send_notification(channel, recipient_contact_info, subject, body, ticket=None, company=None, user=None, event_key=''):
+        """Queues one already-rendered message to a single recipient (used by signals.py)."""
+        entries = NotificationManager.send_notifications(
+            channel, [recipient_contact_info], subject, body, ticket=ticket, company=company, user=user, event_key=event_key
+        )
+        return entries[0] if entries else None
 
-            if template_obj.channel == 'email':
-                if target_user and target_user.email and target_user.notification_config.email_enabled:
-                    recipient_contact_info = target_user.email
-                elif 'default_email_recipient' in context_data: # e.g. for support group email
-                    recipient_contact_info = context_data['default_email_recipient']
-                else:
-                    logger.warning(f"Email template '{template_obj.name}' for event '{event_type}' has no target user email or default recipient.")
-                    continue
-            
-            elif template_obj.channel in ['feishu', 'enterprise_wechat']:
-                if not target_company:
-                    logger.warning(f"Webhook template '{template_obj.name}' for channel '{template_obj.channel}' requires a target company.")
-                    continue
-                try:
-                    webhook_provider_config = CompanySSOProvider.objects.get(
-                        company=target_company, 
-                        provider_type=template_obj.channel, # Assuming channel name matches provider_type
-                        is_enabled=True
-                    )
-                    recipient_contact_info = webhook_provider_config.webhook_url
-                    if not recipient_contact_info:
-                        logger.warning(f"{template_obj.channel.capitalize()} webhook URL not configured for company '{target_company.name}'.")
-                        continue
-                    
-                    # Prepare @mentions - context_data should contain users to be mentioned
-                    # Example: if 'ticket_creator_user' in context_data and it's a User object
-                    user_to_mention = context_data.get('ticket_creator_user') # Or 'assigned_user', etc.
-                    if user_to_mention and isinstance(user_to_mention, User):
-                        if template_obj.channel == 'feishu' and user_to_mention.feishu_id:
-                            mentioned_platform_ids.append(user_to_mention.feishu_id)
-                        elif template_obj.channel == 'enterprise_wechat' and user_to_mention.enterprise_wechat_id:
-                            mentioned_platform_ids.append(user_to_mention.enterprise_wechat_id)
-
-                except CompanySSOProvider.DoesNotExist:
-                    logger.warning(f"No active {template_obj.channel.capitalize()} SSO/Webhook config found for company '{target_company.name}'.")
-                    continue
-            else:
-                logger.warning(f"Unsupported notification channel: {template_obj.channel}")
+    @staticmethod
+    def send_notifications(channel, recipients, subject, body, ticket=None, company=None, user=None, event_key=''):
+        """
+        Queues the same already-rendered message to many recipients in one INSERT (fan-outs).
+        `event_key` names the source event (e.g. "reply:42"): messages of the same event to
+        the same recipient are sent once. Without it the message is never deduplicated.
+        """
+        recipients = [r for r in recipients if r]
+        if not recipients:
+            logger.warning(f"Skipping {channel} notification '{subject}': no recipient.")
+            return []
+        return NotificationOutbox.objects.bulk_create([
+            NotificationOutbox(
+                channel=channel,
+                recipient_info=str(recipient)[:250],
+                subject=subject,
+                body=body,
+                event_key=event_key,
+                company=company,
+                ticket=ticket,
+                target_user=user,
+            )
+            for recipient in recipients
+        ])
+
+    @staticmethod
+    def deliver_outbox_entry(entry, writer=None):
+        """
+        Worker side: render and send an outbox entry. Returns its NotificationLogs.
+        Attempt outcomes go to `writer` (a NotificationLogWriter) when given,
+        otherwise each log is saved as its send completes.
+        """
+        if entry.event_type:
+            return NotificationManager.dispatch_event(entry, writer)
+        return NotificationManager.deliver_messages([entry], writer)
+
+    @staticmethod
+    def deliver_messages(entries, writer=None):
+        """
+        Worker side: pre-rendered entries, logged in one INSERT and sent concurrently
+        by the dispatcher. Duplicates (see _create_logs) get no log and no send.
+        """
+        log_entries = NotificationManager._message_logs(entries)
+        NotificationManager._attempt_many([
+            (log_entry, log_entry.outbox.subject, log_entry.outbox.body, None)
+            for log_entry in log_entries if not NotificationManager._hold_for_digest(log_entry, writer)
+        ], writer=writer)
+        return log_entries
+
+    @staticmethod
+    def deliver_email_batch(entries, writer=None):
+        """
+        Worker side: pre-rendered email entries of one company, sent over a single
+        SMTP session instead of one session per recipient.
+        """
+        log_entries = NotificationManager._message_logs(entries)
+        to_send = [log_entry for log_entry in log_entries if not NotificationManager._hold_for_digest(log_entry, writer)]
+        if not to_send:
+            return log_entries
+        company = entries[0].company
+        messages = [(log_entry.recipient_info, log_entry.outbox.subject, log_entry.outbox.body) for log_entry in to_send]
+        progress = EmailBatchProgress(to_send, writer)
+        (_, error), = dispatcher.dispatch([Send(
+            'email', NotificationManager.send_email_batch,
+            (messages, company.email_config if company else None, progress), len(messages)
+        )])
+        if error is not None:  # Deadline exceeded (or the session failed): only unsent messages are retried
+            progress.abandon(error)
+        return log_entries
+
+    @staticmethod
+    def _message_logs(entries):
+        """Pending NotificationLogs of pre-rendered entries, minus duplicates (see _create_logs)."""
+        return NotificationManager._create_logs([
+            NotificationLog(
+                outbox=entry,
+                user=entry.target_user,
+                company=entry.company,
+                ticket=entry.ticket,
+                notification_type=entry.channel,
+                recipient_info=entry.recipient_info,
+                content_summary=entry.subject,
+                dedupe_key=dedupe_key(
+                    entry.ticket_id, NotificationManager._message_event(entry), entry.channel, entry.recipient_info, entry.created_at
+                ),
+                status='pending'
+            )
+            for entry in entries
+        ])
+
+    @staticmethod
+    def _message_event(entry):
+        """The event a pre-rendered entry is deduplicated on: its source event, else the entry itself."""
+        return entry.event_key or f"outbox:{entry.pk}"
+
+    @staticmethod
+    def _create_logs(log_entries):
+        """
+        Inserts pending NotificationLogs in one statement, collapsing duplicates first:
+        a log whose dedupe_key is already logged by another outbox entry (or repeats in
+        `log_entries`) is not created - and so never sent - and the surviving log's
+        suppressed_count is bumped instead. A retried entry's own earlier logs are not
+        duplicates: one still pending (the attempt failed before sending it) is returned
+        to be sent, any other is left to retry_logs. Returns the logs to send.
+        """
+        outbox_ids = {log_entry.outbox_id for log_entry in log_entries if log_entry.outbox_id}
+        earlier = {
+            (log.outbox_id, log.template_id, log.notification_type, log.recipient_info): log
+            for log in NotificationLog.objects.filter(outbox_id__in=outbox_ids).only(
+                'pk', 'outbox_id', 'template_id', 'notification_type', 'recipient_info', 'status', 'dedupe_key'
+            )
+        } if outbox_ids else {}
+        keys = {log_entry.dedupe_key for log_entry in log_entries if log_entry.dedupe_key}
+        logged = set(NotificationLog.objects.filter(dedupe_key__in=keys).values_list('dedupe_key', flat=True)) if keys else set()
+        fresh, resumed, suppressed = [], [], Counter()
+        for log_entry in log_entries:
+            previous = earlier.get(
+                (log_entry.outbox_id, log_entry.template_id, log_entry.notification_type, log_entry.recipient_info)
+            )
+            if previous is not None:
+                if previous.status == 'pending':
+                    log_entry.pk = previous.pk
+                    log_entry.dedupe_key = previous.dedupe_key
+                    log_entry._state.adding = False
+                    resumed.append(log_entry)
                 continue
+            if log_entry.dedupe_key in logged:
+                suppressed[log_entry.dedupe_key, log_entry.notification_type] += 1
+                continue
+            if log_entry.dedupe_key:
+                logged.add(log_entry.dedupe_key)
+            fresh.append(log_entry)
+        try:
+            with transaction.atomic():
+                created = NotificationLog.objects.bulk_create(fresh)
+        except IntegrityError:
+            # Another worker logged one of the keys in the meantime: insert row by row
+            created = []
+            for log_entry in fresh:
+                try:
+                    with transaction.atomic():
+                        log_entry.save()
+                    created.append(log_entry)
+                except IntegrityError:
+                    suppressed[log_entry.dedupe_key, log_entry.notification_type] += 1
+        for (key, channel), count in suppressed.items():
+            NotificationLog.objects.filter(dedupe_key=key).update(suppressed_count=F('suppressed_count') + count)
+            suppressed_sends.add(channel, count)
+        return resumed + created
+
+    @staticmethod
+    def dispatch_event(entry, writer=None):
+        """Resolves the templates and recipients of an event outbox entry (plan_event) and sends the plan."""
+        event_type, target_company, target_user = entry.event_type, entry.company, entry.target_user
+        context_data = restore_context(entry.context)
+        templates_to_send = template_index.resolve(event_type, target_company.pk if target_company else None)
+
+        if not templates_to_send:
+            logger.info(f"No active notification templates found for event '{event_type}' (Company: {target_company.name if target_company else 'Global'}).")
+            return []
 
-            # Log before sending
-            log_entry = NotificationLog.objects.create(
+        plan = plan_event(templates_to_send, context_data, target_company, target_user)
+        rendered = [template_cache.render(dispatch.template, context_data) for dispatch in plan]
+        ticket = context_data.get('ticket')
+        # Log before sending: all pending rows in one INSERT, duplicates dropped. A retried
+        # entry (the worker failed part-way through) gets back only the logs it has not sent.
+        sends = [
+            (NotificationLog(
+                outbox=entry,
+                template=dispatch.template,
                 user=context_data.get('user_actor'), # User who triggered the event
                 company=target_company,
-                ticket=context_data.get('ticket'),
-                notification_type=template_obj.channel,
-                recipient_info=str(recipient_contact_info)[:250], # Truncate if too long
+                ticket=ticket,
+                notification_type=dispatch.channel,
+                recipient_info=str(dispatch.recipient)[:250], # Truncate if too long
                 content_summary=subject,
+                dedupe_key=dedupe_key(
+                    ticket.pk if ticket else None, event_type, dispatch.channel, str(dispatch.recipient)[:250], entry.created_at
+                ),
                 status='pending'
-            )
+            ), dispatch, subject, body)
+            for dispatch, (subject, body) in zip(plan, rendered)
+        ]
+        log_entries = NotificationManager._create_logs([log_entry for log_entry, _, _, _ in sends])
+        created = {id(log_entry) for log_entry in log_entries}
+        NotificationManager._attempt_many([
+            (log_entry, subject, body, dispatch.mentioned_user_ids)
+            for log_entry, dispatch, subject, body in sends
+            if id(log_entry) in created and not NotificationManager._hold_for_digest(log_entry, writer)
+        ], writer=writer)
+        return log_entries
+
+    @staticmethod
+    def retry_log(log_entry, writer=None):
+        success, = NotificationManager.retry_logs([log_entry], writer)
+        return success
 
+    @staticmethod
+    def retry_logs(log_entries, writer=None):
+        """
+        Re-sends failed NotificationLogs concurrently: template messages are
+        re-rendered from the outbox context, pre-rendered ones re-sent from the
+        outbox row. Returns success per log.
+        """
+        results = [False] * len(log_entries)
+        indexes, attempts = [], []
+        for index, log_entry in enumerate(log_entries):
+            if log_entry.outbox_id is None:
+                log_entry.status = 'retry_failed'
+                log_entry.next_attempt_at = None
+                log_entry.response_info = "No outbox entry to retry from"
+                log_entry.save(update_fields=['status', 'next_attempt_at', 'response_info'])
+                continue
+            log_entry.retry_attempts += 1
             try:
-                success = NotificationManager._dispatch_send(
-                    channel=template_obj.channel,
-                    recipient_contact_info=recipient_contact_info,
-                    subject=subject,
-                    body=body, # This is the rendered body
-                    mentioned_user_ids=mentioned_platform_ids,
-                    # Pass company's general email config if it's an email
-                    email_config=target_company.email_config if target_company and template_obj.channel == 'email' else None
-                )
-                log_entry.status = 'sent' if success else 'failed'
+                subject, body, mentioned_user_ids = NotificationManager._log_message(log_entry)
             except Exception as e:
-                logger.error(f"Error dispatching notification for template '{template_obj.name}': {e}")
-                log_entry.status = 'failed'
-                log_entry.response_info = str(e)
-            
-            log_entry.sent_at = timezone.now() if log_entry.status == 'sent' else None
-            log_entry.save()
+                logger.error(f"Re-rendering notification log #{log_entry.pk} failed: {e}")
+                NotificationManager._record_attempt(log_entry, False, str(e), writer=writer)
+                continue
+            indexes.append(index)
+            attempts.append((log_entry, subject, body, mentioned_user_ids))
+        for index, success in zip(indexes, NotificationManager._attempt_many(attempts, writer)):
+            results[index] = success
+        return results
+
+    @staticmethod
+    def _log_message(log_entry):
+        """(subject, body, mentioned_user_ids) of a logged send, rebuilt from its outbox entry."""
+        entry = log_entry.outbox
+        if entry is None:
+            return log_entry.content_summary, "", []
+        if log_entry.template_id:
+            context_data = restore_context(entry.context)
+            subject, body = template_cache.render(log_entry.template, context_data)
+            return subject, body, NotificationManager._mentioned_platform_ids(log_entry.notification_type, context_data)
+        return entry.subject, entry.body, []
+
+    @staticmethod
+    def deliver_webhook_digest(log_entries, writer=None):
+        """
+        Worker side: the sends queued ("throttled") for one webhook, delivered as a
+        single card once its bucket has a token again, instead of one post each.
+        """
+        first = log_entries[0]
+        wait = webhook_limiter.acquire(first.recipient_info)
+        if wait:
+            for log_entry in log_entries:
+                NotificationManager._throttle(log_entry, wait, writer)
+            return False
+        messages, mentioned_user_ids = [], []
+        for log_entry in log_entries:
+            subject, body, mentioned = NotificationManager._log_message(log_entry)
+            messages.append((subject, body))
+            mentioned_user_ids += [uid for uid in mentioned if uid not in mentioned_user_ids]
+        subject, body = messages[0] if len(messages) == 1 else NotificationManager.build_webhook_digest(messages)
+        (success, error), = dispatcher.dispatch([Send(
+            first.notification_type, NotificationManager._dispatch_send,
+            (first.notification_type, first.recipient_info, subject, body, mentioned_user_ids),
+        )])
+        if error is None:
+            response_info = f"Sent in a digest of {len(messages)}" if success and len(messages) > 1 else None
+        else:
+            logger.error(f"Error sending digest of {len(messages)} notifications to {first.recipient_info}: {error}")
+            response_info = str(error)
+        for log_entry in log_entries:
+            NotificationManager._record_attempt(log_entry, success, response_info, writer=writer)
+        return success
+
+    @staticmethod
+    def deliver_email_digest(log_entries, writer=None):
+        """
+        Worker side: the emails held for one digest-mode recipient during a window,
+        sent as one summary rendered from the 'notification_digest' email template
+        (or a built-in default). Uses the company's relay when all held mails share one.
+        """
+        first = log_entries[0]
+        notifications = []
+        for log_entry in log_entries:
+            subject, body, _ = NotificationManager._log_message(log_entry)
+            notifications.append({
+                'subject': subject, 'body': body, 'ticket': log_entry.ticket, 'created_at': log_entry.created_at,
+            })
+        company = first.company if len({log_entry.company_id for log_entry in log_entries}) == 1 else None
+        subject, body = NotificationManager.render_email_digest(first.recipient_info, notifications, company)
+        (success, error), = dispatcher.dispatch([Send(
+            'email', NotificationManager.send_email,
+            (first.recipient_info, subject, body, company.email_config if company else None),
+        )])
+        if error is None:
+            response_info = f"Sent in a digest of {len(log_entries)}" if success else None
+        else:
+            logger.error(f"Error sending digest of {len(log_entries)} emails to {first.recipient_info}: {error}")
+            response_info = str(error)
+        for log_entry in log_entries:
+            NotificationManager._record_attempt(log_entry, success, response_info, writer=writer)
+        return success
+
+    @staticmethod
+    def render_email_digest(recipient, notifications, company=None):
+        context_data = {
+            'recipient': recipient,
+            'count': len(notifications),
+            'notifications': notifications,
+            'site_url': getattr(settings, 'FRONTEND_URL', 'http://localhost:3000'),
+        }
+        for template_obj in template_index.resolve('notification_digest', company.pk if company else None):
+            if template_obj.channel == 'email':
+                return template_cache.render(template_obj, context_data)
+        context = Context(context_data)
+        return DEFAULT_DIGEST_SUBJECT.render(context), DEFAULT_DIGEST_BODY.render(context)
+
+    @staticmethod
+    def _hold_for_digest(log_entry, writer=None):
+        """Holds an email to a digest-mode recipient until the end of their window; True if held."""
+        if log_entry.notification_type != 'email':
+            return False
+        minutes = digest_subscribers.interval(log_entry.recipient_info)
+        if minutes is None:
+            return False
+        log_entry.status = 'digest'
+        log_entry.next_attempt_at = digest_window_end(minutes)
+        log_entry.claim_token = None
+        if writer is not None:
+            writer.add(log_entry)
+        else:
+            log_entry.save(update_fields=NotificationLogWriter.UPDATE_FIELDS)
+        return True
+
+    @staticmethod
+    def build_webhook_digest(messages):
+        """
+        Subject and markdown body of one card combining [(subject, body), ...].
+        Bodies are dropped, then whole messages counted, once the card would
+        exceed WEBHOOK_DIGEST_MAX_BYTES.
+        """
+        limit = getattr(settings, 'WEBHOOK_DIGEST_MAX_BYTES', 3500) - 64 # Room for the "more" line
+        parts, size = [], 0
+        for index, (subject, body) in enumerate(messages):
+            part = f"**{subject}**\n{body}"
+            if size + len(part.encode()) > limit:
+                part = f"**{subject}**"
+            if size + len(part.encode()) > limit:
+                parts.append(f"……另有 {len(messages) - index} 条通知")
+                break
+            parts.append(part)
+            size += len(part.encode()) + 2
+        return f"通知汇总（{len(messages)} 条）", "\n\n".join(parts)
+
+    @staticmethod
+    def _throttle(log_entry, wait, writer=None):
+        """Queues a webhook send its bucket has no token for; the worker sends it in the next digest."""
+        log_entry.status = 'throttled'
+        log_entry.next_attempt_at = timezone.now() + timedelta(seconds=wait)
+        log_entry.claim_token = None  # Back in the queue: later digests of this webhook may take it
+        log_entry.response_info = "Rate limited; queued for the next digest"
+        if writer is not None:
+            writer.add(log_entry)
+        else:
+            log_entry.save(update_fields=NotificationLogWriter.UPDATE_FIELDS)
+        return False
+
+    @staticmethod
+    def _attempt(log_entry, subject, body, mentioned_user_ids=None, writer=None):
+        """One delivery attempt, recorded on the log entry."""
+        success, = NotificationManager._attempt_many([(log_entry, subject, body, mentioned_user_ids)], writer)
+        return success
+
+    @staticmethod
+    def _attempt_many(attempts, writer=None):
+        """
+        Delivery attempts [(log_entry, subject, body, mentioned_user_ids), ...], run
+        concurrently by the dispatcher (per-channel caps, per-send deadline) and
+        recorded on their log entries. Webhook sends over the rate limit are
+        queued instead. Returns success per attempt.
+        """
+        results = [False] * len(attempts)
+        ready, sends = [], []
+        for index, (log_entry, subject, body, mentioned_user_ids) in enumerate(attempts):
+            channel = log_entry.notification_type
+            if channel in WEBHOOK_CHANNELS and log_entry.recipient_info:
+                wait = webhook_limiter.acquire(log_entry.recipient_info)
+                if wait:
+                    NotificationManager._throttle(log_entry, wait, writer)
+                    continue
+            # Pass company's general email config if it's an email
+            email_config = log_entry.company.email_config if log_entry.company and channel == 'email' else None
+            ready.append(index)
+            sends.append(Send(channel, NotificationManager._dispatch_send, (
+                channel, log_entry.recipient_info, subject, body, mentioned_user_ids, email_config
+            )))
+        for index, (success, error) in zip(ready, dispatcher.dispatch(sends)):
+            log_entry = attempts[index][0]
+            if error is not None:
+                logger.error(f"Error dispatching notification log #{log_entry.pk}: {error}")
+            results[index] = NotificationManager._record_attempt(
+                log_entry, bool(success), str(error) if error else None, writer=writer
+            )
+        return results
+
+    @staticmethod
+    def _record_attempt(log_entry, success, response_info=None, writer=None):
+        """Stores the outcome of an attempt and schedules the next retry on failure."""
+        now = timezone.now()
+        log_entry.last_attempt_at = now
+        log_entry.response_info = response_info
+        if success:
+            log_entry.status = 'sent'
+            log_entry.sent_at = now
+            log_entry.next_attempt_at = None
+        elif log_entry.retry_attempts < getattr(settings, 'NOTIFICATION_MAX_RETRIES', 5):
+            log_entry.status = 'failed'
+            log_entry.next_attempt_at = now + retry_delay(log_entry.retry_attempts)
+        else:
+            log_entry.status = 'retry_failed'
+            log_entry.next_attempt_at = None
+        if writer is not None:
+            writer.add(log_entry)
+        else:
+            log_entry.save(update_fields=NotificationLogWriter.UPDATE_FIELDS)
+        return success
+
+    @staticmethod
+    def _mentioned_platform_ids(channel, context_data):
+        """Platform ids to @mention in a webhook message (the ticket creator, if bound)."""
+        user_to_mention = context_data.get('ticket_creator_user') # Or 'assigned_user', etc.
+        if not isinstance(user_to_mention, User):
+            return []
+        if channel == 'feishu' and user_to_mention.feishu_id:
+            return [user_to_mention.feishu_id]
+        if channel == 'enterprise_wechat' and user_to_mention.enterprise_wechat_id:
+            return [user_to_mention.enterprise_wechat_id]
+        return []
 
 
     @staticmethod
     def _dispatch_send(channel, recipient_contact_info, subject, body, mentioned_user_ids=None, email_config=None):
         """Internal method to call specific senders."""
         if channel == 'email':
-            # Use company-specific email_config if provided, else global Django settings
-            smtp_server = email_config.get('smtp_server') if email_config else settings.EMAIL_HOST
-            smtp_port = email_config.get('smtp_port') if email_config else settings.EMAIL_PORT
-            from_address = email_config.get('from_email') if email_config else settings.DEFAULT_FROM_EMAIL
-            from_name = email_config.get('from_name', "MemoQ Ticket System") if email_config else "MemoQ Ticket System"
-            # Add logic for SMTP user/pass from email_config if they exist
-            
+            # Company-specific email_config if provided, else global Django settings
             return NotificationManager.send_email(
                 recipient_contact_info, subject, body, # Body is HTML for email
-                smtp_server, smtp_port, from_address, from_name
+                email_config=email_config
             )
         elif channel == 'enterprise_wechat':
             return NotificationManager.send_enterprise_wechat(
@@ -187,32 +995,40 @@ class NotificationManager:
         return False
 
     @staticmethod
-    def send_email(recipient_email, subject, html_content, smtp_server, smtp_port, from_address, from_name):
-        # ... (Existing logic - ensure it uses provided smtp_server etc.) ...
-        try:
-            msg = MIMEMultipart("alternative")
-            msg["Subject"] = subject
-            msg["From"] = f"{from_name} <{from_address}>"
-            msg["To"] = recipient_email
-            msg.attach(MIMEText(html_content, "html")) # Assuming body is HTML
-
-            # Use global Django settings for auth if not in company_email_config
-            smtp_user = getattr(settings, 'EMAIL_HOST_USER', None)
-            smtp_password = getattr(settings, 'EMAIL_HOST_PASSWORD', None)
-            use_tls = getattr(settings, 'EMAIL_USE_TLS', True)
-
-
-            with smtplib.SMTP(smtp_server, smtp_port) as server:
-                if use_tls: # Check settings or company_config
-                    server.starttls()
-                if smtp_user and smtp_password:
-                    server.login(smtp_user, smtp_password)
-                server.send_message(msg)
-            logger.info(f"邮件已发送至 {recipient_email}")
-            return True
-        except Exception as e:
-            logger.error(f"发送邮件失败 for {recipient_email}: {str(e)}")
-            return False
+    def build_email_message(recipient_email, subject, html_content, email_config=None):
+        from_address = (email_config or {}).get('from_email') or settings.DEFAULT_FROM_EMAIL
+        from_name = (email_config or {}).get('from_name') or "MemoQ Ticket System"
+        msg = MIMEMultipart("alternative")
+        msg["Subject"] = subject
+        msg["From"] = f"{from_name} <{from_address}>"
+        msg["To"] = recipient_email
+        msg.attach(MIMEText(html_content, "html")) # Assuming body is HTML
+        return msg
+
+    @staticmethod
+    def send_email(recipient_email, subject, html_content, email_config=None):
+        """Sends one email over a pooled SMTP session (see smtp_pool)."""
+        (sent, error), = NotificationManager.send_email_batch([(recipient_email, subject, html_content)], email_config)
+        return sent
+
+    @staticmethod
+    def send_email_batch(messages, email_config=None, progress=None):
+        """
+        Sends [(recipient_email, subject, html_content), ...] through one SMTP
+        session of the relay configured by `email_config` (or the settings).
+        Returns [(sent, error), ...] in the same order, or fewer when `progress`
+        (an EmailBatchProgress) stopped the batch.
+        """
+        results = smtp_pool.send_messages(smtp_config(email_config), [
+            NotificationManager.build_email_message(recipient, subject, html_content, email_config)
+            for recipient, subject, html_content in messages
+        ], progress)
+        for (recipient, _, _), (sent, error) in zip(messages, results):
+            if sent:
+                logger.info(f"邮件已发送至 {recipient}")
+            else:
+                logger.error(f"发送邮件失败 for {recipient}: {str(error)}")
+        return results
 
 
     @staticmethod
@@ -236,7 +1052,7 @@ class NotificationManager:
                     payload["markdown"]["content"] = f"{final_markdown_content}\n{mention_str}"
                     payload["markdown"]["mentioned_list"] = [uid for uid in mentioned_user_ids if uid]
             
-            response = requests.post(webhook_url, json=payload, timeout=10)
+            response = http_client.post(webhook_url, json=payload)
             response_data = response.json()
             if response.status_code == 200 and response_data.get("errcode") == 0:
                 logger.info(f"企业微信通知已发送至 {webhook_url}")
@@ -270,7 +1086,7 @@ class NotificationManager:
                     "elements": [{"tag": "div", "text": {"tag": "lark_md", "content": lark_md_content}}]
                 }
             }
-            response = requests.post(webhook_url, json=payload, timeout=10)
+            response = http_client.post(webhook_url, json=payload)
             response_data = response.json()
             if response.status_code == 200 and response_data.get("StatusCode") == 0:
                 logger.info(f"飞书通知已发送至 {webhook_url}")
@@ -0,0 +1,261 @@
+"""
+Worker side of the notification outbox (run_notification_worker).
+
+NotificationManager only writes NotificationOutbox rows; NotificationWorker
+claims due rows in batches and delivers them on a thread pool, so SMTP and
+webhook latency never reaches the request path; the sends themselves run on the
+asyncio dispatcher (dispatcher.py) with per-channel caps. Pre-rendered emails of the
+same company in a batch go out over one pooled SMTP session. Rows are claimed with a
+compare-and-set UPDATE and a lease (locked_until), which lets several workers
+share the table and hands a crashed worker's rows to the next one. Failed
+sends are retried per NotificationLog with jittered exponential backoff; an
+outage's backlog can be requeued at a bounded rate with schedule_replay(). Send outcomes
+are buffered in a NotificationLogWriter and written back with bulk_update.
+Webhook sends over their rate limit wait as "throttled" logs and go out as one
+digest card per webhook; emails to users in digest mode wait as "digest" logs
+and go out as one summary email per window.
+"""
+import logging
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import NotificationLog, NotificationOutbox
+from .notifications import NotificationLogWriter, NotificationManager, retry_delay, suppressed_sends, template_cache
+
+logger = logging.getLogger(__name__)
+
+
+def schedule_replay(queryset, rate_per_minute=None, now=None):
+    """
+    Requeue the failed / retry_failed logs of `queryset` for the worker instead of
+    sending them inline: each gets a fresh retry budget and a next_attempt_at
+    staggered at rate_per_minute per channel (NOTIFICATION_REPLAY_RATE_PER_MINUTE),
+    so replaying an outage's backlog does not flood the mail relay or a webhook.
+    Returns the number of logs requeued.
+    """
+    rate = rate_per_minute or getattr(settings, 'NOTIFICATION_REPLAY_RATE_PER_MINUTE', 60)
+    now = now or timezone.now()
+    log_entries = list(
+        queryset.filter(status__in=('failed', 'retry_failed')).order_by('id').only('id', 'notification_type')
+    )
+    positions = Counter()
+    for log_entry in log_entries:
+        position = positions[log_entry.notification_type]
+        positions[log_entry.notification_type] += 1
+        log_entry.status = 'failed'
+        log_entry.retry_attempts = 0
+        log_entry.next_attempt_at = now + timedelta(seconds=position * 60 / rate)
+    NotificationLog.objects.bulk_update(log_entries, ['status', 'retry_attempts', 'next_attempt_at'], batch_size=500)
+    return len(log_entries)
+
+
+class NotificationWorker:
+    DIGEST_STATUSES = ('throttled', 'digest')
+
+    def __init__(self, concurrency=4, batch_size=50, poll_interval=2, lease=timedelta(minutes=5), log=None):
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.log = log or logger.info
+        self.max_attempts = getattr(settings, 'NOTIFICATION_MAX_RETRIES', 5)
+        self.log_writer = NotificationLogWriter(max_size=batch_size)
+
+    def claimable_outbox(self, now):
+        return NotificationOutbox.objects.filter(
+            Q(status='pending', next_attempt_at__lte=now) | Q(status='processing', locked_until__lt=now)
+        )
+
+    def claim_outbox(self, now):
+        """Claim up to batch_size due outbox rows; a row another worker claimed first is skipped."""
+        candidates = self.claimable_outbox(now).order_by('next_attempt_at', 'id').values_list('id', flat=True)
+        claimed = [
+            pk for pk in candidates[:self.batch_size]
+            if self.claimable_outbox(now).filter(pk=pk).update(status='processing', locked_until=now + self.lease)
+        ]
+        return list(NotificationOutbox.objects.filter(pk__in=claimed).select_related('company', 'ticket', 'target_user__notification_config'))
+
+    def claim_logs(self, candidates, now):
+        """
+        Claim up to batch_size NotificationLogs of `candidates` by pushing next_attempt_at
+        out by the lease (compare-and-set on status and next_attempt_at); a row another
+        worker claimed or finished first is skipped.
+        """
+        claimed = [
+            pk for pk, status, next_attempt_at in candidates.values_list('id', 'status', 'next_attempt_at')[:self.batch_size]
+            if NotificationLog.objects.filter(pk=pk, status=status, next_attempt_at=next_attempt_at).update(
+                next_attempt_at=now + self.lease
+            )
+        ]
+        return list(NotificationLog.objects.filter(pk__in=claimed).select_related('outbox', 'template', 'company'))
+
+    def claim_retries(self, now):
+        """Claim failed NotificationLogs whose backoff has elapsed."""
+        return self.claim_logs(
+            NotificationLog.objects.filter(status='failed', next_attempt_at__lte=now).order_by('next_attempt_at'), now
+        )
+
+    def replay(self, queryset, limit=None):
+        """
+        Re-send the NotificationLogs of `queryset` (failed / retry_failed rows) in
+        batches of batch_size, each batch concurrently through the dispatcher.
+        Returns (replayed, sent).
+        """
+        replayed = sent = 0
+        last_id = 0
+        while limit is None or replayed < limit:
+            size = self.batch_size if limit is None else min(self.batch_size, limit - replayed)
+            ids = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:size])
+            if not ids:
+                break
+            last_id = ids[-1]
+            log_entries = self.claim_logs(queryset.filter(pk__in=ids).order_by('id'), timezone.now())
+            results = NotificationManager.retry_logs(log_entries, self.log_writer)
+            self.log_writer.flush()
+            replayed += len(log_entries)
+            sent += sum(results)
+            self.log(f"Replayed {replayed} notification logs, {sent} sent")
+        return replayed, sent
+
+    def claim_digests(self, now):
+        """
+        Claim the queued logs ("throttled" webhook sends, "digest" emails) of each
+        recipient that has a due one: the due rows (including ones whose lease expired)
+        are claimed with a compare-and-set UPDATE that stamps a claim token and the
+        lease, then the recipient's later-queued rows that no worker holds join them
+        under the same token, so they all go out in one digest.
+        """
+        lease_until = now + self.lease
+        recipients = NotificationLog.objects.filter(
+            status__in=self.DIGEST_STATUSES, next_attempt_at__lte=now
+        ).values_list('status', 'notification_type', 'recipient_info').distinct()
+        digests = []
+        for status, channel, recipient in recipients[:self.batch_size]:
+            token = uuid.uuid4().hex
+            queued = NotificationLog.objects.filter(status=status, notification_type=channel, recipient_info=recipient)
+            if not queued.filter(next_attempt_at__lte=now).update(next_attempt_at=lease_until, claim_token=token):
+                continue  # Claimed by another worker
+            queued.filter(claim_token__isnull=True).update(next_attempt_at=lease_until, claim_token=token)
+            digests.append(list(
+                queued.filter(claim_token=token).order_by('id').select_related('outbox', 'template', 'company', 'ticket')
+            ))
+        return digests
+
+    def process_entry(self, entry):
+        try:
+            NotificationManager.deliver_outbox_entry(entry, self.log_writer)
+        except Exception as e:
+            self.finish_entry(entry, e)
+        else:
+            self.finish_entry(entry)
+        finally:
+            close_old_connections()
+
+    def process_email_batch(self, entries):
+        """Pre-rendered emails of one company: one SMTP session for the whole group."""
+        self.process_batch(NotificationManager.deliver_email_batch, entries)
+
+    def process_messages(self, entries):
+        """Other pre-rendered messages of the batch, sent concurrently by the dispatcher."""
+        self.process_batch(NotificationManager.deliver_messages, entries)
+
+    def process_batch(self, deliver, entries):
+        try:
+            deliver(entries, self.log_writer)
+        except Exception as e:
+            for entry in entries:
+                self.finish_entry(entry, e)
+        else:
+            NotificationOutbox.objects.filter(pk__in=[entry.pk for entry in entries]).update(
+                status='done', attempts=F('attempts') + 1, locked_until=None, processed_at=timezone.now()
+            )
+        finally:
+            close_old_connections()
+
+    def finish_entry(self, entry, error=None):
+        entry.attempts += 1
+        entry.locked_until = None
+        if error is None:
+            entry.status = 'done'
+            entry.processed_at = timezone.now()
+            entry.save(update_fields=['status', 'attempts', 'locked_until', 'processed_at'])
+            return
+        logger.error(f"Notification outbox #{entry.pk} ({entry.event_type or entry.channel}) failed: {error}")
+        entry.last_error = str(error)
+        if entry.attempts < self.max_attempts:
+            entry.status = 'pending'
+            entry.next_attempt_at = timezone.now() + retry_delay(entry.attempts - 1)
+        else:
+            entry.status = 'failed'
+        entry.save(update_fields=['status', 'attempts', 'last_error', 'locked_until', 'next_attempt_at'])
+
+    def process_retries(self, log_entries):
+        """Due retries of one batch, sent concurrently by the dispatcher."""
+        try:
+            NotificationManager.retry_logs(log_entries, self.log_writer)
+        except Exception as e:
+            logger.error(f"Retrying {len(log_entries)} notification logs failed: {e}")
+        finally:
+            close_old_connections()
+
+    def process_digest(self, log_entries):
+        try:
+            if log_entries[0].status == 'digest':
+                NotificationManager.deliver_email_digest(log_entries, self.log_writer)
+            else:
+                NotificationManager.deliver_webhook_digest(log_entries, self.log_writer)
+        except Exception as e:
+            logger.error(f"Digest of {len(log_entries)} notifications to {log_entries[0].recipient_info} failed: {e}")
+        finally:
+            close_old_connections()
+
+    def run_once(self, executor):
+        """Claim and deliver one batch; returns the number of rows handled."""
+        now = timezone.now()
+        entries = self.claim_outbox(now)
+        retries = self.claim_retries(now)
+        digests = self.claim_digests(now)
+        email_batches = defaultdict(list)
+        messages, events = [], []
+        for entry in entries:
+            if entry.event_type:
+                events.append(entry)
+            elif entry.channel == 'email':
+                email_batches[entry.company_id].append(entry)
+            else:
+                messages.append(entry)
+        futures = [executor.submit(self.process_email_batch, batch) for batch in email_batches.values()]
+        if messages:
+            futures.append(executor.submit(self.process_messages, messages))
+        futures += [executor.submit(self.process_entry, entry) for entry in events]
+        if retries:
+            futures.append(executor.submit(self.process_retries, retries))
+        futures += [executor.submit(self.process_digest, log_entries) for log_entries in digests]
+        for future in futures:
+            future.result()
+        self.log_writer.flush()
+        if entries or retries or digests:
+            stats = template_cache.stats()
+            self.log(
+                f"Notification worker delivered {len(entries)} outbox entries, retried {len(retries)} sends, "
+                f"sent {len(digests)} digests, suppressed {suppressed_sends.total()} duplicates so far "
+                f"(template cache: {stats['hits']} hits / {stats['misses']} misses)"
+            )
+        return len(entries) + len(retries) + len(digests)
+
+    def run(self, once=False):
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="notify") as executor:
+            while True:
+                handled = self.run_once(executor)
+                if once and not handled:
+                    return
+                if handled < self.batch_size and not once:
+                    time.sleep(self.poll_interval)
@@ -0,0 +1,329 @@
+"""
+Full-text search over tickets.
+
+Every ticket has a TicketSearchDocument row holding its searchable text as
+pre-tokenized, space separated terms: `title` and `body` (description, company,
+people, type, labels and the ticket id). The database engine indexes that row:
+
+- SQLite: an external-content FTS5 table kept in sync by triggers; title hits rank first.
+- PostgreSQL: a stored `tsvector` column (title weighted 'A') with a GIN index,
+  ranked with ts_rank().
+
+Both engines only split on whitespace ('unicode61' / the 'simple' configuration),
+so Chinese-aware tokenization happens here, in Python, on both the indexing and
+the query side: latin words and digit runs become single terms, CJK runs become
+their characters plus overlapping bigrams.
+
+Reply content is searched separately through ReplySearchTerm, an inverted index
+(term -> reply, ticket) written by TicketReply.save with the same tokenizer.
+"""
+import html
+import math
+import re
+import unicodedata
+from collections import Counter
+
+from django.db import connection
+from django.db.models import Case, Count, Exists, ExpressionWrapper, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.expressions import RawSQL
+
+DOCUMENT_TABLE = "memoq_ticket_system_ticketsearchdocument"
+FTS_TABLE = "memoq_ticket_system_ticketsearch_fts"
+
+# Ticket fields whose change requires the ticket to be re-indexed.
+INDEXED_TICKET_FIELDS = frozenset(
+    ["title", "description", "company", "created_by", "submitted_by", "assigned_to", "ticket_type"]
+)
+
+_CJK = "㐀-䶿一-鿿豈-﫿぀-ヿ가-힯"
+_TERM_RE = re.compile(rf"[{_CJK}]+|[0-9a-z]+")
+_CJK_RE = re.compile(rf"[{_CJK}]")
+
+
+def _normalize(text):
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def _cjk_terms(run, unigrams):
+    if len(run) == 1:
+        return [run]
+    bigrams = [run[i:i + 2] for i in range(len(run) - 1)]
+    return list(run) + bigrams if unigrams else bigrams
+
+
+def tokenize(text):
+    """Index-side terms: latin words, CJK characters and CJK bigrams."""
+    terms = []
+    for match in _TERM_RE.findall(_normalize(text)):
+        terms.extend(_cjk_terms(match, unigrams=True) if _CJK_RE.match(match) else [match])
+    return terms
+
+
+def query_terms(text):
+    """
+    Query-side terms, de-duplicated in order. CJK runs of two or more characters
+    only use bigrams (single characters would match far too broadly); a
+    single-character query still matches through the indexed unigrams.
+    """
+    terms = []
+    for match in _TERM_RE.findall(_normalize(text)):
+        for term in _cjk_terms(match, unigrams=False) if _CJK_RE.match(match) else [match]:
+            if term not in terms:
+                terms.append(term)
+    return terms
+
+
+def build_document(ticket):
+    """(title, body) term strings for a ticket with its relations loaded."""
+    people = [ticket.created_by, ticket.submitted_by, ticket.assigned_to]
+    parts = [
+        str(ticket.pk),
+        ticket.description,
+        ticket.company.name if ticket.company_id else "",
+        ticket.ticket_type.name if ticket.ticket_type_id else "",
+        *(user.username for user in people if user is not None),
+        *(label.name for label in ticket.labels.all()),
+    ]
+    return " ".join(tokenize(ticket.title)), " ".join(tokenize(" ".join(p for p in parts if p)))
+
+
+def index_tickets(ticket_ids):
+    """Create or refresh the search documents of the given tickets."""
+    from .models import Ticket, TicketSearchDocument
+
+    ticket_ids = list(ticket_ids)
+    if not ticket_ids:
+        return 0
+    tickets = Ticket.objects.filter(pk__in=ticket_ids).select_related(
+        "company", "created_by", "submitted_by", "assigned_to", "ticket_type"
+    ).prefetch_related("labels")
+    documents = []
+    for ticket in tickets:
+        title, body = build_document(ticket)
+        documents.append(TicketSearchDocument(ticket_id=ticket.pk, title=title, body=body))
+
+    existing = set(
+        TicketSearchDocument.objects.filter(ticket_id__in=ticket_ids).values_list("ticket_id", flat=True)
+    )
+    TicketSearchDocument.objects.bulk_create([d for d in documents if d.ticket_id not in existing])
+    TicketSearchDocument.objects.bulk_update([d for d in documents if d.ticket_id in existing], ["title", "body"])
+    return len(documents)
+
+
+# --- Reply inverted index ---
+
+MAX_TERM_LENGTH = 64  # ReplySearchTerm.term max_length; longer runs (hashes, base64) are dropped
+SNIPPET_RADIUS = 40
+
+
+def reply_terms(reply):
+    """ReplySearchTerm rows (unsaved) for a reply."""
+    from .models import ReplySearchTerm
+
+    counts = Counter(t for t in tokenize(reply.content) if len(t) <= MAX_TERM_LENGTH)
+    return [
+        ReplySearchTerm(
+            term=term, reply_id=reply.pk, ticket_id=reply.ticket_id,
+            term_frequency=frequency, is_internal=reply.is_internal,
+        )
+        for term, frequency in counts.items()
+    ]
+
+
+def index_reply(reply):
+    """Replace the index rows of one reply; called from TicketReply.save inside its transaction."""
+    from .models import ReplySearchTerm
+
+    ReplySearchTerm.objects.filter(reply_id=reply.pk).delete()
+    ReplySearchTerm.objects.bulk_create(reply_terms(reply))
+
+
+def index_replies(replies):
+    """Batch variant of index_reply for backfills: two statements per batch."""
+    from .models import ReplySearchTerm
+
+    replies = list(replies)
+    ReplySearchTerm.objects.filter(reply_id__in=[r.pk for r in replies]).delete()
+    rows = [row for reply in replies for row in reply_terms(reply)]
+    ReplySearchTerm.objects.bulk_create(rows, batch_size=2000)
+    return len(rows)
+
+
+def search_replies(text, tickets, include_internal=True, limit=20):
+    """
+    Rank the tickets in `tickets` (a Ticket queryset, already scoped to the user)
+    whose replies contain every query term.
+
+    Score = sum over terms of term_frequency / log(2 + document frequency), so
+    rare terms weigh more than ones that appear on most tickets. Returns
+    (total, results) where results are dicts with ticket_id, score, reply_id
+    and snippet, best first.
+    """
+    from .models import ReplySearchTerm, TicketReply
+
+    terms = [t for t in query_terms(text) if len(t) <= MAX_TERM_LENGTH]
+    if not terms:
+        return 0, []
+
+    # Correlated EXISTS rather than ticket_id IN (...): SQLite otherwise probes the
+    # (term, ticket) index once per visible ticket, i.e. the whole table for admins.
+    rows = ReplySearchTerm.objects.filter(Exists(tickets.filter(pk=OuterRef("ticket_id"))), term__in=terms)
+    if not include_internal:
+        rows = rows.filter(is_internal=False)
+
+    document_frequency = dict(
+        rows.values_list("term").annotate(df=Count("ticket_id", distinct=True)).values_list("term", "df")
+    )
+    if len(document_frequency) < len(terms):  # some term occurs nowhere, AND can't match
+        return 0, []
+    weighted_tf = Case(
+        *[
+            When(term=term, then=ExpressionWrapper(F("term_frequency") / Value(math.log(2 + df)), output_field=FloatField()))
+            for term, df in document_frequency.items()
+        ],
+        output_field=FloatField(),
+    )
+
+    ranked = rows.values("ticket_id").annotate(
+        matched_terms=Count("term", distinct=True), score=Sum(weighted_tf),
+    ).filter(matched_terms=len(terms))
+    total = ranked.count()
+    top = list(ranked.order_by("-score", "-ticket_id")[:limit])
+    if not top:
+        return total, []
+
+    # Best reply per ticket: the one carrying the highest raw term frequency.
+    best_reply = {}
+    for row in rows.filter(ticket_id__in=[r["ticket_id"] for r in top]).values(
+        "ticket_id", "reply_id"
+    ).annotate(tf=Sum("term_frequency")).order_by("ticket_id", "-tf", "-reply_id"):
+        best_reply.setdefault(row["ticket_id"], row["reply_id"])
+    contents = dict(TicketReply.objects.filter(pk__in=best_reply.values()).values_list("pk", "content"))
+
+    results = []
+    for row in top:
+        reply_id = best_reply.get(row["ticket_id"])
+        results.append({
+            "ticket_id": row["ticket_id"],
+            "score": round(row["score"], 4),
+            "reply_id": reply_id,
+            "snippet": make_snippet(contents.get(reply_id, ""), terms),
+        })
+    return total, results
+
+
+def make_snippet(content, terms, radius=SNIPPET_RADIUS):
+    """Text around the first occurrence of any query term, with matched spans wrapped in <mark>."""
+    normalized = _normalize(content)
+    if len(normalized) != len(content):  # NFKC changed offsets; match on the raw lowercased text instead
+        normalized = content.lower()
+    hits = [i for i in (normalized.find(t) for t in terms) if i >= 0]
+    start = min(hits) if hits else 0
+    begin, end = max(0, start - radius), min(len(content), start + radius * 2)
+
+    # Merge overlapping term matches (CJK bigrams overlap) into single highlighted spans.
+    window = normalized[begin:end]
+    spans = sorted(
+        (m.start(), m.start() + len(t)) for t in terms for m in re.finditer(re.escape(t), window)
+    )
+    merged = []
+    for span_start, span_end in spans:
+        if merged and span_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], span_end)
+        else:
+            merged.append([span_start, span_end])
+
+    text, parts, cursor = content[begin:end], [], 0
+    for span_start, span_end in merged:
+        parts.append(html.escape(text[cursor:span_start]))
+        parts.append(f"<mark>{html.escape(text[span_start:span_end])}</mark>")
+        cursor = span_end
+    parts.append(html.escape(text[cursor:]))
+    return ("…" if begin > 0 else "") + "".join(parts) + ("…" if end < len(content) else "")
+
+
+class SQLiteSearchBackend:
+    vendor = "sqlite"
+
+    def match(self, terms):
+        # Every term is quoted (implicit AND); the last latin term is a prefix so
+        # results show up while the agent is still typing.
+        quoted = [f'"{t}"' for t in terms]
+        if terms[-1].isascii():
+            quoted[-1] += "*"
+        return " ".join(quoted)
+
+    def _rowids(self, match):
+        return RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+
+    def matching_ids(self, terms):
+        return self._rowids(self.match(terms))
+
+    def rank(self, terms):
+        # A correlated bm25() has to re-run MATCH for every candidate row, which is
+        # far too slow on large result sets. Ranking is therefore two-level here:
+        # title hits (one more semi-join) before body-only hits.
+        return Case(
+            When(pk__in=self._rowids(f"title : ({self.match(terms)})"), then=Value(1.0)),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+
+    def is_installed(self):
+        return FTS_TABLE in connection.introspection.table_names()
+
+    def optimize(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+
+
+class PostgresSearchBackend:
+    vendor = "postgresql"
+
+    def tsquery(self, terms):
+        # Terms only contain [0-9a-z] or CJK characters, so quoting them is enough.
+        parts = [f"'{t}'" for t in terms]
+        if terms[-1].isascii():
+            parts[-1] += ":*"
+        return " & ".join(parts)
+
+    def matching_ids(self, terms):
+        return RawSQL(
+            f"SELECT ticket_id FROM {DOCUMENT_TABLE} WHERE search_vector @@ to_tsquery('simple', %s)",
+            [self.tsquery(terms)],
+        )
+
+    def rank(self, terms):
+        # ts_rank over the stored vector, where title terms carry weight 'A'.
+        from .models import TicketSearchDocument
+
+        return Subquery(
+            TicketSearchDocument.objects.filter(ticket_id=OuterRef("pk")).annotate(
+                rank=RawSQL("ts_rank(search_vector, to_tsquery('simple', %s))", [self.tsquery(terms)],
+                            output_field=FloatField())
+            ).values("rank")[:1],
+            output_field=FloatField(),
+        )
+
+    def is_installed(self):
+        with connection.cursor() as cursor:
+            columns = connection.introspection.get_table_description(cursor, DOCUMENT_TABLE)
+        return any(column.name == "search_vector" for column in columns)
+
+    def optimize(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"VACUUM ANALYZE {DOCUMENT_TABLE}")
+
+
+_BACKENDS = {b.vendor: b for b in (SQLiteSearchBackend(), PostgresSearchBackend())}
+_installed = {}
+
+
+def get_search_backend():
+    """Backend for the current database, or None when full-text search is unavailable."""
+    backend = _BACKENDS.get(connection.vendor)
+    if backend is None:
+        return None
+    if connection.alias not in _installed:
+        _installed[connection.alias] = backend.is_installed()
+    return backend if _installed[connection.alias] else None
@@ -80,6 +80,20 @@ DATABASES = {
     }
 }
 
+# 缓存：设置 REDIS_HOST 时使用 Redis（所有 gunicorn 进程和通知进程共享），否则使用进程内缓存
+# （通知模板、技术支持名单等索引的版本号保存在数据库中，进程内缓存时最多延迟 CACHE_VERSION_CHECK_SECONDS 秒生效）
+REDIS_HOST = os.getenv("REDIS_HOST")
+if REDIS_HOST:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": f"redis://{REDIS_HOST}:{os.getenv('REDIS_PORT', 6379)}/{os.getenv('REDIS_DB', 0)}",
+        }
+    }
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+CACHE_VERSION_CHECK_SECONDS = int(os.getenv("CACHE_VERSION_CHECK_SECONDS", 10))  # 缓存中的索引版本号过期后重新读取数据库
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -159,6 +173,11 @@ FILE_UPLOAD_MAX_MEMORY_SIZE = int(
 DATA_UPLOAD_MAX_MEMORY_SIZE = int(
     os.getenv("DJANGO_DATA_UPLOAD_MAX_MEMORY_SIZE", 10 * 1024 * 1024)
 )  # 10MB
+# 上传处理器在接收文件时顺带计算 SHA-256，附件按内容去重时无需再次读取文件
+FILE_UPLOAD_HANDLERS = [
+    "memoq_ticket_system.uploads.HashingMemoryFileUploadHandler",
+    "memoq_ticket_system.uploads.HashingTemporaryFileUploadHandler",
+]
 MAX_ATTACHMENT_SIZE = FILE_UPLOAD_MAX_MEMORY_SIZE
 ALLOWED_ATTACHMENT_EXTENSIONS = [
     ".jpg",
@@ -177,6 +196,20 @@ ALLOWED_ATTACHMENT_EXTENSIONS = [
     ".rar",
 ]
 
+# 可续传的分块上传（大文件，如 memoQ TM/TB 导出）：客户端按分块大小逐块 PUT，
+# 分块暂存在本地目录或作为 COS 分片，完成后才创建附件记录
+ATTACHMENT_UPLOAD_MAX_SIZE = int(os.getenv("ATTACHMENT_UPLOAD_MAX_SIZE", 1024 * 1024 * 1024))  # 1GB
+ATTACHMENT_UPLOAD_CHUNK_SIZE = int(os.getenv("ATTACHMENT_UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024))  # 需小于 DATA_UPLOAD_MAX_MEMORY_SIZE，COS 要求至少 1MB
+ATTACHMENT_UPLOAD_STAGING_DIR = os.getenv("ATTACHMENT_UPLOAD_STAGING_DIR", os.path.join(BASE_DIR, "upload_staging"))  # 与 MEDIA_ROOT 同一文件系统时完成上传只需移动文件
+ATTACHMENT_UPLOAD_SESSION_TTL_HOURS = int(os.getenv("ATTACHMENT_UPLOAD_SESSION_TTL_HOURS", 24))  # 超过该时长未活动的会话由 purge_upload_sessions 清理
+
+# 本地附件下载交给前端 Web 服务器发送：'nginx'（X-Accel-Redirect）、'apache'（X-Sendfile），
+# 留空则由 Django 发送（支持 Range 断点续传）
+ATTACHMENT_DOWNLOAD_OFFLOAD = os.getenv("ATTACHMENT_DOWNLOAD_OFFLOAD", "")
+ATTACHMENT_DOWNLOAD_ACCEL_PREFIX = os.getenv("ATTACHMENT_DOWNLOAD_ACCEL_PREFIX", "/protected-media/")  # nginx 中 alias 到 MEDIA_ROOT 的 internal location
+# 附件下载次数在进程内累计，每隔 N 秒用一条 UPDATE 批量写入；0 表示每次下载立即写入
+ATTACHMENT_DOWNLOAD_COUNT_FLUSH_SECONDS = int(os.getenv("ATTACHMENT_DOWNLOAD_COUNT_FLUSH_SECONDS", 30))
+
 # 腾讯云COS配置
 TENCENT_COS_SECRET_ID = os.getenv("TENCENT_COS_SECRET_ID", None)
 TENCENT_COS_SECRET_KEY = os.getenv("TENCENT_COS_SECRET_KEY", None)
@@ -191,6 +224,11 @@ TENCENT_COS_BASE_URL = os.getenv(
     ),
 )
 
+# COS 分片上传：超过阈值的附件按分片流式上传，单个上传的内存占用约为 分片大小 × (并发数 + 1)
+TENCENT_COS_MULTIPART_THRESHOLD = int(os.getenv("TENCENT_COS_MULTIPART_THRESHOLD", 8 * 1024 * 1024))  # 字节
+TENCENT_COS_PART_SIZE = int(os.getenv("TENCENT_COS_PART_SIZE", 8 * 1024 * 1024))  # 字节，COS 要求至少 1MB
+TENCENT_COS_PART_CONCURRENCY = int(os.getenv("TENCENT_COS_PART_CONCURRENCY", 4))
+
 # 文件存储后端选择 ('local' 或 'cos')
 # 默认为 'local'，如果COS配置完整则可以考虑切换为 'cos'
 DEFAULT_FILE_STORAGE_BACKEND = os.getenv("DEFAULT_FILE_STORAGE_BACKEND", "local")
@@ -229,3 +267,29 @@ LOGGING = {
         },
     },
 }
+
+# 通知发件箱（run_notification_worker）重试设置
+NOTIFICATION_MAX_RETRIES = int(os.getenv("NOTIFICATION_MAX_RETRIES", 5))  # 超过后标记为“重试失败”
+NOTIFICATION_RETRY_BASE_SECONDS = int(os.getenv("NOTIFICATION_RETRY_BASE_SECONDS", 60))  # 第 n 次重试等待 base * 2^n 秒
+NOTIFICATION_RETRY_MAX_SECONDS = int(os.getenv("NOTIFICATION_RETRY_MAX_SECONDS", 3600))  # 实际等待时间在上限的 1/2 到 1 倍之间随机
+NOTIFICATION_REPLAY_RATE_PER_MINUTE = int(os.getenv("NOTIFICATION_REPLAY_RATE_PER_MINUTE", 60))  # 批量重发时每个渠道每分钟重新排队的条数
+NOTIFICATION_DEDUPE_WINDOW_SECONDS = int(os.getenv("NOTIFICATION_DEDUPE_WINDOW_SECONDS", 300))  # 同一工单/事件/收件人/渠道在该时间段内只发送一次，0 为关闭
+
+# 通知并发发送（dispatcher.py）：每个渠道同时进行的发送数上限，以及单次发送的截止时间
+NOTIFICATION_CHANNEL_CONCURRENCY = {
+    "email": int(os.getenv("NOTIFICATION_EMAIL_CONCURRENCY", 4)),  # 与 SMTP 连接池每个服务器保留的会话数一致
+    "feishu": int(os.getenv("NOTIFICATION_FEISHU_CONCURRENCY", 8)),
+    "enterprise_wechat": int(os.getenv("NOTIFICATION_ENTERPRISE_WECHAT_CONCURRENCY", 8)),
+}
+NOTIFICATION_SEND_DEADLINE_SECONDS = float(os.getenv("NOTIFICATION_SEND_DEADLINE_SECONDS", 15))  # 应大于 HTTP 连接+读取超时之和
+
+# 出站 HTTP（Webhook 通知、第三方登录）连接池设置，见 http_client.py
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 3.05))  # 秒
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 10))  # 秒
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", 2))  # 连接失败时的重试次数（POST 请求读取超时/被重置时不重试，避免重复发送）
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", 16))  # 每个主机保持的长连接数
+
+# 飞书/企业微信群机器人限流（每个 Webhook 一个令牌桶），见 webhook_limiter.py；超出的消息合并为汇总卡片发送
+WEBHOOK_RATE_LIMIT_PER_MINUTE = float(os.getenv("WEBHOOK_RATE_LIMIT_PER_MINUTE", 20))
+WEBHOOK_RATE_LIMIT_BURST = int(os.getenv("WEBHOOK_RATE_LIMIT_BURST", 5))  # 令牌桶容量（允许的突发条数）
+WEBHOOK_DIGEST_MAX_BYTES = int(os.getenv("WEBHOOK_DIGEST_MAX_BYTES", 3500))  # 汇总卡片正文长度上限（企业微信 markdown 限 4096 字节）
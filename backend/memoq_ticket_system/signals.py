@@ -1,7 +1,12 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save, m2m_changed
 from django.dispatch import receiver
-from .models import Ticket, TicketReply, NotificationLog
-from .notifications import NotificationManager
+from django.utils import timezone
+from .models import Attachment, CompanyConfig, NotificationConfig, NotificationTemplate, Ticket, TicketReply, User
+from .notifications import NotificationManager, digest_subscribers, support_roster, template_cache, template_index
+from .search import INDEXED_TICKET_FIELDS, index_tickets
+from .sla import rebuild_sla_state
+from .uploads import release_blob
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,7 +15,8 @@ logger = logging.getLogger(__name__)
 @receiver(post_save, sender=Ticket)
 def ticket_notification_handler(sender, instance, created, **kwargs):
     """
-    处理工单创建和更新的通知
+    处理工单创建和更新的通知。
+    通知只写入发件箱（与工单在同一事务中提交），由 run_notification_worker 发送
     """
     try:
         # 获取相关对象
@@ -19,17 +25,9 @@ def ticket_notification_handler(sender, instance, created, **kwargs):
         created_by = ticket.created_by
         assigned_to = ticket.assigned_to
 
-        # 记录通知日志
-        notification_log = NotificationLog(
-            user=created_by,
-            ticket=ticket,
-            notification_type=(
-                "ticket_status_change" if not created else "ticket_created"
-            ),
-        )
-
         if created:
-            # 工单创建通知
+            # 工单创建通知（来源事件相同的通知只发送一次，见 NotificationManager.send_notifications）
+            event_key = f"ticket:{ticket.id}:created"
             # 1. 通知技术支持团队
             subject = f"新工单 #{ticket.id}: {ticket.title}"
             content = f"""
@@ -37,31 +35,27 @@ def ticket_notification_handler(sender, instance, created, **kwargs):
             <p><strong>工单号:</strong> #{ticket.id}</p>
             <p><strong>标题:</strong> {ticket.title}</p>
             <p><strong>公司:</strong> {company.name}</p>
-            <p><strong>优先级:</strong> {ticket.get_priority_display()}</p>
+            <p><strong>优先级:</strong> {ticket.get_urgency_display()}</p>
             <p><strong>创建者:</strong> {created_by.username}</p>
             <p><strong>描述:</strong> {ticket.description[:200]}...</p>
             <p><a href="{get_ticket_url(ticket.id)}">点击查看工单详情</a></p>
             """
 
-            # 获取所有技术支持人员的邮箱
-            from .models import User
+            # 获取所有技术支持人员的邮箱（缓存的技术支持名单，已按通知配置过滤）
+            support_emails = support_roster.emails(roles=[User.ROLE_SUPPORT])
 
-            support_emails = User.objects.filter(role="support").values_list(
-                "email", flat=True
+            # 一次插入全部收件人的发送队列记录
+            NotificationManager.send_notifications(
+                "email", support_emails, subject, content, ticket=ticket, company=company, event_key=event_key
             )
 
-            for email in support_emails:
-                NotificationManager.send_notification(
-                    "email", email, subject, content, ticket=ticket, company=company
-                )
-
             # 2. 通知客户工单已创建
             customer_subject = f"您的工单 #{ticket.id} 已创建"
             customer_content = f"""
             <h2>您的工单已成功创建</h2>
             <p><strong>工单号:</strong> #{ticket.id}</p>
             <p><strong>标题:</strong> {ticket.title}</p>
-            <p><strong>优先级:</strong> {ticket.get_priority_display()}</p>
+            <p><strong>优先级:</strong> {ticket.get_urgency_display()}</p>
             <p><strong>描述:</strong> {ticket.description[:200]}...</p>
             <p>我们的技术支持团队将尽快处理您的工单。</p>
             <p><a href="{get_ticket_url(ticket.id)}">点击查看工单详情</a></p>
@@ -76,6 +70,7 @@ def ticket_notification_handler(sender, instance, created, **kwargs):
                     customer_content,
                     ticket=ticket,
                     company=company,
+                    event_key=event_key,
                 )
             elif ticket.contact_method == "wechat":
                 NotificationManager.send_notification(
@@ -85,6 +80,7 @@ def ticket_notification_handler(sender, instance, created, **kwargs):
                     customer_content,
                     ticket=ticket,
                     company=company,
+                    event_key=event_key,
                 )
             elif ticket.contact_method == "enterprise_wechat":
                 NotificationManager.send_notification(
@@ -94,6 +90,7 @@ def ticket_notification_handler(sender, instance, created, **kwargs):
                     customer_content,
                     ticket=ticket,
                     company=company,
+                    event_key=event_key,
                 )
             elif ticket.contact_method == "feishu":
                 NotificationManager.send_notification(
@@ -103,9 +100,10 @@ def ticket_notification_handler(sender, instance, created, **kwargs):
                     customer_content,
                     ticket=ticket,
                     company=company,
+                    event_key=event_key,
                 )
 
-            notification_log.message = f"工单创建通知已发送"
+            logger.info(f"工单 #{ticket.id}: 工单创建通知已加入发送队列")
 
         else:
             # 工单更新通知
@@ -115,6 +113,7 @@ def ticket_notification_handler(sender, instance, created, **kwargs):
                 and instance._original_status != instance.status
             ):
                 # 状态变更通知
+                event_key = f"ticket:{ticket.id}:status:{instance._original_status}:{ticket.status}"
                 status_subject = (
                     f"工单 #{ticket.id} 状态已更新: {ticket.get_status_display()}"
                 )
@@ -136,6 +135,7 @@ def ticket_notification_handler(sender, instance, created, **kwargs):
                         status_content,
                         ticket=ticket,
                         company=company,
+                        event_key=event_key,
                     )
                 elif ticket.contact_method == "wechat":
                     NotificationManager.send_notification(
@@ -145,6 +145,7 @@ def ticket_notification_handler(sender, instance, created, **kwargs):
                         status_content,
                         ticket=ticket,
                         company=company,
+                        event_key=event_key,
                     )
                 elif ticket.contact_method == "enterprise_wechat":
                     NotificationManager.send_notification(
@@ -154,6 +155,7 @@ def ticket_notification_handler(sender, instance, created, **kwargs):
                         status_content,
                         ticket=ticket,
                         company=company,
+                        event_key=event_key,
                     )
                 elif ticket.contact_method == "feishu":
                     NotificationManager.send_notification(
@@ -163,6 +165,7 @@ def ticket_notification_handler(sender, instance, created, **kwargs):
                         status_content,
                         ticket=ticket,
                         company=company,
+                        event_key=event_key,
                     )
 
                 # 如果有分配的技术支持，也通知他们
@@ -174,11 +177,10 @@ def ticket_notification_handler(sender, instance, created, **kwargs):
                         status_content,
                         ticket=ticket,
                         company=company,
+                        event_key=event_key,
                     )
 
-                notification_log.message = (
-                    f"工单状态更新通知已发送: {ticket.get_status_display()}"
-                )
+                logger.info(f"工单 #{ticket.id}: 状态更新通知已加入发送队列: {ticket.get_status_display()}")
 
             # 检查分配是否变更
             if (
@@ -187,13 +189,14 @@ def ticket_notification_handler(sender, instance, created, **kwargs):
             ):
                 # 分配变更通知
                 if assigned_to:
+                    event_key = f"ticket:{ticket.id}:assigned:{assigned_to.pk}"
                     assign_subject = f"工单 #{ticket.id} 已分配给您"
                     assign_content = f"""
                     <h2>工单已分配给您</h2>
                     <p><strong>工单号:</strong> #{ticket.id}</p>
                     <p><strong>标题:</strong> {ticket.title}</p>
                     <p><strong>公司:</strong> {company.name}</p>
-                    <p><strong>优先级:</strong> {ticket.get_priority_display()}</p>
+                    <p><strong>优先级:</strong> {ticket.get_urgency_display()}</p>
                     <p><strong>状态:</strong> {ticket.get_status_display()}</p>
                     <p><a href="{get_ticket_url(ticket.id)}">点击查看工单详情</a></p>
                     """
@@ -205,13 +208,10 @@ def ticket_notification_handler(sender, instance, created, **kwargs):
                         assign_content,
                         ticket=ticket,
                         company=company,
+                        event_key=event_key,
                     )
 
-                    notification_log.message = (
-                        f"工单分配通知已发送给: {assigned_to.username}"
-                    )
-
-        notification_log.save()
+                    logger.info(f"工单 #{ticket.id}: 分配通知已加入发送队列: {assigned_to.username}")
 
     except Exception as e:
         logger.error(f"发送工单通知失败: {str(e)}")
@@ -220,7 +220,7 @@ def ticket_notification_handler(sender, instance, created, **kwargs):
 @receiver(post_save, sender=TicketReply)
 def reply_notification_handler(sender, instance, created, **kwargs):
     """
-    处理工单回复的通知
+    处理工单回复的通知（写入发件箱，由 run_notification_worker 发送）
     """
     if not created:
         # 只处理新创建的回复
@@ -232,6 +232,7 @@ def reply_notification_handler(sender, instance, created, **kwargs):
         ticket = reply.ticket
         company = ticket.company
         user = reply.user
+        event_key = f"reply:{reply.pk}"
 
         # 如果是内部备注，不发送通知给客户
         if reply.is_internal:
@@ -249,27 +250,16 @@ def reply_notification_handler(sender, instance, created, **kwargs):
             <p><a href="{get_ticket_url(ticket.id)}">点击查看工单详情</a></p>
             """
 
-            # 获取所有技术支持人员的邮箱
-            from .models import User
+            # 获取所有技术支持人员的邮箱，不发送给备注者自己
+            support_emails = support_roster.emails(exclude_user=user)
 
-            support_emails = User.objects.filter(
-                role__in=["support", "admin"]
-            ).values_list("email", flat=True)
-
-            for email in support_emails:
-                if email != user.email:  # 不发送给备注者自己
-                    NotificationManager.send_notification(
-                        "email", email, subject, content, ticket=ticket, company=company
-                    )
-
-            # 记录通知日志
-            NotificationLog.objects.create(
-                user=user,
-                ticket=ticket,
-                notification_type="internal_note",
-                message="内部备注通知已发送给技术支持团队",
+            # 一次插入全部收件人的发送队列记录
+            NotificationManager.send_notifications(
+                "email", support_emails, subject, content, ticket=ticket, company=company, event_key=event_key
             )
 
+            logger.info(f"工单 #{ticket.id}: 内部备注通知已加入发送队列（技术支持团队）")
+
         else:
             # 普通回复，通知相关人员
             subject = f"工单 #{ticket.id} 有新回复"
@@ -285,25 +275,15 @@ def reply_notification_handler(sender, instance, created, **kwargs):
             # 如果回复者是客户，通知技术支持团队
             if user.role == "customer":
                 # 获取所有技术支持人员的邮箱
-                from .models import User
-
-                support_emails = User.objects.filter(
-                    role__in=["support", "admin"]
-                ).values_list("email", flat=True)
+                support_emails = support_roster.emails()
 
-                for email in support_emails:
-                    NotificationManager.send_notification(
-                        "email", email, subject, content, ticket=ticket, company=company
-                    )
-
-                # 记录通知日志
-                NotificationLog.objects.create(
-                    user=user,
-                    ticket=ticket,
-                    notification_type="customer_reply",
-                    message="客户回复通知已发送给技术支持团队",
+                # 一次插入全部收件人的发送队列记录
+                NotificationManager.send_notifications(
+                    "email", support_emails, subject, content, ticket=ticket, company=company, event_key=event_key
                 )
 
+                logger.info(f"工单 #{ticket.id}: 客户回复通知已加入发送队列（技术支持团队）")
+
             # 如果回复者是技术支持，通知客户
             elif user.role in ["support", "admin"]:
                 # 根据客户选择的联系方式发送通知
@@ -315,6 +295,7 @@ def reply_notification_handler(sender, instance, created, **kwargs):
                         content,
                         ticket=ticket,
                         company=company,
+                        event_key=event_key,
                     )
                 elif ticket.contact_method == "wechat":
                     NotificationManager.send_notification(
@@ -324,6 +305,7 @@ def reply_notification_handler(sender, instance, created, **kwargs):
                         content,
                         ticket=ticket,
                         company=company,
+                        event_key=event_key,
                     )
                 elif ticket.contact_method == "enterprise_wechat":
                     NotificationManager.send_notification(
@@ -333,6 +315,7 @@ def reply_notification_handler(sender, instance, created, **kwargs):
                         content,
                         ticket=ticket,
                         company=company,
+                        event_key=event_key,
                     )
                 elif ticket.contact_method == "feishu":
                     NotificationManager.send_notification(
@@ -342,20 +325,130 @@ def reply_notification_handler(sender, instance, created, **kwargs):
                         content,
                         ticket=ticket,
                         company=company,
+                        event_key=event_key,
                     )
 
-                # 记录通知日志
-                NotificationLog.objects.create(
-                    user=user,
-                    ticket=ticket,
-                    notification_type="support_reply",
-                    message="技术支持回复通知已发送给客户",
-                )
+                logger.info(f"工单 #{ticket.id}: 技术支持回复通知已加入发送队列（客户）")
 
     except Exception as e:
         logger.error(f"发送回复通知失败: {str(e)}")
 
 
+def _schedule_search_index(ticket_ids):
+    """
+    事务提交后刷新工单搜索文档；索引失败只记录日志，不影响业务写入
+    """
+    ticket_ids = list(ticket_ids)
+
+    def run():
+        try:
+            index_tickets(ticket_ids)
+        except Exception as e:
+            logger.error(f"更新工单搜索索引失败 {ticket_ids}: {str(e)}")
+
+    transaction.on_commit(run)
+
+
+@receiver(post_save, sender=Ticket)
+def ticket_search_index_handler(sender, instance, created, update_fields=None, **kwargs):
+    """
+    工单写入后同步搜索索引。回复写入会经由 TicketReply.save 保存工单，因此同样触发。
+    只更新了非检索字段（如 SLA 截止时间）的保存会被跳过。
+    """
+    if update_fields is not None and not INDEXED_TICKET_FIELDS.intersection(update_fields):
+        return
+    _schedule_search_index([instance.pk])
+
+
+@receiver(m2m_changed, sender=Ticket.labels.through)
+def ticket_labels_search_index_handler(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    工单标签变化后同步搜索索引
+    """
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        _schedule_search_index([instance.pk])
+    elif pk_set:
+        _schedule_search_index(pk_set)
+
+
+# 影响已有工单闲置截止时间/SLA 标记的公司配置字段（SLA 截止时间在工单创建时确定，修改 SLA 时长只影响新工单）
+SLA_STATE_CONFIG_FIELDS = {"idle_timeout_minutes"}
+
+
+@receiver(pre_save, sender=CompanyConfig)
+def company_config_sla_state_check(sender, instance, update_fields=None, **kwargs):
+    """
+    记录本次保存是否修改了 SLA_STATE_CONFIG_FIELDS，供保存后决定是否重算
+    """
+    instance._sla_state_changed = False
+    if instance.pk is None or (update_fields is not None and not SLA_STATE_CONFIG_FIELDS.intersection(update_fields)):
+        return
+    previous = CompanyConfig.objects.filter(pk=instance.pk).values(*SLA_STATE_CONFIG_FIELDS).first()
+    instance._sla_state_changed = previous is not None and any(
+        previous[field] != getattr(instance, field) for field in SLA_STATE_CONFIG_FIELDS
+    )
+
+
+@receiver(post_save, sender=CompanyConfig)
+def company_config_sla_state_handler(sender, instance, created, **kwargs):
+    """
+    公司闲置超时变化后，在事务提交后重算该公司工单的闲置截止时间和 SLA/闲置标记；
+    其他配置的修改不触发重算
+    """
+    if created or not getattr(instance, "_sla_state_changed", False):
+        return
+    company_id = instance.company_id
+    transaction.on_commit(lambda: rebuild_sla_state(timezone.now(), company_id=company_id))
+
+
+@receiver(post_save, sender=NotificationTemplate)
+@receiver(post_delete, sender=NotificationTemplate)
+def notification_template_cache_handler(sender, instance, **kwargs):
+    """
+    通知模板修改或删除后，清除本进程中该模板的编译缓存（其他进程按 updated_at 自动失效），
+    并在事务提交后更新模板解析索引的版本号，所有进程在下次查找时重建索引
+    """
+    template_cache.invalidate(instance.pk)
+    transaction.on_commit(template_index.invalidate)
+
+
+# 影响技术支持名单（角色、邮箱、启用状态）的用户字段；登录只更新 last_login，不触发重建
+ROSTER_USER_FIELDS = {"role", "email", "is_active", "is_deleted", "username", "feishu_id", "enterprise_wechat_id"}
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def support_roster_user_handler(sender, instance, update_fields=None, **kwargs):
+    """
+    用户变化后使技术支持名单和邮件汇总订阅缓存失效
+    """
+    if update_fields is not None and not ROSTER_USER_FIELDS.intersection(update_fields):
+        return
+    transaction.on_commit(support_roster.invalidate)
+    transaction.on_commit(digest_subscribers.invalidate)
+
+
+@receiver(post_save, sender=NotificationConfig)
+@receiver(post_delete, sender=NotificationConfig)
+def support_roster_config_handler(sender, instance, **kwargs):
+    """
+    用户通知配置变化后使技术支持名单和邮件汇总订阅缓存失效
+    """
+    transaction.on_commit(support_roster.invalidate)
+    transaction.on_commit(digest_subscribers.invalidate)
+
+
+@receiver(post_delete, sender=Attachment)
+def attachment_blob_release_handler(sender, instance, **kwargs):
+    """
+    附件删除后释放其内容引用（包括随工单/回复级联删除的附件），最后一个引用删除时才删除存储对象
+    """
+    if instance.blob_id:
+        release_blob(instance.blob_id)
+
+
 def get_ticket_url(ticket_id):
     """
     生成工单详情页面的URL
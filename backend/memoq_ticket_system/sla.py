@@ -0,0 +1,273 @@
+"""
+Maintenance of the materialized SLA / idle state on Ticket.
+
+Ticket.save() computes is_ir_sla_missed, is_resolution_sla_missed, is_idle and
+idle_deadline whenever a ticket is written. What save() cannot see is time
+passing: a deadline that expires on an untouched ticket. sweep_sla_state()
+covers that by flipping the flags of tickets whose deadline fell inside the
+window since the previous sweep - three range UPDATEs on indexed deadline
+columns, independent of the size of the open-ticket set.
+
+SLAScheduler (run_sla_scheduler) fires the matching notification events -
+warnings ahead of each deadline, and the missed / idle events when it passes.
+"""
+import heapq
+import logging
+import time
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from .models import CompanyConfig, SLAEventDispatch, TaskCheckpoint, Ticket
+
+logger = logging.getLogger(__name__)
+
+
+def sweep_sla_state(since, now):
+    """
+    Flag tickets whose deadlines crossed in (since, now]; `since=None` catches up
+    on everything up to `now`. Returns {flag: rows updated}.
+    """
+    def crossed(field):
+        window = {f"{field}__lte": now}
+        if since is not None:
+            window[f"{field}__gt"] = since
+        return window
+
+    # Bulk updates bypass auto_now: updated_at is set explicitly so run_sla_scheduler sees the rows
+    return {
+        "is_ir_sla_missed": Ticket.objects.filter(
+            first_replied_at__isnull=True, is_ir_sla_missed=False, **crossed("sla_ir_deadline")
+        ).update(is_ir_sla_missed=True, updated_at=timezone.now()),
+        "is_resolution_sla_missed": Ticket.objects.filter(
+            resolved_at__isnull=True, is_resolution_sla_missed=False, **crossed("sla_resolution_deadline")
+        ).update(is_resolution_sla_missed=True, updated_at=timezone.now()),
+        "is_idle": Ticket.objects.filter(
+            is_idle=False, **crossed("idle_deadline")
+        ).exclude(status__in=Ticket.INACTIVE_STATUSES).update(is_idle=True, updated_at=timezone.now()),
+    }
+
+
+def refresh_idle_deadlines(company_id=None):
+    """Recompute idle_deadline from last_activity_at and each company's idle timeout."""
+    configs = CompanyConfig.objects.all()
+    if company_id is not None:
+        configs = configs.filter(company_id=company_id)
+    updated = 0
+    for company_id, minutes in configs.values_list("company_id", "idle_timeout_minutes"):
+        updated += Ticket.objects.filter(company_id=company_id).update(
+            idle_deadline=F("last_activity_at") + timedelta(minutes=minutes), updated_at=timezone.now()
+        )
+    return updated
+
+
+def rebuild_sla_state(now, company_id=None):
+    """
+    Recompute the flags of every ticket (or one company's tickets) in bulk: first
+    deployment, or after SLA / idle settings changed. Same rules as
+    Ticket.refresh_sla_state().
+    """
+    refresh_idle_deadlines(company_id)
+    tickets = Ticket.objects.all() if company_id is None else Ticket.objects.filter(company_id=company_id)
+    return tickets.update(
+        is_ir_sla_missed=Case(
+            When(Q(first_replied_at__isnull=False, first_replied_at__gt=F("sla_ir_deadline"))
+                 | Q(first_replied_at__isnull=True, sla_ir_deadline__lt=now), then=Value(True)),
+            default=Value(False),
+        ),
+        is_resolution_sla_missed=Case(
+            When(Q(resolved_at__isnull=False, resolved_at__gt=F("sla_resolution_deadline"))
+                 | Q(resolved_at__isnull=True, sla_resolution_deadline__lt=now), then=Value(True)),
+            default=Value(False),
+        ),
+        is_idle=Case(
+            When(Q(idle_deadline__lt=now) & ~Q(status__in=Ticket.INACTIVE_STATUSES), then=Value(True)),
+            default=Value(False),
+        ),
+        updated_at=timezone.now(),
+    )
+
+
+# --- Deadline event scheduler (run_sla_scheduler) ---
+
+class SLAScheduler:
+    """
+    In-memory min-heap of upcoming SLA / idle events.
+
+    The heap only ever holds events due within `horizon`; it is filled from
+    indexed range queries on sla_ir_deadline / sla_resolution_deadline /
+    idle_deadline, topped up from tickets whose updated_at moved, and rebuilt from
+    the TaskCheckpoint high-water mark - the (due_at, ticket id) of the last
+    fired event - after a restart. Changes are polled `change_overlap` back from
+    the newest updated_at seen, so a transaction that commits late with an older
+    timestamp is still picked up. Entries are validated against the current
+    ticket row when they come due, so stale entries (ticket replied, resolved,
+    deadline moved) are simply dropped. SLAEventDispatch's unique key guarantees
+    each (ticket, event, deadline) notifies once.
+    """
+    CHECKPOINT_NAME = "run_sla_scheduler"
+    TICKET_FIELDS = (
+        "id", "status", "updated_at", "first_replied_at", "resolved_at",
+        "sla_ir_deadline", "sla_resolution_deadline", "idle_deadline",
+    )
+
+    def __init__(self, ir_warning=timedelta(hours=1), resolution_warning=timedelta(hours=24),
+                 horizon=timedelta(hours=1), poll_interval=15, catchup=timedelta(hours=24),
+                 change_overlap=timedelta(minutes=2), log=None):
+        self.ir_warning = ir_warning
+        self.resolution_warning = resolution_warning
+        self.horizon = horizon
+        self.poll_interval = poll_interval
+        self.catchup = catchup
+        self.change_overlap = change_overlap
+        self.log = log or logger.info
+        self.heap = []
+        self.scheduled = set()
+        self.loaded_until = None
+        self.changes_since = None
+        self.retry_at = None  # Set after a failed enqueue: firing pauses until then
+
+    def ticket_events(self, ticket):
+        """[(due_at, event_type, deadline)] for a ticket's current state."""
+        if ticket.status in Ticket.INACTIVE_STATUSES:
+            return []
+        events = []
+        if ticket.sla_ir_deadline and not ticket.first_replied_at:
+            events.append((ticket.sla_ir_deadline - self.ir_warning, "ticket_sla_ir_warning", ticket.sla_ir_deadline))
+            events.append((ticket.sla_ir_deadline, "ticket_sla_ir_missed", ticket.sla_ir_deadline))
+        if ticket.sla_resolution_deadline and not ticket.resolved_at:
+            events.append((ticket.sla_resolution_deadline - self.resolution_warning, "ticket_sla_resolution_warning", ticket.sla_resolution_deadline))
+            events.append((ticket.sla_resolution_deadline, "ticket_sla_resolution_missed", ticket.sla_resolution_deadline))
+        if ticket.idle_deadline:
+            events.append((ticket.idle_deadline, "ticket_idle_warning", ticket.idle_deadline))
+        return events
+
+    def push(self, ticket, start, end, resume_id=None, dispatched=()):
+        """
+        Schedule the ticket's events due in (start, end]; with `resume_id`, also those
+        due exactly at `start` for tickets from that id on (the checkpoint tie-break).
+        """
+        for due_at, event_type, deadline in self.ticket_events(ticket):
+            key = (ticket.pk, event_type, deadline)
+            in_window = start < due_at <= end or (resume_id is not None and due_at == start and ticket.pk >= resume_id)
+            if in_window and key not in self.scheduled and key not in dispatched:
+                self.scheduled.add(key)
+                heapq.heappush(self.heap, (due_at, ticket.pk, event_type, deadline))
+
+    def load_range(self, start, end, resume_id=None):
+        """Schedule every event due in (start, end] - one OR of three indexed range scans."""
+        lookup = "gt" if resume_id is None else "gte"
+        window = (
+            Q(**{f"sla_ir_deadline__{lookup}": start}, sla_ir_deadline__lte=end + self.ir_warning)
+            | Q(**{f"sla_resolution_deadline__{lookup}": start}, sla_resolution_deadline__lte=end + self.resolution_warning)
+            | Q(**{f"idle_deadline__{lookup}": start}, idle_deadline__lte=end)
+        )
+        tickets = Ticket.objects.filter(window).exclude(status__in=Ticket.INACTIVE_STATUSES).only(*self.TICKET_FIELDS)
+        before = len(self.heap)
+        for ticket in tickets.iterator(chunk_size=2000):
+            self.push(ticket, start, end, resume_id)
+        self.loaded_until = end
+        return len(self.heap) - before
+
+    def poll_changes(self, now):
+        """Re-schedule tickets written since the last poll (new deadlines, reopened tickets...)."""
+        changed = list(
+            Ticket.objects.filter(updated_at__gt=self.changes_since - self.change_overlap).only(*self.TICKET_FIELDS)
+        )
+        # Events that came due while the ticket was being changed still fire (late), older ones don't.
+        start = now - timedelta(seconds=self.poll_interval * 2)
+        # The overlap re-reads tickets already handled: skip their events that have fired since
+        dispatched = set(SLAEventDispatch.objects.filter(
+            ticket_id__in=[ticket.pk for ticket in changed], due_at__gt=start
+        ).values_list("ticket_id", "event_type", "deadline"))
+        for ticket in changed:
+            self.push(ticket, start, self.loaded_until, dispatched=dispatched)
+            self.changes_since = max(self.changes_since, ticket.updated_at)
+        return len(changed)
+
+    def bootstrap(self, now):
+        """(Re)build the heap after a start or restart, resuming from the checkpoint."""
+        checkpoint, _ = TaskCheckpoint.objects.get_or_create(name=self.CHECKPOINT_NAME)
+        # First ever run starts now (no burst of historical events); later runs resume
+        # from the last fired event, bounded by the catch-up window.
+        start = now if checkpoint.last_run_at is None else max(checkpoint.last_run_at, now - self.catchup)
+        if checkpoint.last_run_at is None:
+            checkpoint.last_run_at = now
+            checkpoint.save(update_fields=["last_run_at", "updated_at"])
+        # Events due at the checkpoint itself may have fired only up to its ticket id
+        resume_id = (checkpoint.last_id or 0) if start == checkpoint.last_run_at else None
+        self.changes_since = now
+        loaded = self.load_range(start, now + self.horizon, resume_id)
+        self.log(f"SLA scheduler loaded {loaded} events due in ({start:%Y-%m-%d %H:%M}, {self.loaded_until:%Y-%m-%d %H:%M}]")
+
+    def fire_due(self, now):
+        fired = 0
+        last_due = last_ticket_id = None
+        if self.retry_at and now < self.retry_at:
+            return 0
+        while self.heap and self.heap[0][0] <= now:
+            due_at, ticket_id, event_type, deadline = heapq.heappop(self.heap)
+            result = self.fire(ticket_id, event_type, deadline, due_at)
+            if result is None:
+                # Not enqueued: keep it (and the checkpoint) where it is and retry after a poll interval
+                heapq.heappush(self.heap, (due_at, ticket_id, event_type, deadline))
+                self.retry_at = now + timedelta(seconds=self.poll_interval)
+                break
+            self.scheduled.discard((ticket_id, event_type, deadline))
+            fired += result
+            last_due, last_ticket_id = due_at, ticket_id
+        if last_due is not None:
+            TaskCheckpoint.objects.filter(name=self.CHECKPOINT_NAME).update(last_run_at=last_due, last_id=last_ticket_id)
+        return fired
+
+    def fire(self, ticket_id, event_type, deadline, due_at):
+        """
+        Record the event and enqueue its notification in one transaction, so it is
+        either both (fired exactly once) or neither. Returns 1 when fired, 0 when
+        stale or already fired, None when enqueueing failed and it should be retried.
+        """
+        from .notifications import NotificationManager, build_notification_context
+        try:
+            ticket = Ticket.objects.select_related("company", "assigned_to", "created_by").filter(pk=ticket_id).first()
+            if ticket is None or (due_at, event_type, deadline) not in self.ticket_events(ticket):
+                return 0  # Stale: replied / resolved / closed / deadline moved since it was scheduled
+            context = build_notification_context(
+                ticket=ticket, company=ticket.company, event_type=event_type, deadline=deadline,
+                ticket_creator_user=ticket.created_by, assigned_user=ticket.assigned_to,
+            )
+            with transaction.atomic():
+                try:
+                    with transaction.atomic():
+                        SLAEventDispatch.objects.create(
+                            ticket_id=ticket_id, event_type=event_type, deadline=deadline, due_at=due_at,
+                            dispatched_at=timezone.now(),
+                        )
+                except IntegrityError:
+                    return 0  # Already fired by a previous run or another scheduler
+                NotificationManager.send_notification_by_event(event_type, context, target_company=ticket.company)
+        except Exception as e:
+            logger.error(f"SLA event {event_type} for ticket #{ticket_id} failed, will retry: {e}")
+            return None
+        self.retry_at = None
+        return 1
+
+    def run(self, once=False):
+        now = timezone.now()
+        self.bootstrap(now)
+        next_poll = now + timedelta(seconds=self.poll_interval)
+        while True:
+            now = timezone.now()
+            if now >= next_poll:
+                self.poll_changes(now)
+                next_poll = now + timedelta(seconds=self.poll_interval)
+            if self.loaded_until - now < self.horizon / 2:
+                self.load_range(self.loaded_until, now + self.horizon)
+            fired = self.fire_due(now)
+            if fired:
+                self.log(f"SLA scheduler fired {fired} events")
+            if once:
+                return
+            wake_at = min([next_poll] + ([self.heap[0][0]] if self.heap else []))
+            time.sleep(min(max((wake_at - timezone.now()).total_seconds(), 0.05), self.poll_interval))
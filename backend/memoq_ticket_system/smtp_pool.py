@@ -0,0 +1,151 @@
+"""
+Process-wide pool of authenticated, keep-alive SMTP sessions.
+
+Opening an SMTP session costs a TCP connect, EHLO, STARTTLS and AUTH; the
+notification worker sends many messages to the same relay, so sessions are
+kept open and reused per (host, port, user). Idle sessions are closed after
+`max_idle` seconds, a session the server dropped is reconnected once and the
+message re-sent, and send_messages() delivers a batch over a single session.
+"""
+import logging
+import smtplib
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SMTPConfig = namedtuple("SMTPConfig", "host port user password use_tls")
+
+# The session is unusable (dropped by the server, idle timeout, network reset).
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+# The server refused one message; the session stays usable for the rest of the batch.
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+def smtp_config(email_config=None):
+    """SMTPConfig from a Company.email_config dict, falling back to the EMAIL_* settings."""
+    email_config = email_config or {}
+    return SMTPConfig(
+        host=email_config.get('smtp_server') or settings.EMAIL_HOST,
+        port=int(email_config.get('smtp_port') or settings.EMAIL_PORT),
+        user=email_config.get('smtp_user') or getattr(settings, 'EMAIL_HOST_USER', None),
+        password=email_config.get('smtp_password') or getattr(settings, 'EMAIL_HOST_PASSWORD', None),
+        use_tls=email_config.get('use_tls', getattr(settings, 'EMAIL_USE_TLS', True)),
+    )
+
+
+class SMTPConnectionPool:
+    def __init__(self, max_idle=60, max_idle_per_key=4, timeout=10):
+        self.max_idle = max_idle
+        self.max_idle_per_key = max_idle_per_key
+        self.timeout = timeout
+        self.idle = {}  # (host, port, user) -> [(session, last_used), ...]
+        self.lock = threading.Lock()
+        self.opened = 0  # Sessions opened since start (connect + STARTTLS + AUTH each)
+
+    @staticmethod
+    def key(config):
+        return (config.host, config.port, config.user)
+
+    def connect(self, config):
+        session = smtplib.SMTP(config.host, config.port, timeout=self.timeout)
+        try:
+            if config.use_tls:
+                session.starttls()
+            if config.user and config.password:
+                session.login(config.user, config.password)
+        except Exception:
+            self.discard(session)
+            raise
+        with self.lock:
+            self.opened += 1
+        logger.debug(f"SMTP session opened to {config.host}:{config.port}")
+        return session
+
+    def acquire(self, config):
+        """An idle session for `config`, or a new one."""
+        with self.lock:
+            expired = self.evict_idle(time.monotonic())
+            sessions = self.idle.get(self.key(config))
+            session = sessions.pop()[0] if sessions else None
+        for stale in expired:
+            self.discard(stale)
+        return session or self.connect(config)
+
+    def release(self, config, session):
+        """Return a healthy session to the pool, unless the pool for its key is full."""
+        with self.lock:
+            sessions = self.idle.setdefault(self.key(config), [])
+            if len(sessions) < self.max_idle_per_key:
+                sessions.append((session, time.monotonic()))
+                return
+        self.discard(session)
+
+    def evict_idle(self, now):
+        """Drop sessions idle longer than max_idle from the pool (caller holds the lock) and return them."""
+        expired = []
+        for key, sessions in self.idle.items():
+            expired += [s for s, used in sessions if now - used >= self.max_idle]
+            self.idle[key] = [(s, used) for s, used in sessions if now - used < self.max_idle]
+        return expired
+
+    @staticmethod
+    def discard(session):
+        try:
+            session.quit()
+        except Exception:
+            session.close()
+
+    def close_all(self):
+        with self.lock:
+            sessions = [s for pooled in self.idle.values() for s, _ in pooled]
+            self.idle = {}
+        for session in sessions:
+            self.discard(session)
+
+    def send_messages(self, config, messages, progress=None):
+        """
+        Send `messages` (email.message.Message) over one pooled session. Returns a
+        list of (sent, error) per message: a message the server rejects does not
+        stop the batch, and a session that went stale is reconnected once.
+        `progress`, when given, is asked progress.start(index) before each message
+        (False stops the batch there) and told progress.done(index, sent, error)
+        as soon as each one is sent or refused.
+        """
+        results = []
+        session = None
+        try:
+            for index, msg in enumerate(messages):
+                if progress is not None and not progress.start(index):
+                    break
+                try:
+                    if session is None:
+                        session = self.acquire(config)
+                    try:
+                        session.send_message(msg)
+                    except RECONNECT_ERRORS:
+                        self.discard(session)
+                        session = None
+                        session = self.connect(config)
+                        session.send_message(msg)
+                except MESSAGE_ERRORS as e:
+                    results.append((False, e))  # Rejected message; the session is still usable
+                except Exception as e:
+                    if session is not None:
+                        self.discard(session)
+                        session = None
+                    results.append((False, e))
+                else:
+                    results.append((True, None))
+                if progress is not None:
+                    progress.done(index, *results[-1])
+        finally:
+            if session is not None:
+                self.release(config, session)
+        return results
+
+
+smtp_pool = SMTPConnectionPool()
@@ -0,0 +1,314 @@
+"""
+Resumable attachment uploads (the attachment-uploads API).
+
+A client opens an AttachmentUploadSession with the file's name and size, PUTs
+the file in chunk_size chunks at their byte offsets, then finalizes it. Chunks
+are staged in ATTACHMENT_UPLOAD_STAGING_DIR, or, with the COS backend, uploaded
+straight to COS as the parts of a multipart upload (one part per chunk). After
+a dropped connection the client reads the session's `received` offset and
+resumes from there, so a retry re-sends only the chunk that was in flight.
+The Attachment row is created on finalize; sessions left idle for
+ATTACHMENT_UPLOAD_SESSION_TTL_HOURS are removed by purge_upload_sessions(),
+which deletes the staging file or aborts the COS multipart upload.
+
+Attachment content is deduplicated: the upload handlers below hash each file
+while the request body streams in, and attachments with the same SHA-256
+share one AttachmentBlob (one stored object, keyed by the hash) that counts
+its references. acquire_blob() stores content only when it is new;
+release_blob(), run when an attachment is deleted, removes the object with
+the last reference. Both run under a row lock on the blob (a blob whose
+count dropped to 0 stays until its object is deleted), so a release never
+deletes an object that a concurrent upload of the same content relies on. A COS multipart upload is never hashed, so it gets a
+blob of its own (see upload_blob_key): every attachment then finds its
+storage, and has its object deleted, through its blob alone.
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .file_storage import blob_key, content_hash, get_storage_backend
+from .models import Attachment, AttachmentBlob, AttachmentUploadSession
+
+logger = logging.getLogger(__name__)
+
+
+class UploadError(Exception):
+    pass
+
+
+class HashingUploadHandlerMixin:
+    """Hashes the chunks this handler stores as they arrive and sets file.sha256 on the finished file."""
+
+    def new_file(self, *args, **kwargs):
+        self.hasher = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        data = super().receive_data_chunk(raw_data, start)
+        if data is None:  # Stored by this handler rather than passed on to the next one
+            self.hasher.update(raw_data)
+        return data
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.hasher.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadHandlerMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadHandlerMixin, TemporaryFileUploadHandler):
+    pass
+
+
+class StagedFile(File):
+    """A finished staging file; the local storage moves it into place instead of copying it."""
+
+    def __init__(self, file, name, path):
+        super().__init__(file, name)
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def locked_blob(digest, storage_type, path, size=0):
+    """The blob row of `digest`, locked until the end of the transaction; created (unreferenced) if missing."""
+    return AttachmentBlob.objects.select_for_update().get_or_create(
+        sha256=digest, defaults={'size': size, 'storage_type': storage_type, 'path': path, 'ref_count': 0}
+    )[0]
+
+
+def acquire_blob(file):
+    """
+    Take a reference on the blob holding `file`'s content, storing the content only if
+    no referenced blob holds it. Use blob_reference() to create an attachment with it.
+    """
+    digest = content_hash(file)
+    storage_type = getattr(settings, 'DEFAULT_FILE_STORAGE_BACKEND', 'local')
+    with transaction.atomic():
+        blob = locked_blob(digest, storage_type, blob_key(digest, file.name), file.size)
+        blob.stored = not blob.ref_count  # New, or its object is about to be deleted
+        if blob.stored:
+            stored = get_storage_backend(blob.storage_type).save_attachment(file)
+            blob.size, blob.path = stored['file_size'], stored['file_path']
+        blob.ref_count += 1
+        blob.save(update_fields=['size', 'path', 'ref_count'])
+    return blob
+
+
+@contextmanager
+def blob_reference(file):
+    """
+    acquire_blob() for the attachment created in the with block, all in one
+    transaction; if the block fails, the object stored for it is removed again.
+    """
+    blob = None
+    try:
+        with transaction.atomic():
+            blob = acquire_blob(file)
+            yield blob
+    except BaseException:
+        if blob is not None and blob.stored:
+            delete_blob_object(blob)
+        raise
+
+
+def release_blob(blob_id):
+    """Drop one reference; after the last one commits, the stored object and the blob are deleted."""
+    with transaction.atomic():
+        blob = AttachmentBlob.objects.select_for_update().filter(pk=blob_id).first()
+        if blob is None:
+            return
+        AttachmentBlob.objects.filter(pk=blob_id).update(ref_count=F('ref_count') - 1)
+        if blob.ref_count <= 1:
+            transaction.on_commit(lambda: delete_blob_object(blob))
+
+
+def delete_blob_object(blob):
+    """Delete the stored object of `blob` unless it has been referenced again (re-checked under the row lock)."""
+    with transaction.atomic():
+        current = locked_blob(blob.sha256, blob.storage_type, blob.path)
+        if current.ref_count:
+            return
+        if get_storage_backend(current.storage_type).delete_file(current.path) or current.storage_type == 'local':
+            current.delete()
+
+
+def storage_type_of(attachment):
+    """Where an attachment's file lives: its blob's storage; attachments stored before blobs are local."""
+    return attachment.blob.storage_type if attachment.blob_id else 'local'
+
+
+def upload_blob_key(session):
+    """
+    AttachmentBlob.sha256 of a COS multipart upload: its parts go to COS without
+    being hashed, so the blob is keyed by the session and never shared.
+    """
+    return f"upload:{session.id.hex}"
+
+
+def staging_dir():
+    path = str(getattr(settings, 'ATTACHMENT_UPLOAD_STAGING_DIR', os.path.join(settings.BASE_DIR, 'upload_staging')))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def validate_upload(file_name, file_size):
+    """Returns an error message for a file that may not be uploaded, else None."""
+    max_size = getattr(settings, 'ATTACHMENT_UPLOAD_MAX_SIZE', 1024 * 1024 * 1024)
+    if file_size <= 0:
+        return "文件不能为空"
+    if file_size > max_size:
+        return f"文件大小超过限制 ({file_size} > {max_size} 字节)"
+    allowed_extensions = getattr(settings, 'ALLOWED_ATTACHMENT_EXTENSIONS', None)
+    file_ext = os.path.splitext(file_name)[1].lower()
+    if allowed_extensions and file_ext not in allowed_extensions:
+        return f"不支持的文件类型: {file_ext}"
+    return None
+
+
+def start_session(file_name, file_size, uploaded_by, ticket=None, reply=None, file_type=None):
+    """Open an upload session and its staging area (an empty file, or a COS multipart upload)."""
+    session = AttachmentUploadSession(
+        file_name=file_name,
+        file_size=file_size,
+        file_type=file_type or mimetypes.guess_type(file_name)[0] or 'application/octet-stream',
+        chunk_size=getattr(settings, 'ATTACHMENT_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024),
+        ticket=ticket,
+        reply=reply,
+        uploaded_by=uploaded_by,
+    )
+    if getattr(settings, 'DEFAULT_FILE_STORAGE_BACKEND', 'local') == 'cos':
+        session.storage_type = 'cos'
+        file_ext = os.path.splitext(file_name)[1].lower()
+        session.staging_path = f"attachments/{timezone.now():%Y/%m/%d}/{session.id.hex}{file_ext}"
+        storage = get_storage_backend('cos')
+        session.upload_id = storage.client.create_multipart_upload(
+            Bucket=storage.bucket, Key=session.staging_path, StorageClass='STANDARD', ContentType=session.file_type,
+        )['UploadId']
+    else:
+        session.storage_type = 'local'
+        session.staging_path = os.path.join(staging_dir(), f"{session.id.hex}.part")
+        open(session.staging_path, 'wb').close()
+    session.save()
+    return session
+
+
+def write_chunk(session, offset, data):
+    """
+    Stage `data` at byte `offset`. Chunks start on a chunk_size boundary and are
+    chunk_size long, except the file's last one; the offset may be at most the
+    bytes received so far, so a chunk whose response was lost can be re-sent,
+    and anything staged after a re-sent chunk is dropped. The session row stays
+    locked while the chunk is staged, so concurrent writes to one session queue up.
+    """
+    with transaction.atomic():
+        session = AttachmentUploadSession.objects.select_for_update().get(pk=session.pk)
+        if session.status != 'uploading':
+            raise UploadError("上传会话已完成")
+        end = offset + len(data)
+        if offset < 0 or offset % session.chunk_size:
+            raise UploadError(f"偏移量必须是分块大小 ({session.chunk_size} 字节) 的整数倍")
+        if offset > session.received:
+            raise UploadError(f"偏移量超过已接收的字节数 ({session.received})")
+        if not data or end > session.file_size or (len(data) != session.chunk_size and end != session.file_size):
+            raise UploadError(f"分块大小必须为 {session.chunk_size} 字节（最后一块除外）")
+
+        index = offset // session.chunk_size
+        if session.storage_type == 'cos':
+            part = get_storage_backend('cos').upload_part(session.staging_path, session.upload_id, index + 1, data)
+            session.parts = session.parts[:index] + [part]
+        else:
+            with open(session.staging_path, 'r+b') as staged:
+                staged.seek(offset)
+                staged.write(data)
+                staged.truncate()
+        session.received = end
+        session.save(update_fields=['received', 'parts', 'updated_at'])
+    return session
+
+
+def finalize_session(session):
+    """Turn a fully received session into an Attachment; returns the attachment."""
+    with transaction.atomic():
+        session = AttachmentUploadSession.objects.select_for_update().get(pk=session.pk)
+        if session.status != 'uploading':
+            raise UploadError("上传会话已完成")
+        if session.received != session.file_size:
+            raise UploadError(f"文件尚未上传完整 ({session.received}/{session.file_size} 字节)")
+        attachment = Attachment(
+            file_name=session.file_name,
+            file_size=session.file_size,
+            file_type=session.file_type,
+            ticket=session.ticket,
+            reply=session.reply,
+            uploaded_by=session.uploaded_by,
+        )
+        if session.storage_type == 'cos':
+            # The parts are already in COS under the session's own key, so this object is not deduplicated
+            storage = get_storage_backend('cos')
+            storage.client.complete_multipart_upload(
+                Bucket=storage.bucket, Key=session.staging_path, UploadId=session.upload_id,
+                MultipartUpload={'Part': session.parts},
+            )
+            attachment.blob = AttachmentBlob.objects.create(
+                sha256=upload_blob_key(session), size=session.file_size, storage_type='cos', path=session.staging_path
+            )
+            attachment.file.name = session.staging_path
+            attachment.save()
+        else:
+            with StagedFile(open(session.staging_path, 'rb'), session.file_name, session.staging_path) as staged, \
+                    blob_reference(staged) as blob:
+                attachment.blob = blob
+                attachment.file.name = blob.path
+                attachment.save()
+            if os.path.exists(session.staging_path):  # Duplicate content: nothing was moved
+                os.remove(session.staging_path)
+        session.status = 'completed'
+        session.attachment = attachment
+        session.save(update_fields=['status', 'attachment', 'updated_at'])
+    return attachment
+
+
+def discard_session(session):
+    """Delete a session together with whatever it has staged."""
+    if session.status == 'uploading':
+        try:
+            if session.storage_type == 'cos':
+                storage = get_storage_backend('cos')
+                storage.client.abort_multipart_upload(
+                    Bucket=storage.bucket, Key=session.staging_path, UploadId=session.upload_id
+                )
+            elif os.path.exists(session.staging_path):
+                os.remove(session.staging_path)
+        except Exception as e:
+            logger.error(f"Discarding upload session {session.pk} ({session.staging_path}) failed: {e}")
+            return False
+    session.delete()
+    return True
+
+
+def purge_upload_sessions(ttl_hours=None, now=None):
+    """
+    Remove sessions idle for more than ttl_hours (ATTACHMENT_UPLOAD_SESSION_TTL_HOURS):
+    abandoned uploads lose their staged chunks, finished ones only their row.
+    Returns the number of sessions removed.
+    """
+    ttl_hours = ttl_hours or getattr(settings, 'ATTACHMENT_UPLOAD_SESSION_TTL_HOURS', 24)
+    cutoff = (now or timezone.now()) - timedelta(hours=ttl_hours)
+    stale = AttachmentUploadSession.objects.filter(updated_at__lt=cutoff)
+    return sum(discard_session(session) for session in stale.iterator())
@@ -0,0 +1,65 @@
+"""
+Per-webhook rate limiting for group-bot channels (Feishu, WeCom).
+
+Group bots reject a webhook that posts faster than its limit (about 20
+messages a minute), so each webhook URL gets a token bucket: `burst` tokens,
+refilled at WEBHOOK_RATE_LIMIT_PER_MINUTE. Buckets are WebhookRateLimit rows,
+shared by every worker process using the database, and a token is taken with
+one conditional UPDATE, so concurrent workers never over-spend a bucket.
+A send that finds the bucket empty is not made; the caller queues it
+(NotificationLog status "throttled") and the worker later delivers everything
+queued for that webhook as a single digest card.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.db.models import F, Value
+from django.db.models.functions import Least
+
+from .models import WebhookRateLimit
+
+
+def webhook_key(webhook_url):
+    return hashlib.sha256(webhook_url.encode()).hexdigest()
+
+
+class WebhookRateLimiter:
+    def __init__(self, rate_per_minute=20, burst=5):
+        self.rate = rate_per_minute / 60.0  # Tokens per second
+        self.burst = float(burst)
+
+    def available(self, now):
+        """Tokens in the bucket at `now`, as a database expression."""
+        return Least(Value(self.burst), F('tokens') + (Value(now) - F('updated')) * Value(self.rate))
+
+    def acquire(self, webhook_url):
+        """
+        Take a token for `webhook_url`. Returns 0 when the send may go ahead,
+        otherwise the number of seconds until the bucket has a token again.
+        """
+        key = webhook_key(webhook_url)
+        for _ in range(2):
+            now = time.time()
+            available = self.available(now)
+            taken = WebhookRateLimit.objects.filter(key=key).annotate(available=available).filter(
+                available__gte=1
+            ).update(tokens=available - 1, updated=now)
+            if taken:
+                return 0
+            bucket, created = WebhookRateLimit.objects.get_or_create(
+                key=key, defaults={'tokens': self.burst - 1, 'updated': now}
+            )
+            if created:
+                return 0
+            tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            if tokens < 1:
+                return (1 - tokens) / self.rate
+            # Refilled between the UPDATE and the read: try once more
+        return 1 / self.rate
+
+
+webhook_limiter = WebhookRateLimiter(
+    rate_per_minute=getattr(settings, 'WEBHOOK_RATE_LIMIT_PER_MINUTE', 20),
+    burst=getattr(settings, 'WEBHOOK_RATE_LIMIT_BURST', 5),
+)